@@ -0,0 +1,150 @@
+"""
+Benchmarks for bioanalyze_omics.nf on synthetic workflow trees.
+
+    python benchmarks/bench_nf.py --sizes 10 100 1000 --output bench_nf.json
+
+Every benchmark is run against a fresh NextflowWorkflow without a persistent
+cache, so timings include parsing. Peak memory is measured with tracemalloc in
+a separate run so it does not skew the timings.
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from os import path
+
+sys.path.insert(0, path.dirname(path.dirname(path.abspath(__file__))))
+sys.path.insert(0, path.dirname(path.abspath(__file__)))
+
+import bioanalyze_omics  # noqa: E402
+from bioanalyze_omics.nf import NextflowWorkflow, parse_processes  # noqa: E402
+from synthetic import generate_workflow  # noqa: E402
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+
+def _parse_processes(project_path, nf_files, contents, workers):
+    for nf_file, _contents in zip(nf_files, contents):
+        parse_processes(_contents, nf_file=nf_file)
+
+
+def _workflow_processes(project_path, nf_files, contents, workers):
+    NextflowWorkflow(project_path, workers=workers).processes
+
+
+def _get_container_manifest(project_path, nf_files, contents, workers):
+    NextflowWorkflow(project_path, workers=workers).get_container_manifest()
+
+
+def _get_omics_config(project_path, nf_files, contents, workers):
+    NextflowWorkflow(project_path, workers=workers).get_omics_config()
+
+
+BENCHMARKS = {
+    "parse_processes": _parse_processes,
+    "NextflowWorkflow.processes": _workflow_processes,
+    "get_container_manifest": _get_container_manifest,
+    "get_omics_config": _get_omics_config,
+}
+
+
+def _time(benchmark, args, repeat: int) -> list:
+    timings = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        benchmark(*args)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def _peak_memory(benchmark, args) -> int:
+    gc.collect()
+    tracemalloc.start()
+    try:
+        benchmark(*args)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(sizes: list, repeat: int = 3, workers: int = 1, seed: int = 0) -> dict:
+    """
+    runs all benchmarks for each tree size and returns the results
+
+    :param: sizes: number of modules of each synthetic tree
+    :param: repeat: number of timed runs of each benchmark
+    :param: workers: passed to NextflowWorkflow
+    :param: seed: seed of the synthetic tree generator
+    """
+    results = []
+    for size in sizes:
+        with tempfile.TemporaryDirectory(prefix="bench_nf_") as project_path:
+            nf_files = generate_workflow(project_path, size, seed=seed)
+            contents = []
+            for nf_file in nf_files:
+                with open(nf_file, "r") as file:
+                    contents.append(file.read())
+            args = (project_path, nf_files, contents, workers)
+
+            for name, benchmark in BENCHMARKS.items():
+                timings = _time(benchmark, args, repeat)
+                result = {
+                    "benchmark": name,
+                    "modules": size,
+                    "bytes": sum(len(_contents) for _contents in contents),
+                    "repeat": repeat,
+                    "min_s": min(timings),
+                    "mean_s": sum(timings) / len(timings),
+                    "peak_memory_bytes": _peak_memory(benchmark, args),
+                }
+                results.append(result)
+                print(
+                    f"{name:<28} {size:>6} modules "
+                    f"{result['min_s'] * 1000:>10.1f} ms "
+                    f"{result['peak_memory_bytes'] / 1024 / 1024:>8.1f} MiB",
+                    file=sys.stderr,
+                )
+
+    return {
+        "version": bioanalyze_omics.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "workers": workers,
+        "seed": seed,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "results": results,
+    }
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument(
+        "--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="modules per tree"
+    )
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs")
+    parser.add_argument("--workers", type=int, default=1, help="parser processes")
+    parser.add_argument("--seed", type=int, default=0, help="generator seed")
+    parser.add_argument(
+        "--output", default="bench_nf.json", help="JSON results file, - for stdout"
+    )
+    args = parser.parse_args(argv)
+
+    report = run(args.sizes, repeat=args.repeat, workers=args.workers, seed=args.seed)
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+    else:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""Generate synthetic nf-core style workflow trees for benchmarks."""
+
+import os
+import random
+from os import path
+
+# nf-core module with a ternary container directive
+NF_CORE_MODULE = """\
+process {name} {{
+    tag "$meta.id"
+    label '{label}'
+
+    conda "bioconda::{tool}={version}"
+    container "${{ workflow.containerEngine == 'singularity' && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/{tool}:{version}--0' :
+        'biocontainers/{tool}:{version}--0' }}"
+
+    input:
+    tuple val(meta), path(reads)
+
+    output:
+    tuple val(meta), path("*.html"), emit: html
+    tuple val(meta), path("*.zip") , emit: zip
+    path  "versions.yml"           , emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    // arguments are configured in conf/modules.config
+    def args = task.ext.args ?: ''
+    def prefix = task.ext.prefix ?: "${{meta.id}}"
+    \"\"\"
+    {tool} \\\\
+        $args \\\\
+        --threads $task.cpus \\\\
+        --outdir ${{prefix}} \\\\
+        $reads
+
+    cat <<-END_VERSIONS > versions.yml
+    "${{task.process}}":
+        {tool}: \\$( {tool} --version | sed -e "s/{tool} v//g" )
+    END_VERSIONS
+    \"\"\"
+
+    stub:
+    def prefix = task.ext.prefix ?: "${{meta.id}}"
+    \"\"\"
+    touch ${{prefix}}.html
+    touch ${{prefix}}.zip
+    touch versions.yml
+    \"\"\"
+}}
+"""
+
+# module with a plain container directive and explicit resources
+SIMPLE_MODULE = """\
+process {name} {{
+    cpus {cpus}
+    memory '{memory} GB'
+    time '{time}h'
+    publishDir "${{params.outdir}}/{tool}", mode: 'copy'
+    container 'quay.io/biocontainers/{tool}:{version}'
+
+    input:
+    path x
+
+    output:
+    path 'out.txt'
+
+    script:
+    \"\"\"
+    {tool} $x > out.txt
+    \"\"\"
+}}
+"""
+
+LABELS = ["process_single", "process_low", "process_medium", "process_high"]
+
+
+def generate_workflow(
+    root: str,
+    modules: int,
+    multi_process: float = 0.2,
+    tools: int = None,
+    seed: int = 0,
+) -> list:
+    """
+    writes a synthetic workflow with `modules` module files under root
+
+    :param: root: directory to write the workflow to
+    :param: modules: number of modules/<name>/main.nf files
+    :param: multi_process: fraction of module files that define a second process
+    :param: tools: number of distinct tools, containers repeat across modules
+        like they do across nf-core pipelines. defaults to modules // 4
+    :param: seed: seed of the random generator
+    :return: paths of the generated module files
+    """
+    rng = random.Random(seed)
+    tools = tools or max(1, modules // 4)
+
+    nf_files = []
+    includes = []
+    for ix in range(modules):
+        tool = f"tool{ix % tools}"
+        version = f"1.{ix % 7}.{ix % 3}"
+        name = f"MODULE_{ix}"
+        processes = [
+            NF_CORE_MODULE.format(
+                name=name, tool=tool, version=version, label=rng.choice(LABELS)
+            )
+        ]
+        includes.append(f"include {{ {name} }} from './modules/module_{ix}/main'")
+
+        if rng.random() < multi_process:
+            processes.append(
+                SIMPLE_MODULE.format(
+                    name=f"{name}_SUMMARY",
+                    tool=f"summary{ix % tools}",
+                    version=version,
+                    cpus=rng.choice([1, 2, 4, 8]),
+                    memory=rng.choice([2, 6, 12, 36]),
+                    time=rng.choice([1, 4, 8, 16]),
+                )
+            )
+
+        module_dir = path.join(root, "modules", f"module_{ix}")
+        os.makedirs(module_dir, exist_ok=True)
+        nf_file = path.join(module_dir, "main.nf")
+        with open(nf_file, "w") as file:
+            file.write("\n".join(processes))
+        nf_files.append(nf_file)
+
+    with open(path.join(root, "main.nf"), "w") as file:
+        file.write("\n".join(includes))
+        file.write("\n\nworkflow {\n}\n")
+
+    with open(path.join(root, "nextflow.config"), "w") as file:
+        file.write("docker.registry = 'quay.io'\n")
+
+    return nf_files
@@ -4,7 +4,7 @@ import click
 import typer
 
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional
 
 import typer
 from typing_extensions import Annotated
@@ -43,6 +43,46 @@ def run_cost(
     )
 
 
+@app.command()
+def process_resources(
+    nf_workflow: Annotated[
+        str,
+        typer.Option(help="Nextflow workflow directory", default=os.getcwd()),
+    ] = os.getcwd(),
+    offering: Annotated[
+        Optional[str],
+        typer.Option(help="AWS HealthOmics price list file", default=None),
+    ] = None,
+    pricing: Annotated[
+        Optional[bool],
+        typer.Option(help="Look up instance prices.", default=True),
+    ] = True,
+    aws_region: Annotated[
+        Optional[str],
+        typer.Option(help="AWS Region", default=AWS_REGION),
+    ] = AWS_REGION,
+    aws_profile: Annotated[
+        Optional[str], typer.Option(help="AWS Profile", default="default")
+    ] = "default",
+):
+    """
+    Estimate the resources of each process of a nextflow workflow before running it.
+
+    * Effective cpus, memory and time from process directives, conf/base.config labels and withName selectors
+
+    * Smallest HealthOmics instance that fits
+
+    * Price per hour and maximum cost per task
+    """
+    runs.estimate_process_resources(
+        nf_workflow=nf_workflow,
+        offering=offering,
+        pricing=pricing,
+        profile=aws_profile,
+        aws_region=aws_region,
+    )
+
+
 @app.command()
 def create_ecr_repos(
     output_manifest_file: Annotated[
@@ -64,8 +104,12 @@ def create_ecr_repos(
         typer.Option(help="AWS Region", default=AWS_REGION),
     ] = AWS_REGION,
     aws_profile: Annotated[
-        Optional[str], typer.Option(help="AWS Profile", default="default")
-    ] = "default",
+        Optional[str],
+        typer.Option(
+            help="AWS Profile, the default credential chain when not set",
+            default=None,
+        ),
+    ] = None,
     create_ecr: Annotated[
         Optional[bool],
         typer.Option(
@@ -73,6 +117,49 @@ def create_ecr_repos(
             default=True,
         ),
     ] = True,
+    workers: Annotated[
+        Optional[int],
+        typer.Option(help="Number of processes used to parse *.nf files", default=1),
+    ] = 1,
+    cache: Annotated[
+        Optional[bool],
+        typer.Option(
+            help="Reuse parsed *.nf files from the persistent parse cache.",
+            default=True,
+        ),
+    ] = True,
+    prune_unreachable: Annotated[
+        Optional[bool],
+        typer.Option(
+            help="Only inspect *.nf files included from main.nf.",
+            default=True,
+        ),
+    ] = True,
+    ignore: Annotated[
+        Optional[List[str]],
+        typer.Option(
+            help="Glob pattern of files or directories to skip when inspecting every *.nf file.",
+            default=None,
+        ),
+    ] = None,
+    mirror_workers: Annotated[
+        Optional[int],
+        typer.Option(help="Number of images pulled, and pushed, at once", default=4),
+    ] = 4,
+    skip_mirrored: Annotated[
+        Optional[bool],
+        typer.Option(
+            help="Skip images whose tag in ECR already holds the source image.",
+            default=True,
+        ),
+    ] = True,
+    engine: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Mirror images through the local docker daemon, or copy them between registries directly with registry.",
+            default="docker",
+        ),
+    ] = "docker",
 ):
     """
     Inspect a nextflow workflow and create a manifest file for container images.
@@ -87,7 +174,7 @@ def create_ecr_repos(
 
     What it does:
 
-    - look through all *.nf files
+    - look through all *.nf files included from main.nf
 
     - find `container` directives
 
@@ -105,10 +192,216 @@ def create_ecr_repos(
     """
     ecr.inspect_nf(
         aws_region=aws_region,
+        aws_profile=aws_profile,
         output_config_file=output_config_file,
         output_manifest_file=output_manifest_file,
         nf_workflow=nf_workflow,
         create_ecr=create_ecr,
+        workers=workers,
+        cache=cache,
+        prune_unreachable=prune_unreachable,
+        ignore=ignore,
+        mirror_workers=mirror_workers,
+        skip_mirrored=skip_mirrored,
+        engine=engine,
+    )
+    return
+
+
+@app.command()
+def inspect_catalog(
+    nf_workflow: Annotated[
+        List[str],
+        typer.Option(help="Nextflow workflow directory, repeat for each workflow"),
+    ],
+    output_manifest_file: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Output manifest file",
+            default="container_image_manifest.json",
+        ),
+    ] = "container_image_manifest.json",
+    output_dir: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Directory for the <workflow>.omics.config files", default=os.getcwd()
+        ),
+    ] = os.getcwd(),
+    aws_region: Annotated[
+        Optional[str],
+        typer.Option(help="AWS Region", default=AWS_REGION),
+    ] = AWS_REGION,
+    aws_profile: Annotated[
+        Optional[str],
+        typer.Option(
+            help="AWS Profile, the default credential chain when not set",
+            default=None,
+        ),
+    ] = None,
+    create_ecr: Annotated[
+        Optional[bool],
+        typer.Option(
+            help="Create ECR repos, attach omics policies, and push existing repos.",
+            default=True,
+        ),
+    ] = True,
+    workers: Annotated[
+        Optional[int],
+        typer.Option(help="Number of processes used to parse *.nf files", default=1),
+    ] = 1,
+    cache: Annotated[
+        Optional[bool],
+        typer.Option(
+            help="Reuse parsed *.nf files from the persistent parse cache.",
+            default=True,
+        ),
+    ] = True,
+    mirror_workers: Annotated[
+        Optional[int],
+        typer.Option(help="Number of images pulled, and pushed, at once", default=4),
+    ] = 4,
+    skip_mirrored: Annotated[
+        Optional[bool],
+        typer.Option(
+            help="Skip images whose tag in ECR already holds the source image.",
+            default=True,
+        ),
+    ] = True,
+    engine: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Mirror images through the local docker daemon, or copy them between registries directly with registry.",
+            default="docker",
+        ),
+    ] = "docker",
+):
+    """
+    Inspect many nextflow workflows at once, parsing the modules they share only once.
+
+    - dedupe *.nf files of all workflows by content
+
+    - build one container image manifest for all workflows
+
+    - create a <workflow>.omics.config file per workflow
+
+    - create ECR repos, attach omics policies and push the images
+    """
+    ecr.inspect_catalog(
+        nf_workflows=nf_workflow,
+        aws_region=aws_region,
+        aws_profile=aws_profile,
+        output_manifest_file=output_manifest_file,
+        output_dir=output_dir,
+        create_ecr=create_ecr,
+        workers=workers,
+        cache=cache,
+        mirror_workers=mirror_workers,
+        skip_mirrored=skip_mirrored,
+        engine=engine,
+    )
+    return
+
+
+@app.command()
+def diff_workflows(
+    old: Annotated[
+        str,
+        typer.Option(help="Checkout directory or git ref of the previous revision"),
+    ],
+    new: Annotated[
+        str,
+        typer.Option(help="Checkout directory or git ref of the new revision"),
+    ],
+    repository: Annotated[
+        str,
+        typer.Option(help="Git repository of the refs", default=os.getcwd()),
+    ] = os.getcwd(),
+    output_manifest_file: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Output incremental manifest file",
+            default="container_image_manifest.diff.json",
+        ),
+    ] = "container_image_manifest.diff.json",
+    output_config_file: Annotated[
+        Optional[str],
+        typer.Option(help="Output config delta file", default="omics.diff.config"),
+    ] = "omics.diff.config",
+    aws_region: Annotated[
+        Optional[str],
+        typer.Option(help="AWS Region", default=AWS_REGION),
+    ] = AWS_REGION,
+    aws_profile: Annotated[
+        Optional[str],
+        typer.Option(
+            help="AWS Profile, the default credential chain when not set",
+            default=None,
+        ),
+    ] = None,
+    create_ecr: Annotated[
+        Optional[bool],
+        typer.Option(
+            help="Create ECR repos and push the container images the new revision adds.",
+            default=True,
+        ),
+    ] = True,
+    workers: Annotated[
+        Optional[int],
+        typer.Option(help="Number of processes used to parse *.nf files", default=1),
+    ] = 1,
+    cache: Annotated[
+        Optional[bool],
+        typer.Option(
+            help="Reuse parsed *.nf files from the persistent parse cache.",
+            default=True,
+        ),
+    ] = True,
+    mirror_workers: Annotated[
+        Optional[int],
+        typer.Option(help="Number of images pulled, and pushed, at once", default=4),
+    ] = 4,
+    skip_mirrored: Annotated[
+        Optional[bool],
+        typer.Option(
+            help="Skip images whose tag in ECR already holds the source image.",
+            default=True,
+        ),
+    ] = True,
+    engine: Annotated[
+        Optional[str],
+        typer.Option(
+            help="Mirror images through the local docker daemon, or copy them between registries directly with registry.",
+            default="docker",
+        ),
+    ] = "docker",
+):
+    """
+    Diff two revisions of a nextflow workflow and only mirror what changed.
+
+    - parse the processes of both revisions, checkout directories or git refs
+
+    - list added, removed and changed processes
+
+    - create an incremental manifest of the container images the new revision adds
+
+    - create an omics.config delta for the added and changed processes
+
+    - create ECR repos and push the new container images
+    """
+    ecr.inspect_nf_diff(
+        old=old,
+        new=new,
+        aws_region=aws_region,
+        aws_profile=aws_profile,
+        repository=repository,
+        output_config_file=output_config_file,
+        output_manifest_file=output_manifest_file,
+        create_ecr=create_ecr,
+        workers=workers,
+        cache=cache,
+        mirror_workers=mirror_workers,
+        skip_mirrored=skip_mirrored,
+        engine=engine,
     )
     return
 
@@ -1,8 +1,38 @@
-from glob import glob
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache, partial
+import gzip
+import hashlib
+import io
+import json
+import os
 import re
 from os import path
 from textwrap import dedent
 import warnings
+import weakref
+
+from bioanalyze_omics.nf.cache import ParseCache
+from bioanalyze_omics.nf.config import NextflowConfig
+from bioanalyze_omics.nf.includes import resolve_includes
+from bioanalyze_omics.nf.lexer import (
+    DirectiveScanner,
+    find_process_blocks,
+    strip_comments,
+)
+from bioanalyze_omics.nf.sizing import evaluate_resource, resolve_resources
+from bioanalyze_omics.nf.uri import ImageURI, parse_image_uri, resolve_container
+from bioanalyze_omics.nf.walk import walk_nf_files
+
+# bump whenever parsing changes the records produced for the same contents,
+# so that persistently cached records are parsed again
+PARSER_VERSION: str = "3"
+
+# number of nf_files whose process blocks are kept to read process bodies
+PROCESS_BLOCKS_CACHE_SIZE: int = 32
+
+# bump whenever the layout of the snapshots written by NextflowWorkflow.save
+# changes, snapshots of other versions are rejected by NextflowWorkflow.load
+SNAPSHOT_VERSION: str = "1"
 
 __NF_DIRECTIVES: str = """
     accelerator,afterScript,
@@ -43,82 +73,479 @@ NF_DIRECTIVES: list = __nf_tokenize(__NF_DIRECTIVES)
 NF_PROCESS_SYNTAX: list = __nf_tokenize(__NF_PROCESS_SYNTAX)
 GROOVY_KEYWORDS: list = __nf_tokenize(__GROOVY_KEYWORDS)
 
+_DIRECTIVE_SCANNER = DirectiveScanner(NF_DIRECTIVES, NF_PROCESS_SYNTAX, GROOVY_KEYWORDS)
 
-def parse_processes(contents, nf_file=None):
+
+def parse_processes(contents, nf_file=None, lazy=False):
     # contents is the content of a single nf_file
     # an nf_file can have multiple process definitions
+    # when lazy only the container directive is parsed up front, the other
+    # directives are parsed the first time one of them is accessed
+    return list(iter_processes(contents, nf_file=nf_file, lazy=lazy))
 
-    # remove all comments since they interfere with token parsing
-    _contents = re.sub("/\\*.*\\*/", "", contents, flags=re.DOTALL)
-    _contents = [re.sub("(.*)//.*", "\\1", line) for line in _contents.split("\n")]
-    _contents = "\n".join(_contents)
-
-    _processes = []
-
-    # capture the name of processes and their definitions
-    pattern = "process([\\w\\s]+?)\\{(.+?)\\}(?=\\s+process|\\s*\\Z)"
-    matches = re.findall(pattern, _contents, flags=re.MULTILINE | re.DOTALL)
-
-    if matches:
-        _processes = [
-            {"nf_file": nf_file, "name": match[0].strip(), "body": match[1].strip()}
-            for match in matches
-        ]
-
-    # capture all directive and stanza definitions
-    tokens = NF_DIRECTIVES + NF_PROCESS_SYNTAX + GROOVY_KEYWORDS
-    for ix, _proc in enumerate(_processes):
-        for token in tokens:
-            _token = token
-            _group = "(\\s+.+?)"
-            _look_ahead = "\\s+?(?=" + "|".join(tokens) + ")"
 
-            if token in NF_PROCESS_SYNTAX:
-                _token += ":"
+def iter_processes(contents, nf_file=None, lazy=False):
+    """
+    streaming variant of parse_processes, yields the processes defined in
+    contents one at a time
+    """
+    yield from _build_processes(_parse_records(contents, lazy=lazy), nf_file=nf_file)
 
-            if token in ("script", "stub"):
-                _look_ahead = "(?=" + "|".join(NF_PROCESS_SYNTAX + ["\\Z"]) + ")"
 
-            pattern = _token + _group + _look_ahead
-            matches = re.findall(pattern, _proc["body"], flags=re.MULTILINE | re.DOTALL)
+def _parse_records(contents, lazy=False) -> list:
+    """
+    parses the contents of a single nf_file into plain process records
+    (dicts of name, body and directive values) that can be cached and
+    passed between processes
+    """
 
-            # some tokens can be defined multiple times
-            if matches:
-                _proc[token] = [match.strip() for match in matches]
+    # remove all comments since they interfere with token parsing
+    _contents = strip_comments(contents)
 
+    # capture the name of processes and their definitions
+    _records = [
+        {
+            "name": block.name,
+            "body": block.body.strip(),
+            "span": [block.start_line, block.end_line],
+        }
+        for block in find_process_blocks(_contents)
+    ]
+
+    if lazy:
+        for _record in _records:
+            container = _DIRECTIVE_SCANNER.scan_token(_record["body"], "container")
+            if container:
+                _record["container"] = container
+            _record["lazy"] = True
+        return _records
+
+    # capture all directive and stanza definitions in a single pass over each body
+    for _record in _records:
+        _record.update(_DIRECTIVE_SCANNER.scan(_record["body"]))
+
+    return _records
+
+
+def _build_processes(records: list, nf_file=None, keep_body=True) -> list:
+    _processes = []
+    for _record in records:
+        _proc = dict(_record, nf_file=nf_file)
         if not _proc.get("container"):
             warnings.warn(
                 f"process '{_proc['name']}' in file '{_proc['nf_file']}' has no container directive",
                 UserWarning,
             )
 
-        _processes[ix] = NextflowProcess(from_dict=_proc)
+        _processes.append(NextflowProcess(from_dict=_proc, keep_body=keep_body))
 
     return _processes
 
 
+def _file_signature(file_path: str) -> tuple:
+    # files are considered unchanged while their mtime and size are unchanged
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _file_digest(file_path: str) -> str:
+    with open(file_path, "rb") as file:
+        return hashlib.sha256(file.read()).hexdigest()
+
+
+def _parse_nf_file(nf_file: str, lazy: bool = False) -> list:
+    with open(nf_file, "r") as file:
+        return _parse_records(file.read(), lazy=lazy)
+
+
+def _parse_nf_files(nf_files: list, workers: int = 1, lazy: bool = False):
+    """
+    parses nf_files independently, yielding process records per file
+    in the same order as nf_files
+    """
+    parse_nf_file = partial(_parse_nf_file, lazy=lazy)
+    if workers and workers > 1 and len(nf_files) > 1:
+        chunksize = max(1, len(nf_files) // (workers * 4))
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            yield from executor.map(parse_nf_file, nf_files, chunksize=chunksize)
+    else:
+        yield from map(parse_nf_file, nf_files)
+
+
+def _cache_version(lazy: bool = False) -> str:
+    # records parsed lazily only hold containers
+    return PARSER_VERSION + ("-lazy" if lazy else "")
+
+
 class NextflowWorkflow:
-    def __init__(self, project_path: str) -> None:
+    def __init__(
+        self,
+        project_path: str,
+        workers: int = 1,
+        cache: ParseCache = None,
+        main: str = "main.nf",
+        ignore: list = None,
+        memoize: bool = True,
+        keep_body: bool = False,
+        lazy: bool = False,
+        profiles: list = None,
+    ) -> None:
+        """
+        :param: project_path: path to the nextflow workflow directory
+        :param: workers: number of processes used to parse *.nf files,
+            1 parses serially and None uses one process per cpu
+        :param: cache: persistent ParseCache used to skip parsing files whose
+            contents were parsed before
+        :param: main: entry script of the workflow, only *.nf files reachable
+            from it through include statements are inspected. when None or
+            when the entry script does not exist every *.nf file is inspected
+        :param: ignore: glob patterns of files and directories to skip when
+            inspecting every *.nf file, in addition to walk.DEFAULT_PRUNE
+        :param: memoize: keep parsed processes in memory between calls, when
+            False every call streams the processes from the files again
+        :param: keep_body: keep the body of each process in memory, otherwise
+            it is re-read from its nf_file when accessed
+        :param: lazy: only parse the container directive of each process up
+            front, other directives are parsed when first accessed
+        :param: profiles: names of the nextflow.config profiles to apply
+        """
+        _main = path.join(project_path, main) if main else None
+        if _main and path.isfile(_main):
+            nf_files = resolve_includes(_main, project_path=project_path)
+        else:
+            nf_files = walk_nf_files(project_path, ignore=ignore)
+        self._initialize(
+            project_path,
+            _main,
+            nf_files,
+            path.join(project_path, "nextflow.config"),
+            workers=workers if workers is not None else os.cpu_count(),
+            cache=cache,
+            memoize=memoize,
+            keep_body=keep_body,
+            lazy=lazy,
+            profiles=profiles,
+        )
+
+    def _initialize(
+        self,
+        project_path: str,
+        main: str,
+        nf_files: list,
+        nf_config: str,
+        workers: int = 1,
+        cache: ParseCache = None,
+        memoize: bool = True,
+        keep_body: bool = False,
+        lazy: bool = False,
+        profiles: list = None,
+    ) -> None:
+        # state shared by workflows created by __init__ and by load
         self._project_path = project_path
-        self._nf_files = glob(path.join(project_path, "**/*.nf"), recursive=True)
+        self._main = main
+        self._nf_files = nf_files
+        self.workers = workers
+        self.cache = cache
+        self.memoize = memoize
+        self.keep_body = keep_body
+        self.lazy = lazy
+        self.profiles = profiles
         self.use_ecr_pull_through_cache = True
         self._container_substitutions = None
-        self._nf_config = path.join(project_path, "nextflow.config")
+        self._nf_config = nf_config
 
-    @property
-    def _contents(self) -> dict:
-        contents = dict()
-        for nf_file in self._nf_files:
-            with open(nf_file, "r") as file:
-                contents[nf_file] = file.read()
-        return contents
+        # nf_file -> (signature, processes) for files already parsed
+        self._parsed = dict()
+        # nf_file -> (signature, sha256) for files already hashed
+        self._digests = dict()
+        self._config = None
+
+        # field -> {value: [processes]}, dropped whenever files are re-parsed
+        self._indexes = dict()
+
+        # workflows loaded from a snapshot never look at their files
+        self._frozen = False
 
     @property
     def processes(self) -> list:
-        _processes = []
-        for nf_file, content in self._contents.items():
-            _processes += parse_processes(content, nf_file=nf_file)
-        return _processes
+        """
+        returns the processes defined by the workflow
+
+        parsed processes are kept in memory and only files whose mtime or size
+        changed since they were last parsed are parsed again.
+        """
+        return list(self.iter_processes())
+
+    def iter_processes(self):
+        """
+        yields the processes defined by the workflow file by file
+
+        only the contents of the files being parsed are held in memory, so
+        large workflows can be inspected without loading every file at once.
+        """
+        if self._frozen:
+            for nf_file in self._nf_files:
+                yield from self._parsed[nf_file][1]
+            return
+
+        signatures = dict()
+        for nf_file in self._nf_files:
+            try:
+                signatures[nf_file] = _file_signature(nf_file)
+            except FileNotFoundError:
+                self._parsed.pop(nf_file, None)
+
+        stale = [
+            nf_file
+            for nf_file, signature in signatures.items()
+            if self._parsed.get(nf_file, (None,))[0] != signature
+        ]
+        if stale or len(signatures) != len(self._nf_files):
+            self._indexes = dict()
+        loaded = self._load_records(stale)
+
+        for nf_file, signature in signatures.items():
+            if self._parsed.get(nf_file, (None,))[0] == signature:
+                processes = self._parsed[nf_file][1]
+            else:
+                processes = _build_processes(
+                    next(loaded), nf_file=nf_file, keep_body=self.keep_body
+                )
+                if self.memoize:
+                    self._parsed[nf_file] = (signature, processes)
+
+            yield from processes
+
+    def find_processes(
+        self, name=None, container=None, label=None, nf_file=None
+    ) -> list:
+        """
+        returns the processes matching all of the given criteria
+
+        lookups use indexes that are built once per parse of the workflow, so
+        repeated lookups do not scan the processes. the indexes are refreshed
+        the next time processes, containers, ... find changed files.
+
+        :param: name: process name, fully qualified task names such as
+            'NFCORE_RNASEQ:RNASEQ:FASTQC (sample_1)' are matched by their
+            process name
+        :param: container: container uri as returned by containers
+        :param: label: process label, with or without quotes
+        :param: nf_file: file that defines the process
+        """
+        criteria = {
+            "name": _task_process_name(name) if name else None,
+            "container": container,
+            "label": _unquote(label) if label else None,
+            "nf_file": path.normpath(nf_file) if nf_file else None,
+        }
+
+        matches = None
+        for field, value in criteria.items():
+            if value is None:
+                continue
+
+            found = self._get_index(field).get(value, [])
+            if matches is None:
+                matches = found
+            else:
+                ids = {id(process) for process in found}
+                matches = [process for process in matches if id(process) in ids]
+
+        if matches is None:
+            return self.processes
+        return list(matches)
+
+    def get_process_resources(self, pricing=None, attempt=1) -> list:
+        """
+        returns the effective cpus, memory and time of every process and the
+        smallest HealthOmics instance that fits them as ProcessResources
+
+        settings of nextflow.config and the configs it includes, e.g.
+        conf/base.config, are applied like nextflow does: process scope
+        settings, then process directives, then withLabel and withName
+        selectors. directives that can not be evaluated statically do not
+        override the settings of the config.
+
+        :param: pricing: instance pricing as returned by OmicsRun.get_pricing,
+            adds the hourly price and the maximum cost of each task
+        :param: attempt: value of task.attempt
+        """
+        config = self._optional_config()
+        params = config.params if config else None
+
+        resources = []
+        for process in self.iter_processes():
+            # script text like '--threads $task.cpus' scans as a cpus
+            # directive, only directives that evaluate override the config
+            settings = dict()
+            for kind in ("cpus", "memory", "time"):
+                value = getattr(process, kind)
+                if evaluate_resource(value, kind, attempt, params) is not None:
+                    settings[kind] = value
+            if config:
+                labels = _index_keys(process, "label")
+                settings = config.process_settings(process.name, labels, settings)
+            resources.append(
+                resolve_resources(
+                    process.name,
+                    settings,
+                    params=params,
+                    pricing=pricing,
+                    attempt=attempt,
+                )
+            )
+
+        return resources
+
+    def _optional_config(self) -> NextflowConfig:
+        # the config of workflows without a nextflow.config is None
+        if self._frozen:
+            return self._config
+        return self.config if path.isfile(self._nf_config) else None
+
+    def save(self, file_path: str) -> None:
+        """
+        writes the parsed processes, config and indexes of the workflow to a
+        JSON snapshot, gzip compressed when file_path ends with .gz
+
+        process bodies and their input, output and script stanzas are not
+        saved, bodies are read from the workflow files if they exist.
+
+        :param: file_path: path of the snapshot
+        """
+        processes = self.processes
+        config = self._optional_config()
+
+        ids = {id(process): ix for ix, process in enumerate(processes)}
+        indexes = dict()
+        for field in ("name", "container", "label", "nf_file"):
+            index = indexes[field] = dict()
+            for process in processes:
+                for key in _index_keys(process, field):
+                    index.setdefault(key, []).append(ids[id(process)])
+
+        snapshot = {
+            "version": SNAPSHOT_VERSION,
+            "parser_version": PARSER_VERSION,
+            "project_path": self._project_path,
+            "main": self._main,
+            "nf_config": self._nf_config,
+            "nf_files": self._nf_files,
+            "profiles": self.profiles,
+            "processes": [process.to_dict() for process in processes],
+            "config": config.to_dict() if config else None,
+            "indexes": indexes,
+        }
+
+        opener = gzip.open if file_path.endswith(".gz") else open
+        with opener(file_path, "wt") as file:
+            json.dump(snapshot, file, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, file_path: str) -> "NextflowWorkflow":
+        """
+        returns the workflow saved to a snapshot by save without reading or
+        parsing any workflow file. the workflow is frozen, it does not pick
+        up changes to the workflow files
+
+        :param: file_path: path of the snapshot
+        """
+        opener = gzip.open if file_path.endswith(".gz") else open
+        with opener(file_path, "rt") as file:
+            snapshot = json.load(file)
+        if snapshot.get("version") != SNAPSHOT_VERSION:
+            raise ValueError(
+                f"unsupported snapshot version '{snapshot.get('version')}' in "
+                f"'{file_path}', expected '{SNAPSHOT_VERSION}'"
+            )
+
+        processes = [
+            NextflowProcess(from_dict=record, keep_body=False)
+            for record in snapshot["processes"]
+        ]
+        by_file = dict()
+        for process in processes:
+            by_file.setdefault(process.nf_file, []).append(process)
+
+        workflow = cls.__new__(cls)
+        workflow._initialize(
+            snapshot["project_path"],
+            snapshot["main"],
+            snapshot["nf_files"],
+            snapshot["nf_config"],
+            profiles=snapshot["profiles"],
+        )
+        workflow._parsed = {
+            nf_file: (None, by_file.get(nf_file, [])) for nf_file in workflow._nf_files
+        }
+        workflow._config = (
+            NextflowConfig.from_dict(snapshot["config"]) if snapshot["config"] else None
+        )
+        workflow._indexes = {
+            field: {key: [processes[ix] for ix in ixs] for key, ixs in index.items()}
+            for field, index in snapshot["indexes"].items()
+        }
+        workflow._frozen = True
+        return workflow
+
+    def _get_index(self, field: str) -> dict:
+        index = self._indexes.get(field)
+        if index is None:
+            # reading processes parses changed files and drops stale indexes
+            processes = self.processes
+            index = dict()
+            for process in processes:
+                for key in _index_keys(process, field):
+                    index.setdefault(key, []).append(process)
+            self._indexes[field] = index
+
+        return index
+
+    def _digest(self, nf_file: str) -> str:
+        # files are hashed again only when their mtime or size changes, so the
+        # digest looked up before parsing is the one the records are stored by
+        signature = _file_signature(nf_file)
+        digest = self._digests.get(nf_file)
+        if digest is None or digest[0] != signature:
+            digest = self._digests[nf_file] = (signature, _file_digest(nf_file))
+        return digest[1]
+
+    def _load_records(self, nf_files: list):
+        """
+        yields the process records of nf_files in order, from the persistent
+        cache when one is set and the file contents were parsed before
+        """
+        if self.cache is None:
+            yield from _parse_nf_files(nf_files, workers=self.workers, lazy=self.lazy)
+            return
+
+        version = _cache_version(self.lazy)
+        digests = [self._digest(nf_file) for nf_file in nf_files]
+        misses = [
+            ix
+            for ix, digest in enumerate(digests)
+            if not self.cache.has(digest, version)
+        ]
+        parsed = _parse_nf_files(
+            [nf_files[ix] for ix in misses], workers=self.workers, lazy=self.lazy
+        )
+        misses = set(misses)
+
+        try:
+            for ix, (nf_file, digest) in enumerate(zip(nf_files, digests)):
+                if ix in misses:
+                    records = next(parsed)
+                    self.cache.put(digest, version, records)
+                else:
+                    records = self.cache.get(digest, version)
+                    if records is None:
+                        # evicted by another process since it was looked up
+                        records = _parse_nf_file(nf_file, lazy=self.lazy)
+                        self.cache.put(digest, version, records)
+                yield records
+        finally:
+            self.cache.evict()
 
     @property
     def containers(self) -> list:
@@ -127,164 +554,314 @@ class NextflowWorkflow:
         does not make any adjustments for cacheable uris or substitutions.
         """
         uris = set()
-        for process in self.processes:
+        for process in self.iter_processes():
             if process.container:
                 uris.add(process.container)
 
         return sorted(list(uris))
 
     @property
-    def docker_registry(self) -> str:
+    def config(self) -> NextflowConfig:
         """
-        returns the docker registry specified by the workflow definition
-        specified in its own line in a nextflow.config file as
-        docker.registry = 'quay.io'
+        returns the parsed nextflow.config of the workflow, including the
+        config files it includes
+
+        the config is parsed again only when one of its files changes. the
+        config of a workflow loaded from a snapshot saved without one is None
         """
-        _docker_registry = None
+        if self._frozen or (self._config and self._config.is_current()):
+            return self._config
+
         try:
-            with open(self._nf_config, "r") as _file:
-                for line in _file:
-                    if line.startswith("docker.registry"):
-                        _docker_registry = (
-                            line.strip()
-                            .split("=")[1]
-                            .replace("'", "")
-                            .replace('"', "")
-                            .strip()
-                        )
-                        break
+            self._config = NextflowConfig(self._nf_config, profiles=self.profiles)
         except FileNotFoundError as fnfe:
             print(
                 f"nextflow.config file not found in project directory: {self._project_path}"
             )
             raise fnfe
-        return _docker_registry
+        return self._config
+
+    @property
+    def docker_registry(self) -> str:
+        """
+        returns the docker registry specified by the workflow definition, e.g.
+        docker.registry = 'quay.io' or docker { registry = params.registry }
+        """
+        config = self.config
+        return config.docker_registry if config else None
 
     def get_container_manifest(self, substitutions=None) -> list:
         """
         generates a list of unique container image URIs to pull into an ECR Private registry
         """
         uris = set()
+        docker_registry = self.docker_registry
         for uri in self.containers:
-            if substitutions and uri in substitutions:
-                uri = substitutions.get(uri)
-            if self.docker_registry:
-                uri = "/".join([self.docker_registry, uri])
-            uris.add(uri)
+            uris.add(str(self._get_image_uri(uri, substitutions, docker_registry)))
 
         return sorted(list(uris))
 
-    def _get_ecr_image_name(self, uri, substitutions=None, namespace_config=None):
+    def _get_image_uri(self, uri, substitutions=None, docker_registry=None) -> ImageURI:
         if substitutions and uri in substitutions:
             uri = substitutions.get(uri)
 
-        if self.docker_registry:
-            uri = "/".join([self.docker_registry, uri])
+        image = parse_image_uri(uri)
+        # like nextflow, docker.registry only applies to images without one
+        if docker_registry and not image.registry:
+            image = image._replace(registry=docker_registry)
+        return image
 
-        if namespace_config:
-            uri_parts = uri.split("/")
-            if len(uri_parts) > 1:
-                source_registry = uri_parts[0]
-                image_name = "/".join(uri_parts[1:])
-            else:
-                source_registry = ""
-                image_name = uri
+    def _get_ecr_image_name(
+        self, uri, substitutions=None, namespace_config=None, docker_registry=None
+    ):
+        image = self._get_image_uri(uri, substitutions, docker_registry)
 
-            props = namespace_config.get(source_registry)
+        if namespace_config:
+            props = namespace_config.get(image.registry)
             if props:
-                uri = "/".join([props["namespace"], image_name])
+                return "/".join([props["namespace"], image.name])
 
-        return uri
+        return str(image)
 
     def get_omics_config(
-        self, session=None, substitutions=None, namespace_config=None
+        self, session=None, substitutions=None, namespace_config=None, processes=None
     ) -> str:
         """
         generates nextflow.config contents to use when running on AWS HealthOmics
 
         :param: session: boto3 session
-        :param: namespace_config: dictionary that maps public registries to image repository namespaces
+        :param: namespace_config: dictionary that maps public registries to
+            image repository namespaces
+        :param: processes: processes to configure, defaults to all processes of
+            the workflow
+        """
+        config = io.StringIO()
+        self.write_omics_config(
+            config,
+            session=session,
+            substitutions=substitutions,
+            namespace_config=namespace_config,
+            processes=processes,
+        )
+        return config.getvalue()
+
+    def write_omics_config(
+        self,
+        file,
+        session=None,
+        substitutions=None,
+        namespace_config=None,
+        processes=None,
+    ) -> int:
         """
+        writes nextflow.config contents to use when running on AWS HealthOmics
+        to an open text file, one withName entry at a time. identical entries
+        are only written once. returns the number of entries written
 
-        ecr_registry = ""
-        if session:
-            ecr = session.client("ecr")
-            response = ecr.describe_registry()
-            ecr_registry = (
-                f"{response['registryId']}.dkr.ecr.{session.region_name}.amazonaws.com"
+        :param: file: text file handle
+        :param: session: boto3 session
+        :param: namespace_config: dictionary that maps public registries to
+            image repository namespaces
+        :param: processes: processes to configure, defaults to all processes of
+            the workflow
+        """
+        ecr_registry = _ecr_registry(session) if session else ""
+        file.write(_OMICS_CONFIG_HEADER.replace(":::ecr_registry:::", ecr_registry))
+
+        if processes is None:
+            processes = self.iter_processes()
+
+        # the config is looked at once, not once per process
+        docker_registry = self.docker_registry
+        written = set()
+        separator = ""
+        for process in processes:
+            if not process.container:
+                continue
+
+            container_uri = self._get_ecr_image_name(
+                process.container,
+                substitutions=substitutions,
+                namespace_config=namespace_config,
+                docker_registry=docker_registry,
             )
+            if (process.name, container_uri) in written:
+                continue
+            written.add((process.name, container_uri))
 
-        process_configs = []
-        _tpl = (
-            "withName: '::process.name::' { container = '::process.container.uri::' }"
-        )
-        for process in self.processes:
-            if process.container:
-                container_uri = self._get_ecr_image_name(
-                    process.container,
-                    substitutions=substitutions,
-                    namespace_config=namespace_config,
-                )
+            file.write(
+                f"{separator}withName: '{process.name}' "
+                f"{{ container = '{container_uri}' }}"
+            )
+            separator = "\n\t"
 
-                process_configs += [
-                    (
-                        _tpl.replace("::process.name::", process.name).replace(
-                            "::process.container.uri::", container_uri
-                        )
-                    )
-                ]
-
-        config = dedent(
-            """\
-            params {
-                ecr_registry = ':::ecr_registry:::'
-                outdir = '/mnt/workflow/pubdir'
-            }
-
-            manifest {
-                nextflowVersion = '!>=22.04.0'
-            }
-
-            conda {
-                enabled = false
-            }
-
-            docker {
-                enabled = true
-                registry = params.ecr_registry
-            }
-
-            process {
-                withName: '.*' { conda = null }
-                :::process_configs:::
-            }
-            """
-        )
-        config = config.replace(":::ecr_registry:::", ecr_registry)
-        config = config.replace(":::process_configs:::", "\n\t".join(process_configs))
+        file.write(_OMICS_CONFIG_FOOTER)
+        return len(written)
+
+
+_OMICS_CONFIG_HEADER: str = (
+    dedent(
+        """\
+    params {
+        ecr_registry = ':::ecr_registry:::'
+        outdir = '/mnt/workflow/pubdir'
+    }
+
+    manifest {
+        nextflowVersion = '!>=22.04.0'
+    }
+
+    conda {
+        enabled = false
+    }
+
+    docker {
+        enabled = true
+        registry = params.ecr_registry
+    }
 
-        return config
+    process {
+        withName: '.*' { conda = null }
+    """
+    )
+    + " " * 4
+)
+_OMICS_CONFIG_FOOTER: str = "\n}\n"
+
+# session -> ECR registry host of its account, sessions of the same profile
+# may use different credentials and the entry goes away with the session
+_ECR_REGISTRIES = weakref.WeakKeyDictionary()
+
+
+def _ecr_registry(session) -> str:
+    if session not in _ECR_REGISTRIES:
+        response = session.client("ecr").describe_registry()
+        _ECR_REGISTRIES[
+            session
+        ] = f"{response['registryId']}.dkr.ecr.{session.region_name}.amazonaws.com"
+    return _ECR_REGISTRIES[session]
 
 
 class NextflowProcess:
-    def __init__(self, from_dict=None) -> None:
+    """
+    a process definition parsed from a nf_file
+
+    only the directives present in the definition are stored. directive
+    names that are not defined read as None. the body is either kept or
+    re-read from the span of the definition in nf_file when accessed.
+
+    processes parsed lazily only know their container until another
+    directive is accessed, the body is then parsed once for all of them.
+    """
+
+    __slots__ = ("name", "nf_file", "span", "_body", "_directives", "_lazy")
+
+    def __init__(self, from_dict=None, keep_body=True) -> None:
+        self.name = None
+        self.nf_file = None
+        # 1-based (first, last) lines of the definition in nf_file
+        self.span = None
+        self._body = None
+        self._directives = dict()
+        self._lazy = False
         if from_dict:
-            self._load_from_dict(from_dict)
+            self._load_from_dict(from_dict, keep_body=keep_body)
 
-    def _load_from_dict(self, props) -> None:
+    def _load_from_dict(self, props, keep_body=True) -> None:
         self.name = props.get("name")
-        self.body = props.get("body")
         self.nf_file = props.get("nf_file")
+        self.span = tuple(props["span"]) if props.get("span") else None
+        if keep_body or not (self.nf_file and self.span):
+            self._body = props.get("body")
+        self._lazy = bool(props.get("lazy"))
+
+        self._load_directives(props)
+        if self._directives.get("container"):
+            self._directives["container"] = find_docker_uri(
+                self._directives["container"]
+            )
 
-        for attr in NF_DIRECTIVES + NF_PROCESS_SYNTAX:
-            if props.get(attr) and len(props.get(attr)) == 1:
-                value = props.get(attr)[0]
-            else:
-                value = props.get(attr)
-            setattr(self, attr, value)
+    def _load_directives(self, props) -> None:
+        for attr in _PROCESS_ATTRIBUTES:
+            value = props.get(attr)
+            if value:
+                self._directives[attr] = value[0] if len(value) == 1 else value
+
+    def _materialize(self) -> None:
+        # parse the directives of a lazily parsed process, keeping its
+        # already resolved container
+        self._lazy = False
+        container = self._directives.get("container")
+        body = self.body
+        if body is None:
+            warnings.warn(
+                f"process '{self.name}' was not found at lines {self.span} of "
+                f"'{self.nf_file}', its directives are unknown",
+                UserWarning,
+            )
+            body = ""
+        self._load_directives(_DIRECTIVE_SCANNER.scan(body))
+        if container:
+            self._directives["container"] = container
+
+    def to_dict(self) -> dict:
+        """
+        returns the process as a record that NextflowProcess(from_dict=...)
+        loads again, without its body and stanzas
+        """
+        record = {
+            "name": self.name,
+            "nf_file": self.nf_file,
+            "span": list(self.span) if self.span else None,
+        }
+        for name, value in self.directives.items():
+            record[name] = value if isinstance(value, list) else [value]
+        return record
 
-        if self.container:
-            self.container = find_docker_uri(self.container)
+    @property
+    def directives(self) -> dict:
+        """
+        returns the directives defined by the process, without its input,
+        output, script, ... stanzas
+        """
+        if self._lazy:
+            self._materialize()
+        return {
+            name: value
+            for name, value in self._directives.items()
+            if name not in NF_PROCESS_SYNTAX
+        }
+
+    @property
+    def body(self) -> str:
+        if self._body is None and self.nf_file and self.span:
+            return _read_process_body(self.nf_file, self.span, name=self.name)
+        return self._body
+
+    @body.setter
+    def body(self, value: str) -> None:
+        self._body = value
+
+    def __getattr__(self, name: str):
+        # only reached for names that are not slots
+        if name in _PROCESS_ATTRIBUTES:
+            if self._lazy and name != "container":
+                self._materialize()
+            return self._directives.get(name)
+        raise AttributeError(
+            f"'{self.__class__.__name__}' object has no attribute '{name}'"
+        )
+
+    def __setattr__(self, name: str, value) -> None:
+        if name in _PROCESS_ATTRIBUTES:
+            if self._lazy and name != "container":
+                self._materialize()
+            if value is None:
+                self._directives.pop(name, None)
+            else:
+                self._directives[name] = value
+        else:
+            object.__setattr__(self, name, value)
 
     def __hash__(self) -> int:
         # omit self.nf_file from hashing
@@ -301,21 +878,63 @@ class NextflowProcess:
         return self.name == __value.name and self.container == __value.container
 
 
-def find_docker_uri(container: str) -> dict:
-    # check if provided a quoted string and strip bounding quotes
-    match = re.match("^(['\"])", container)
-    if match:
-        container = container[1:-1]
-
-    # only look for public docker container uri
-    # spot check of several nf-core workflows shows container directives use a ternary definition
-    # to select between singularity and docker
-    match = re.search("(\\:|params.ecr_registry \\+)\\s+?'(.+?)'", container)
-    uri = None
-    if match:
-        uri = match.groups()[1]
-    else:
-        # there are edge cases where a "simple" container directive is used - e.g. only a URI string
-        uri = container
-
-    return uri
+_PROCESS_ATTRIBUTES: frozenset = frozenset(NF_DIRECTIVES + NF_PROCESS_SYNTAX)
+
+
+def _unquote(value: str) -> str:
+    return value.strip().strip("'\"")
+
+
+def _task_process_name(name: str) -> str:
+    # NFCORE_RNASEQ:RNASEQ:FASTQC (sample_1) -> FASTQC
+    return name.split(" (")[0].split(":")[-1].strip()
+
+
+def _index_keys(process, field: str) -> list:
+    if field == "name":
+        return [process.name]
+    if field == "container":
+        return [process.container] if process.container else []
+    if field == "label":
+        labels = process.label or []
+        if isinstance(labels, str):
+            labels = [labels]
+        return [_unquote(label) for label in labels]
+    if field == "nf_file":
+        return [path.normpath(process.nf_file)] if process.nf_file else []
+    raise ValueError(f"unknown index field: {field}")
+
+
+def _read_process_body(nf_file: str, span: tuple, name: str = None) -> str:
+    # the file may be gone, e.g. for workflows loaded from a snapshot on
+    # another machine
+    try:
+        blocks = _process_blocks(nf_file, _file_signature(nf_file))
+    except OSError:
+        return None
+    for block in blocks.get(span[0], []):
+        if name in (None, block.name):
+            return block.body.strip()
+    return None
+
+
+@lru_cache(maxsize=PROCESS_BLOCKS_CACHE_SIZE)
+def _process_blocks(nf_file: str, signature: tuple) -> dict:
+    # start line -> process blocks of nf_file, cached by the mtime and size
+    # of the file so that the processes of a file share a single read.
+    # comments are stripped from the start of the file, the span may start
+    # or end inside a block comment
+    with open(nf_file, "r") as file:
+        blocks = find_process_blocks(strip_comments(file.read()))
+    by_line = dict()
+    for block in blocks:
+        by_line.setdefault(block.start_line, []).append(block)
+    return by_line
+
+
+def find_docker_uri(container: str) -> str:
+    """
+    returns the docker image uri selected by a container directive, resolved
+    uris are cached by directive
+    """
+    return resolve_container(container)
@@ -0,0 +1,243 @@
+import json
+import os
+import sqlite3
+import time
+import warnings
+from os import path
+
+# default upper bound for the size of cached records
+DEFAULT_MAX_SIZE: int = 256 * 1024 * 1024
+
+
+def default_cache_dir() -> str:
+    """
+    returns the directory used for persistent caches
+
+    $BIOANALYZE_OMICS_CACHE_DIR if set, otherwise bioanalyze_omics under
+    $XDG_CACHE_HOME (~/.cache)
+    """
+    cache_dir = os.environ.get("BIOANALYZE_OMICS_CACHE_DIR")
+    if not cache_dir:
+        cache_home = os.environ.get("XDG_CACHE_HOME") or path.join(
+            path.expanduser("~"), ".cache"
+        )
+        cache_dir = path.join(cache_home, "bioanalyze_omics")
+    return cache_dir
+
+
+class ParseCache:
+    """
+    persistent SQLite cache of parsed process records
+
+    records are keyed by the sha256 digest of a nf_file's contents and the
+    version of the parser that produced them. entries are evicted least
+    recently used first once their total size exceeds max_size bytes.
+
+    the database is shared by concurrent processes: it is opened in WAL
+    mode, every write is its own short transaction and access times are
+    written in one batch by evict. a cache that stays locked longer than
+    busy_timeout seconds behaves as a miss and never fails a parse. a cache
+    that can not be opened, e.g. in a read-only directory, is not used.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = None,
+        max_size: int = DEFAULT_MAX_SIZE,
+        busy_timeout: float = 5.0,
+    ):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_size = max_size
+        # access times of the records read since the last evict
+        self._accessed = dict()
+
+        # None when the cache can not be opened, every lookup is then a miss
+        self._db = None
+        db = None
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            db = sqlite3.connect(
+                path.join(self.cache_dir, "parse_cache.sqlite3"),
+                timeout=busy_timeout,
+                isolation_level=None,
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                """
+                CREATE TABLE IF NOT EXISTS records (
+                    digest TEXT NOT NULL,
+                    version TEXT NOT NULL,
+                    records TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed REAL NOT NULL,
+                    PRIMARY KEY (digest, version)
+                )
+                """
+            )
+            db.execute(
+                "CREATE INDEX IF NOT EXISTS records_accessed ON records (accessed)"
+            )
+        except (OSError, sqlite3.Error) as e:
+            # e.g. a read-only cache directory or a corrupt database
+            if db is not None:
+                db.close()
+            self._unavailable(e)
+            return
+        self._db = db
+
+    @staticmethod
+    def _unavailable(error: Exception):
+        warnings.warn(f"parse cache unavailable, parsing without it: {error}")
+
+    def has(self, digest: str, version: str) -> bool:
+        if self._db is None:
+            return False
+        try:
+            row = self._db.execute(
+                "SELECT 1 FROM records WHERE digest = ? AND version = ?",
+                (digest, version),
+            ).fetchone()
+        except sqlite3.OperationalError as e:
+            self._unavailable(e)
+            return False
+        return row is not None
+
+    def get(self, digest: str, version: str) -> list:
+        """
+        returns the cached records for digest, or None on a miss
+        """
+        if self._db is None:
+            return None
+        try:
+            row = self._db.execute(
+                "SELECT records FROM records WHERE digest = ? AND version = ?",
+                (digest, version),
+            ).fetchone()
+        except sqlite3.OperationalError as e:
+            self._unavailable(e)
+            return None
+        if row is None:
+            return None
+
+        self._accessed[(digest, version)] = time.time()
+        return json.loads(row[0])
+
+    def put(self, digest: str, version: str, records: list) -> None:
+        if self._db is None:
+            return
+        _records = json.dumps(records, separators=(",", ":"))
+        try:
+            self._db.execute(
+                "INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)",
+                (digest, version, _records, len(_records), time.time()),
+            )
+        except sqlite3.OperationalError as e:
+            self._unavailable(e)
+
+    def evict(self) -> None:
+        """
+        writes the access times of the records read and drops the least
+        recently used entries until the cache fits in max_size
+        """
+        accessed, self._accessed = self._accessed, dict()
+        if self._db is None:
+            return
+        try:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany(
+                    "UPDATE records SET accessed = ? WHERE digest = ? AND version = ?",
+                    [
+                        (when, digest, version)
+                        for (digest, version), when in accessed.items()
+                    ],
+                )
+                self._evict()
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        except sqlite3.OperationalError as e:
+            self._unavailable(e)
+
+    def _evict(self):
+        size = self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM records"
+        ).fetchone()[0]
+        if size <= self.max_size:
+            return
+        rows = self._db.execute(
+            "SELECT digest, version, size FROM records ORDER BY accessed"
+        ).fetchall()
+        expired = []
+        for digest, version, _size in rows:
+            if size <= self.max_size:
+                break
+            expired.append((digest, version))
+            size -= _size
+
+        self._db.executemany(
+            "DELETE FROM records WHERE digest = ? AND version = ?", expired
+        )
+
+    def clear(self) -> None:
+        self._accessed.clear()
+        if self._db is None:
+            return
+        try:
+            self._db.execute("DELETE FROM records")
+        except sqlite3.OperationalError as e:
+            self._unavailable(e)
+
+    def close(self) -> None:
+        self.evict()
+        if self._db is not None:
+            self._db.close()
+
+
+class MemoryParseCache:
+    """
+    in-memory cache of parsed process records with the interface of
+    ParseCache, optionally in front of a persistent ParseCache
+
+    records are shared by every workflow using the cache, so files with the
+    same contents are parsed once even across workflows.
+    """
+
+    def __init__(self, backend: ParseCache = None):
+        self.backend = backend
+        self._records = dict()
+
+    def has(self, digest: str, version: str) -> bool:
+        if (digest, version) in self._records:
+            return True
+        return self.backend is not None and self.backend.has(digest, version)
+
+    def get(self, digest: str, version: str) -> list:
+        """
+        returns the cached records for digest, or None on a miss
+        """
+        records = self._records.get((digest, version))
+        if records is None and self.backend is not None:
+            records = self.backend.get(digest, version)
+            if records is not None:
+                self._records[(digest, version)] = records
+        return records
+
+    def put(self, digest: str, version: str, records: list) -> None:
+        self._records[(digest, version)] = records
+        if self.backend is not None:
+            self.backend.put(digest, version, records)
+
+    def evict(self) -> None:
+        if self.backend is not None:
+            self.backend.evict()
+
+    def clear(self) -> None:
+        self._records.clear()
+        if self.backend is not None:
+            self.backend.clear()
+
+    def close(self) -> None:
+        if self.backend is not None:
+            self.backend.close()
@@ -0,0 +1,185 @@
+from collections import Counter
+import hashlib
+import os
+from os import path
+
+from bioanalyze_omics.nf import (
+    NextflowWorkflow,
+    _cache_version,
+    _parse_nf_files,
+)
+from bioanalyze_omics.nf.cache import MemoryParseCache, ParseCache
+
+
+class WorkflowCatalog:
+    """
+    inspects many workflows at once, parsing each distinct *.nf file once
+
+    nf-core pipelines share most of their modules. files are deduplicated by
+    the sha256 digest of their contents across all workflows of the catalog
+    and the records of every distinct file are shared through one cache.
+    """
+
+    def __init__(
+        self,
+        project_paths: list,
+        workers: int = 1,
+        cache: ParseCache = None,
+        main: str = "main.nf",
+        ignore: list = None,
+        lazy: bool = True,
+        profiles: list = None,
+    ) -> None:
+        """
+        :param: project_paths: paths to the nextflow workflow directories
+        :param: workers: number of processes used to parse distinct *.nf files
+        :param: cache: persistent ParseCache consulted before parsing
+        :param: main: entry script of each workflow, see NextflowWorkflow
+        :param: ignore: glob patterns of files and directories to skip
+        :param: lazy: only parse container directives up front
+        :param: profiles: names of the nextflow.config profiles to apply
+        """
+        self.workers = workers
+        self.lazy = lazy
+        self.cache = MemoryParseCache(backend=cache)
+        self.workflows = {
+            project_path: NextflowWorkflow(
+                project_path,
+                cache=self.cache,
+                main=main,
+                ignore=ignore,
+                lazy=lazy,
+                profiles=profiles,
+            )
+            for project_path in project_paths
+        }
+        # number of *.nf files, of distinct ones and of the ones parsed
+        self.stats = dict()
+
+    def parse(self) -> dict:
+        """
+        parses the distinct *.nf files of all workflows that are not cached
+        yet and returns the file counts
+
+        runs once before the first manifest or config is generated, files
+        changed later are parsed again by their workflow
+        """
+        version = _cache_version(self.lazy)
+        nf_files = 0
+        distinct = dict()
+        for workflow in self.workflows.values():
+            for nf_file in workflow._nf_files:
+                nf_files += 1
+                distinct.setdefault(workflow._digest(nf_file), nf_file)
+
+        misses = [
+            (digest, nf_file)
+            for digest, nf_file in distinct.items()
+            if not self.cache.has(digest, version)
+        ]
+        parsed = _parse_nf_files(
+            [nf_file for _, nf_file in misses], workers=self.workers, lazy=self.lazy
+        )
+        try:
+            for (digest, _), records in zip(misses, parsed):
+                self.cache.put(digest, version, records)
+        finally:
+            self.cache.evict()
+
+        self.stats = {
+            "files": nf_files,
+            "distinct": len(distinct),
+            "parsed": len(misses),
+        }
+        return self.stats
+
+    def get_container_manifest(self, substitutions=None) -> list:
+        """
+        generates the list of unique container image URIs of all workflows
+        """
+        if not self.stats:
+            self.parse()
+        uris = set()
+        for workflow in self.workflows.values():
+            uris.update(workflow.get_container_manifest(substitutions=substitutions))
+        return sorted(uris)
+
+    def get_omics_configs(
+        self, session=None, substitutions=None, namespace_config=None
+    ) -> dict:
+        """
+        generates the HealthOmics nextflow.config contents of each workflow,
+        by project path
+        """
+        if not self.stats:
+            self.parse()
+        return {
+            project_path: workflow.get_omics_config(
+                session=session,
+                substitutions=substitutions,
+                namespace_config=namespace_config,
+            )
+            for project_path, workflow in self.workflows.items()
+        }
+
+    def write_omics_configs(
+        self, output_dir: str, session=None, substitutions=None, namespace_config=None
+    ) -> list:
+        """
+        writes the HealthOmics nextflow.config of each workflow to output_dir
+        as <workflow>.omics.config, one workflow at a time, and returns the
+        paths written, see config_names
+        """
+        if not self.stats:
+            self.parse()
+        os.makedirs(output_dir, exist_ok=True)
+
+        config_names = self.config_names
+        config_files = []
+        for project_path, workflow in self.workflows.items():
+            config_file = path.join(output_dir, config_names[project_path])
+            with open(config_file, "w") as file:
+                workflow.write_omics_config(
+                    file,
+                    session=session,
+                    substitutions=substitutions,
+                    namespace_config=namespace_config,
+                )
+            config_files.append(config_file)
+        return config_files
+
+    @property
+    def config_names(self) -> dict:
+        """
+        returns the file name of the omics.config of each workflow, by project
+        path. workflows whose directories share a name, ignoring case, are
+        told apart by a short hash of their path
+        """
+        names = {
+            project_path: self.config_name(project_path)
+            for project_path in self.workflows
+        }
+        counts = Counter(name.lower() for name in names.values())
+        return {
+            project_path: (
+                name
+                if counts[name.lower()] == 1
+                else self.config_name(project_path, qualify=True)
+            )
+            for project_path, name in names.items()
+        }
+
+    @staticmethod
+    def config_name(project_path: str, qualify: bool = False) -> str:
+        """
+        returns the file name used for the omics.config of a workflow
+
+        :param: project_path: path to the nextflow workflow directory
+        :param: qualify: add a short hash of the absolute project path
+        """
+        project_path = path.abspath(project_path)
+        name = path.basename(project_path)
+        if qualify:
+            digest = hashlib.sha256(project_path.encode()).hexdigest()[:8]
+            name = f"{name}-{digest}"
+        return f"{name}.omics.config"
@@ -0,0 +1,478 @@
+import os
+import re
+from os import path
+import warnings
+
+from bioanalyze_omics.nf.includes import _PROJECT_DIR
+from bioanalyze_omics.nf.lexer import strip_comments
+
+# statements of a config file, each matched at the start of a statement
+_CLOSE = re.compile(r"\}")
+_SELECTOR = re.compile(
+    r"""(withLabel|withName)\s*:\s*('[^'\n]*'|"[^"\n]*"|[^\s{]+)\s*\{"""
+)
+_INCLUDE = re.compile(r"includeConfig\b\s*")
+_CONTROL = re.compile(r"(else\s+if|if|else|try|catch|finally)\b\s*")
+_DEF = re.compile(r"def\s+\w+\s*\(")
+_ASSIGN = re.compile(r"""([\w.]+|'[^'\n]*'|"[^"\n]*")\s*=(?!=)\s*""")
+_BLOCK = re.compile(r"([\w.]+)\s*\{")
+_SPACE = re.compile(r"[\s;]*")
+
+# tokens that change the nesting of an expression
+_EXPRESSION = re.compile(r"""'''|\"\"\"|['"]|[\[\](){}]|[\n;]""")
+_STRING = {
+    "'''": re.compile(r"'''.*?'''", flags=re.DOTALL),
+    '"""': re.compile(r'""".*?"""', flags=re.DOTALL),
+    "'": re.compile(r"'(?:\\.|[^'\\\n])*'"),
+    '"': re.compile(r'"(?:\\.|[^"\\])*"', flags=re.DOTALL),
+}
+
+# an expression continues on the next line after a trailing operator or
+# when the next line starts with one, e.g. a ternary split across lines
+_TRAILING_OPERATORS = "?:+-*/|&,=("
+_LEADING_OPERATORS = "?:.+|&"
+
+_INT = re.compile(r"-?\d+")
+_FLOAT = re.compile(r"-?\d+\.\d+")
+_REFERENCE = re.compile(r"[A-Za-z_]\w*(?:\.\w+)+")
+
+# scope frame of the profiles block
+_PROFILES = object()
+
+
+class Expression(str):
+    """
+    an unevaluated groovy expression, e.g. `6.GB * task.attempt` or
+    "${params.outdir}/pipeline_info"
+    """
+
+    __slots__ = ()
+
+
+def _quote(value: str) -> str:
+    """
+    returns the quotes around a quoted string value, or None
+    """
+    for quote in ("'''", '"""', "'", '"'):
+        if (
+            len(value) >= 2 * len(quote)
+            and value.startswith(quote)
+            and value.endswith(quote)
+        ):
+            return quote
+    return None
+
+
+def _literal(value: str):
+    """
+    returns the python value of a literal config value, or an Expression
+    """
+    quote = _quote(value)
+    if quote:
+        if quote[0] == "'" or "$" not in value:
+            return value[len(quote) : -len(quote)]
+    elif value in ("true", "false"):
+        return value == "true"
+    elif value == "null":
+        return None
+    elif _INT.fullmatch(value):
+        return int(value)
+    elif _FLOAT.fullmatch(value):
+        return float(value)
+    return Expression(value)
+
+
+def _expression_end(text: str, pos: int) -> int:
+    """
+    returns the position after the expression starting at pos, which ends at
+    a newline or ';' outside of brackets, or before an unmatched closer
+    """
+    depth = 0
+    while True:
+        match = _EXPRESSION.search(text, pos)
+        if match is None:
+            return len(text)
+        token = match.group(0)
+        if token in _STRING:
+            string = _STRING[token].match(text, match.start())
+            pos = string.end() if string else match.end()
+            continue
+
+        pos = match.end()
+        if token in "([{":
+            depth += 1
+        elif token in ")]}":
+            if not depth:
+                return match.start()
+            depth -= 1
+        elif not depth:
+            if token == "\n":
+                previous = text[: match.start()].rstrip()
+                following = text[pos:].lstrip()
+                if (previous and previous[-1] in _TRAILING_OPERATORS) or (
+                    following and following[0] in _LEADING_OPERATORS
+                ):
+                    continue
+            return match.start()
+
+
+def _block_end(text: str, pos: int) -> int:
+    """
+    returns the position after the '}' closing the block opened before pos
+    """
+    while True:
+        end = _expression_end(text, pos)
+        if end >= len(text):
+            return end
+        if text[end] == "}":
+            return end + 1
+        pos = end + 1
+
+
+def _parenthesis_end(text: str, pos: int) -> int:
+    if text.startswith("(", pos):
+        return _expression_end(text, pos + 1) + 1
+    return pos
+
+
+class NextflowConfig:
+    """
+    settings of a nextflow.config file and the config files it includes
+
+    assignments are stored by their dotted name, e.g. docker.registry, with
+    later assignments overriding earlier ones. settings of process withLabel
+    and withName selectors are kept per selector. string, number and boolean
+    literals are stored as python values, anything else as an Expression.
+
+    bodies of if/else and catch blocks can not be evaluated and are skipped,
+    as are includeConfig statements whose path is not a string literal (e.g.
+    nf-core institutional configs). profiles are only applied when selected.
+    """
+
+    def __init__(self, config_file: str, profiles: list = None) -> None:
+        """
+        :param: config_file: path to nextflow.config
+        :param: profiles: names of the profiles to apply
+        """
+        self.config_file = path.normpath(config_file)
+        self.project_path = path.dirname(self.config_file)
+        self.profiles = list(profiles or [])
+        self.settings = dict()
+        # (withLabel|withName, pattern) -> settings
+        self.selectors = dict()
+        # config file -> (mtime_ns, size) of every file read
+        self.files = dict()
+
+        self._include(self.config_file, [])
+
+    def to_dict(self) -> dict:
+        """
+        returns the parsed settings as JSON serializable dict, see from_dict
+        """
+        return {
+            "config_file": self.config_file,
+            "profiles": self.profiles,
+            "settings": {key: _encode(value) for key, value in self.settings.items()},
+            "selectors": [
+                [kind, pattern, {key: _encode(val) for key, val in settings.items()}]
+                for (kind, pattern), settings in self.selectors.items()
+            ],
+            "files": {
+                config_file: list(signature)
+                for config_file, signature in self.files.items()
+            },
+        }
+
+    @classmethod
+    def from_dict(cls, props: dict) -> "NextflowConfig":
+        """
+        returns the config serialized by to_dict without reading any file
+        """
+        config = cls.__new__(cls)
+        config.config_file = props["config_file"]
+        config.project_path = path.dirname(config.config_file)
+        config.profiles = list(props["profiles"])
+        config.settings = {
+            key: _decode(value) for key, value in props["settings"].items()
+        }
+        config.selectors = {
+            (kind, pattern): {key: _decode(value) for key, value in settings.items()}
+            for kind, pattern, settings in props["selectors"]
+        }
+        config.files = {
+            config_file: tuple(signature)
+            for config_file, signature in props["files"].items()
+        }
+        return config
+
+    def is_current(self) -> bool:
+        """
+        returns True if none of the config files read changed since
+        """
+        for config_file, signature in self.files.items():
+            try:
+                stat = os.stat(config_file)
+            except FileNotFoundError:
+                return False
+            if (stat.st_mtime_ns, stat.st_size) != signature:
+                return False
+        return True
+
+    def get(self, key: str, default=None):
+        """
+        returns the setting with the dotted name key. settings that refer to
+        another setting, e.g. params.ecr_registry, return its value
+        """
+        value = self.settings.get(key, default)
+        seen = {key}
+        while (
+            isinstance(value, Expression)
+            and _REFERENCE.fullmatch(value)
+            and value in self.settings
+            and value not in seen
+        ):
+            seen.add(value)
+            value = self.settings[value]
+        return value
+
+    @property
+    def docker_registry(self) -> str:
+        return self.get("docker.registry")
+
+    @property
+    def params(self) -> dict:
+        return {
+            key[len("params.") :]: value
+            for key, value in self.settings.items()
+            if key.startswith("params.")
+        }
+
+    def process_settings(
+        self, name: str, labels: list = None, directives: dict = None
+    ) -> dict:
+        """
+        returns the process settings that apply to a process, from lowest to
+        highest priority: process scope settings, directives of the process
+        definition, matching withLabel and then withName selectors, each in
+        the order they are defined
+
+        :param: name: simple or fully qualified name of the process
+        :param: labels: labels of the process
+        :param: directives: directives of the process definition
+        """
+        settings = {
+            key[len("process.") :]: value
+            for key, value in self.settings.items()
+            if key.startswith("process.")
+        }
+        for key, value in (directives or {}).items():
+            if value is not None:
+                settings[key] = value
+        names = {name, name.split(":")[-1]}
+        for kind, candidates in (("withLabel", labels or []), ("withName", names)):
+            for (_kind, pattern), _settings in self.selectors.items():
+                if _kind != kind:
+                    continue
+                if kind == "withName" and ":" not in name:
+                    # the workflow path of a simple name is unknown, selectors
+                    # like '.*:ALIGN_STAR:STAR_ALIGN' match on the last segment
+                    pattern = _simple_pattern(pattern)
+                if _selects(pattern, candidates):
+                    settings.update(_settings)
+        return settings
+
+    @property
+    def container_overrides(self) -> dict:
+        """
+        returns the container set by each withName selector, by pattern
+        """
+        return {
+            pattern: settings["container"]
+            for (kind, pattern), settings in self.selectors.items()
+            if kind == "withName" and settings.get("container")
+        }
+
+    def _include(self, config_file: str, scope: list) -> None:
+        if config_file in self.files:
+            # includeConfig cycles
+            return
+
+        stat = os.stat(config_file)
+        self.files[config_file] = (stat.st_mtime_ns, stat.st_size)
+        with open(config_file, "r") as file:
+            contents = strip_comments(file.read())
+        self._parse(contents, config_file, scope)
+
+    def _include_path(self, expression: str, config_file: str) -> str:
+        value = _literal(expression)
+        if isinstance(value, Expression):
+            # only interpolated strings referencing projectDir are resolved
+            quote = _quote(value)
+            if not quote:
+                return None
+            value = _PROJECT_DIR.sub(
+                lambda _: self.project_path, value[len(quote) : -len(quote)]
+            )
+            if "$" in value:
+                return None
+        elif not isinstance(value, str):
+            return None
+
+        if not path.isabs(value):
+            value = path.join(path.dirname(config_file), value)
+        value = path.normpath(value)
+        if not path.isfile(value):
+            warnings.warn(
+                f"unable to resolve includeConfig '{value}' in file '{config_file}'",
+                UserWarning,
+            )
+            return None
+        return value
+
+    def _assign(self, scope: list, key: str, value) -> None:
+        key = _literal(key) if key[0] in "'\"" else key
+        names = [frame for frame in scope if isinstance(frame, str)]
+        selector = next(
+            (frame for frame in reversed(scope) if isinstance(frame, tuple)), None
+        )
+        if selector:
+            # process { withName: FOO { ext.args = '' } } -> ext.args
+            index = len(scope) - 1 - scope[::-1].index(selector)
+            names = [frame for frame in scope[index:] if isinstance(frame, str)]
+            self.selectors.setdefault(selector, dict())[".".join(names + [key])] = value
+        else:
+            self.settings[".".join(names + [key])] = value
+
+    def _parse(self, text: str, config_file: str, scope: list) -> None:
+        # scope holds the names of the enclosing blocks, (kind, pattern) for
+        # selectors, _PROFILES and None for blocks that do not add to names
+        scope = list(scope)
+        depth = len(scope)
+        pos = 0
+        n = len(text)
+        while True:
+            pos = _SPACE.match(text, pos).end()
+            if pos >= n:
+                break
+
+            if _CLOSE.match(text, pos):
+                if len(scope) > depth:
+                    scope.pop()
+                pos += 1
+                continue
+
+            match = _SELECTOR.match(text, pos)
+            if match:
+                pattern = _literal(match.group(2))
+                scope.append((match.group(1), str(pattern)))
+                pos = match.end()
+                continue
+
+            match = _INCLUDE.match(text, pos)
+            if match:
+                end = _expression_end(text, match.end())
+                expression = text[match.end() : end].strip()
+                included = self._include_path(expression, config_file)
+                if included:
+                    self._include(included, scope)
+                pos = end
+                continue
+
+            match = _CONTROL.match(text, pos)
+            if match:
+                keyword = match.group(1)
+                brace = _parenthesis_end(text, match.end())
+                brace = _SPACE.match(text, brace).end()
+                if not text.startswith("{", brace):
+                    # if (...) statement without a block
+                    pos = _expression_end(text, brace)
+                elif keyword in ("try", "finally"):
+                    scope.append(None)
+                    pos = brace + 1
+                else:
+                    pos = _block_end(text, brace + 1)
+                continue
+
+            match = _DEF.match(text, pos)
+            if match:
+                brace = text.find("{", _parenthesis_end(text, match.end() - 1))
+                pos = n if brace < 0 else _block_end(text, brace + 1)
+                continue
+
+            match = _ASSIGN.match(text, pos)
+            if match:
+                end = _expression_end(text, match.end())
+                value = _literal(text[match.end() : end].strip())
+                self._assign(scope, match.group(1), value)
+                pos = end
+                continue
+
+            match = _BLOCK.match(text, pos)
+            if match:
+                name = match.group(1)
+                if name == "profiles" and not any(
+                    isinstance(frame, str) for frame in scope
+                ):
+                    scope.append(_PROFILES)
+                    pos = match.end()
+                    continue
+                if scope and scope[-1] is _PROFILES:
+                    if name in self.profiles:
+                        # profile settings apply to the top level scope
+                        scope.append(None)
+                        pos = match.end()
+                    else:
+                        pos = _block_end(text, match.end())
+                    continue
+                scope.append(name)
+                pos = match.end()
+                continue
+
+            # statements without settings, e.g. id 'nf-validation' in plugins
+            end = _expression_end(text, pos)
+            pos = end if end > pos else pos + 1
+
+
+def _encode(value):
+    # expressions are the only values that are not JSON literals
+    if isinstance(value, Expression):
+        return {"expression": str(value)}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict):
+        return Expression(value["expression"])
+    return value
+
+
+def _simple_pattern(pattern: str) -> str:
+    """
+    returns a withName pattern matching the last segment of fully qualified
+    process names, e.g. `!.*:(FASTQC|MULTIQC)` -> `!(FASTQC|MULTIQC)`
+    """
+    negate = "!" if pattern.startswith("!") else ""
+    # the last ':' outside of brackets of each alternative
+    segments, depth, start = [], 0, len(negate)
+    for pos, char in enumerate(pattern + "|"):
+        if char in "([":
+            depth += 1
+        elif char in ")]":
+            depth -= 1
+        elif char == ":" and not depth:
+            start = pos + 1
+        elif char == "|" and not depth:
+            segments.append(pattern[start:pos])
+            start = pos + 1
+    return negate + "|".join(segments)
+
+
+def _selects(pattern: str, candidates) -> bool:
+    negate = pattern.startswith("!")
+    if negate:
+        pattern = pattern[1:]
+    try:
+        matched = any(re.fullmatch(pattern, candidate) for candidate in candidates)
+    except re.error:
+        matched = pattern in candidates
+    return matched != negate
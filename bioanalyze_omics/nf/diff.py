@@ -0,0 +1,97 @@
+from collections import namedtuple
+import io
+import os
+from os import path
+import subprocess
+import tarfile
+
+# added and removed hold processes, changed holds (old, new) process pairs
+WorkflowDiff = namedtuple(
+    "WorkflowDiff", ["added", "removed", "changed", "manifest", "removed_manifest"]
+)
+
+
+def export_git_ref(repository: str, ref: str, directory: str) -> str:
+    """
+    writes the tree of a git ref to directory without touching the working
+    tree of repository and returns directory
+
+    :param: repository: path to a git repository
+    :param: ref: branch, tag or commit, e.g. 3.12.0
+    :param: directory: empty directory to write the tree to
+    """
+    archive = subprocess.run(
+        ["git", "-C", repository, "archive", "--format=tar", ref],
+        check=True,
+        stdout=subprocess.PIPE,
+    ).stdout
+    os.makedirs(directory, exist_ok=True)
+    with tarfile.open(fileobj=io.BytesIO(archive)) as tar:
+        if hasattr(tarfile, "data_filter"):
+            tar.extractall(directory, filter="data")
+        else:
+            tar.extractall(directory)
+    return directory
+
+
+def _process_keys(workflow) -> dict:
+    # processes are matched by name, and by name and path relative to the
+    # project when a name is defined more than once
+    processes = workflow.processes
+    counts = dict()
+    for process in processes:
+        counts[process.name] = counts.get(process.name, 0) + 1
+
+    keyed = dict()
+    for process in processes:
+        key = process.name
+        if counts[key] > 1 and process.nf_file:
+            relative_path = path.relpath(process.nf_file, workflow._project_path)
+            key = f"{process.name}@{relative_path}"
+        keyed[key] = process
+    return keyed
+
+
+def diff_workflows(old, new, substitutions=None) -> WorkflowDiff:
+    """
+    compares the processes of two revisions of a workflow
+
+    a process changed when its container or any other directive changed.
+    manifest lists the container images of new that old does not use, i.e.
+    the images that still have to be mirrored, removed_manifest the images
+    only old uses.
+
+    :param: old: NextflowWorkflow of the previous revision
+    :param: new: NextflowWorkflow of the new revision
+    :param: substitutions: container substitutions applied to both manifests
+    """
+    old_processes = _process_keys(old)
+    new_processes = _process_keys(new)
+
+    added = [
+        process for key, process in new_processes.items() if key not in old_processes
+    ]
+    removed = [
+        process for key, process in old_processes.items() if key not in new_processes
+    ]
+    changed = []
+    for key, process in new_processes.items():
+        previous = old_processes.get(key)
+        if previous is None:
+            continue
+        if (
+            previous.container != process.container
+            or previous.directives != process.directives
+        ):
+            changed.append((previous, process))
+
+    old_manifest = set(old.get_container_manifest(substitutions=substitutions))
+    new_manifest = set(new.get_container_manifest(substitutions=substitutions))
+
+    return WorkflowDiff(
+        added=added,
+        removed=removed,
+        changed=changed,
+        manifest=sorted(new_manifest - old_manifest),
+        removed_manifest=sorted(old_manifest - new_manifest),
+    )
@@ -0,0 +1,71 @@
+from collections import deque
+import re
+from os import path
+import warnings
+
+from bioanalyze_omics.nf.lexer import strip_comments
+
+# include { FOO; BAR as BAZ } from './modules/foo'
+_INCLUDE = re.compile(
+    r"""\binclude\s*\{[^}]*\}\s*from\s*(['"])(.+?)\1""", flags=re.DOTALL
+)
+
+# implicit variables that may prefix include paths
+_PROJECT_DIR = re.compile(r"\$\{?(projectDir|baseDir)\}?")
+_MODULE_DIR = re.compile(r"\$\{?moduleDir\}?")
+
+
+def find_includes(contents: str) -> list:
+    """
+    returns the source paths of all include statements in contents
+    """
+    return [match.group(2) for match in _INCLUDE.finditer(strip_comments(contents))]
+
+
+def _resolve_include(source: str, nf_file: str, project_path: str) -> str:
+    if source.startswith("plugin/"):
+        # plugin includes are provided by nextflow itself
+        return None
+
+    source = _PROJECT_DIR.sub(lambda _: project_path, source)
+    source = _MODULE_DIR.sub(lambda _: path.dirname(nf_file), source)
+    if not path.isabs(source):
+        source = path.join(path.dirname(nf_file), source)
+
+    for candidate in (source, source + ".nf", path.join(source, "main.nf")):
+        if candidate.endswith(".nf") and path.isfile(candidate):
+            return path.normpath(candidate)
+
+    warnings.warn(
+        f"unable to resolve include '{source}' in file '{nf_file}'", UserWarning
+    )
+    return None
+
+
+def resolve_includes(entry_script: str, project_path: str = None) -> list:
+    """
+    returns the sorted list of *.nf files reachable from entry_script by
+    following include statements, including entry_script itself
+
+    :param: entry_script: path to the workflow entry script, e.g. main.nf
+    :param: project_path: path substituted for $projectDir, defaults to the
+        directory of entry_script
+    """
+    entry_script = path.normpath(entry_script)
+    if project_path is None:
+        project_path = path.dirname(entry_script)
+
+    reachable = {entry_script}
+    queue = deque([entry_script])
+    while queue:
+        nf_file = queue.popleft()
+        with open(nf_file, "r") as file:
+            sources = find_includes(file.read())
+
+        for source in sources:
+            included = _resolve_include(source, nf_file, project_path)
+            if included and included not in reachable:
+                reachable.add(included)
+                queue.append(included)
+
+    return sorted(reachable)
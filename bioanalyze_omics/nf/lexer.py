@@ -0,0 +1,347 @@
+from bisect import bisect_left, bisect_right
+from collections import namedtuple
+import re
+from string import ascii_letters, digits
+
+# maximal runs of non-whitespace characters
+_NON_SPACE = re.compile(r"\S+")
+
+# tokens that change the lexical state of groovy code
+_CODE = re.compile(
+    "|".join(
+        [
+            "//",
+            r"/\*",
+            '"""',
+            "'''",
+            "[\"'/{}]",
+            r"(?<![\w.$])process\s+(\w+)\s*\{",
+        ]
+    )
+)
+
+# escapes, interpolations and terminators of each kind of string literal
+_STRINGS = {
+    '"': re.compile(r'\\.|\$\{|"|\n', flags=re.DOTALL),
+    '"""': re.compile(r'\\.|\$\{|"""', flags=re.DOTALL),
+    "'": re.compile(r"\\.|'|\n", flags=re.DOTALL),
+    "'''": re.compile(r"\\.|'''", flags=re.DOTALL),
+    "/": re.compile(r"\\.|/|\n", flags=re.DOTALL),
+}
+
+# a '/' following one of these characters is division rather than the start
+# of a slashy string
+_OPERANDS = set(ascii_letters + digits + "_)]}\"'")
+
+ProcessBlock = namedtuple("ProcessBlock", ["name", "body", "start_line", "end_line"])
+
+
+def _scan_source(contents: str):
+    """
+    walks groovy source once, skipping over string literals, and yields
+    ("comment", start, end), ("open", pos), ("close", pos) and
+    ("process", start, brace, name) events for code outside of strings
+
+    braces inside ${} interpolations are balanced internally and not yielded
+    """
+    n = len(contents)
+    pos = 0
+    literal = None  # pattern of the string literal being scanned
+    stack = []  # (literal, depth) of the strings enclosing an interpolation
+    depth = 0  # brace depth inside the current interpolation
+    while pos < n:
+        if literal is not None:
+            match = literal.search(contents, pos)
+            if match is None:
+                break
+            token = match.group(0)
+            pos = match.end()
+            if token == "${":
+                stack.append((literal, depth))
+                literal = None
+                depth = 0
+            elif token[0] != "\\":
+                literal = None
+            continue
+
+        match = _CODE.search(contents, pos)
+        if match is None:
+            break
+        token = match.group(0)
+        start = match.start()
+        pos = match.end()
+
+        if token == "//":
+            end = contents.find("\n", start)
+            pos = n if end < 0 else end
+            yield ("comment", start, pos)
+        elif token == "/*":
+            end = contents.find("*/", pos)
+            pos = n if end < 0 else end + 2
+            yield ("comment", start, pos)
+        elif token == "/":
+            ix = start - 1
+            while ix >= 0 and contents[ix] in " \t\r\n":
+                ix -= 1
+            if ix < 0 or contents[ix] not in _OPERANDS:
+                literal = _STRINGS["/"]
+        elif token in _STRINGS:
+            literal = _STRINGS[token]
+        elif token == "{":
+            if stack:
+                depth += 1
+            else:
+                yield ("open", start)
+        elif token == "}":
+            if not stack:
+                yield ("close", start)
+            elif depth:
+                depth -= 1
+            else:
+                literal, depth = stack.pop()
+        elif not stack:
+            yield ("process", start, pos - 1, match.group(1))
+
+
+def strip_comments(contents: str) -> str:
+    """
+    removes line and block comments from groovy source, leaving string
+    literals such as 'https://...' or "${params.input}/*.fastq" intact
+
+    newlines inside block comments are kept so that line numbers of the
+    stripped source match the original
+    """
+    parts = []
+    pos = 0
+    for event in _scan_source(contents):
+        if event[0] == "comment":
+            _, start, end = event
+            parts.append(contents[pos:start])
+            parts.append("\n" * contents.count("\n", start, end))
+            pos = end
+
+    parts.append(contents[pos:])
+    return "".join(parts)
+
+
+def find_process_blocks(contents: str) -> list:
+    """
+    returns a ProcessBlock for every top-level process definition in contents
+
+    process bodies extend to their matching closing brace, ignoring braces in
+    strings and comments. start_line and end_line are the 1-based lines of
+    the process keyword and of the closing brace.
+    """
+    blocks = []
+    depth = 0
+    current = None  # (name, start, body start) of the open process
+
+    line = 1
+    line_pos = 0
+
+    def line_of(pos):
+        nonlocal line, line_pos
+        line += contents.count("\n", line_pos, pos)
+        line_pos = pos
+        return line
+
+    for event in _scan_source(contents):
+        kind = event[0]
+        if kind == "process":
+            if depth == 0:
+                current = (event[3], line_of(event[1]), event[2] + 1)
+            depth += 1
+        elif kind == "open":
+            depth += 1
+        elif kind == "close" and depth:
+            depth -= 1
+            if depth == 0 and current:
+                name, start_line, body_start = current
+                body = contents[body_start : event[1]]
+                blocks.append(ProcessBlock(name, body, start_line, line_of(event[1])))
+                current = None
+
+    return blocks
+
+
+class DirectiveScanner:
+    """
+    single-pass scanner for the directives and stanzas of a process body
+
+    the body is walked once as a sequence of whitespace-delimited runs.
+    a directive starts where a token ends a run (e.g. `container` followed
+    by whitespace) and extends up to the next run that begins with any
+    known token. `script:` and `stub:` sections extend up to the next
+    process stanza keyword or the end of the body.
+    """
+
+    def __init__(self, directives: list, syntax: list, keywords: list) -> None:
+        self._syntax = list(syntax)
+        self._terminal = {"script", "stub"}
+
+        # tokens that end a directive value
+        self._stop_tokens = set(directives + syntax + keywords)
+        self._stop_lengths = dict()
+        for token in sorted(self._stop_tokens, key=len):
+            lengths = self._stop_lengths.setdefault(token[0], [])
+            if len(token) not in lengths:
+                lengths.append(len(token))
+
+        # tokens that start a directive value, stanzas are suffixed with ':'
+        self._start_tokens = {token: token for token in directives + keywords}
+        self._start_tokens.update({token + ":": token for token in syntax})
+        self._start_lengths = dict()
+        for key in sorted(self._start_tokens, key=len):
+            lengths = self._start_lengths.setdefault(key[-1], [])
+            if len(key) not in lengths:
+                lengths.append(len(key))
+
+        self._stanza = re.compile("|".join(self._syntax))
+        self._token_patterns = dict()
+
+    def scan(self, body: str) -> dict:
+        """
+        returns a dict of token -> list of stripped values in body order
+        """
+        n = len(body)
+        runs = [(match.start(), match.end()) for match in _NON_SPACE.finditer(body)]
+
+        stops = []  # positions of runs beginning with a token
+        stop_gaps = []  # start of the whitespace preceding each stop
+        starts = {}  # token -> [(token start, value start, end of leading whitespace)]
+
+        prev_end = 0
+        for ix, (start, end) in enumerate(runs):
+            lengths = self._stop_lengths.get(body[start])
+            if lengths and start > 0:
+                for length in lengths:
+                    if body[start : start + length] in self._stop_tokens:
+                        stops.append(start)
+                        stop_gaps.append(prev_end)
+                        break
+
+            lengths = self._start_lengths.get(body[end - 1])
+            if lengths and end < n:
+                for length in lengths:
+                    if length > end - start:
+                        break
+                    token = self._start_tokens.get(body[end - length : end])
+                    if token:
+                        space_end = runs[ix + 1][0] if ix + 1 < len(runs) else n
+                        starts.setdefault(token, []).append(
+                            (end - length, end, space_end)
+                        )
+            prev_end = end
+
+        directives = dict()
+        stanzas = None
+        for token, candidates in starts.items():
+            if token in self._terminal:
+                if stanzas is None:
+                    stanzas = [match.start() for match in self._stanza.finditer(body)]
+                values = self._scan_terminal(body, candidates, stanzas)
+            else:
+                values = self._scan_directive(body, candidates, stops, stop_gaps)
+
+            if values:
+                directives[token] = values
+
+        return directives
+
+    def scan_token(self, body: str, token: str) -> list:
+        """
+        returns the values of a single token, the same as scan(body).get(token)
+        but the body is only walked from the first occurrence of the token up
+        to the end of its last value
+        """
+        key = token + ":" if token in self._syntax else token
+        pattern = self._token_patterns.get(key)
+        if pattern is None:
+            pattern = self._token_patterns[key] = re.compile(re.escape(key) + r"(?=\s)")
+
+        n = len(body)
+        candidates = []
+        for match in pattern.finditer(body):
+            space = _NON_SPACE.search(body, match.end())
+            candidates.append(
+                (match.start(), match.end(), space.start() if space else n)
+            )
+
+        if not candidates:
+            return []
+
+        if token in self._terminal:
+            stanzas = [
+                match.start()
+                for match in self._stanza.finditer(body, candidates[0][2] + 1)
+            ]
+            return self._scan_terminal(body, candidates, stanzas)
+
+        # the value of the last candidate ends at the first stop past it
+        last_space_end = candidates[-1][2]
+        stops = []
+        stop_gaps = []
+        prev_end = candidates[0][1]
+        for match in _NON_SPACE.finditer(body, candidates[0][2]):
+            start = match.start()
+            if self._is_stop(body, start):
+                stops.append(start)
+                stop_gaps.append(prev_end)
+                if start > last_space_end:
+                    break
+            prev_end = match.end()
+
+        return self._scan_directive(body, candidates, stops, stop_gaps)
+
+    def _is_stop(self, body: str, start: int) -> bool:
+        lengths = self._stop_lengths.get(body[start])
+        if lengths:
+            for length in lengths:
+                if body[start : start + length] in self._stop_tokens:
+                    return True
+        return False
+
+    @staticmethod
+    def _scan_directive(body, candidates, stops, stop_gaps) -> list:
+        values = []
+        pos = 0
+        for token_start, value_start, space_end in candidates:
+            if token_start < pos:
+                # values of the same token never overlap
+                continue
+
+            ix = bisect_right(stops, space_end)
+            if ix < len(stops):
+                values.append(body[value_start : stop_gaps[ix]].strip())
+                pos = stops[ix]
+            elif space_end - value_start >= 3 and _contains(stops, space_end):
+                # the token is directly followed by another one and nothing else
+                values.append("")
+                pos = space_end
+
+        return values
+
+    @staticmethod
+    def _scan_terminal(body, candidates, stanzas) -> list:
+        n = len(body)
+        values = []
+        pos = 0
+        for token_start, value_start, space_end in candidates:
+            if token_start < pos:
+                continue
+
+            if space_end < n:
+                ix = bisect_left(stanzas, space_end + 1)
+                end = stanzas[ix] if ix < len(stanzas) else n
+                values.append(body[value_start:end].strip())
+                pos = end
+            elif space_end - value_start >= 2:
+                values.append("")
+                pos = n
+
+        return values
+
+
+def _contains(positions: list, value: int) -> bool:
+    ix = bisect_left(positions, value)
+    return ix < len(positions) and positions[ix] == value
@@ -0,0 +1,258 @@
+import ast
+from collections import namedtuple
+import operator
+import re
+
+# HealthOmics instance families by GiB of memory per vCPU, and their sizes by
+# vCPUs. gpu instances are not considered
+OMICS_INSTANCE_FAMILIES: dict = {"c": 2, "m": 4, "r": 8}
+OMICS_INSTANCE_SIZES: dict = {
+    "large": 2,
+    "xlarge": 4,
+    "2xlarge": 8,
+    "4xlarge": 16,
+    "8xlarge": 32,
+    "12xlarge": 48,
+    "16xlarge": 64,
+    "24xlarge": 96,
+}
+
+OmicsInstance = namedtuple("OmicsInstance", ["name", "cpus", "memory_gib"])
+
+# smallest first, by vCPUs and then memory
+OMICS_INSTANCES: list = sorted(
+    (
+        OmicsInstance(f"omics.{family}.{size}", cpus, cpus * gib_per_cpu)
+        for family, gib_per_cpu in OMICS_INSTANCE_FAMILIES.items()
+        for size, cpus in OMICS_INSTANCE_SIZES.items()
+    ),
+    key=lambda instance: (instance.cpus, instance.memory_gib),
+)
+
+ProcessResources = namedtuple(
+    "ProcessResources",
+    [
+        "name",
+        "cpus",
+        "memory_gib",
+        "time_hours",
+        "instance",
+        "usd_per_hour",
+        "max_cost",
+    ],
+)
+
+# nextflow memory units in GiB and duration units in hours
+_UNITS = {
+    "memory": {
+        "B": 1 / 1024 ** 3,
+        "KB": 1 / 1024 ** 2,
+        "MB": 1 / 1024,
+        "GB": 1,
+        "TB": 1024,
+        "PB": 1024 ** 2,
+    },
+    "time": {
+        "ms": 1 / 3_600_000,
+        "millis": 1 / 3_600_000,
+        "s": 1 / 3600,
+        "sec": 1 / 3600,
+        "second": 1 / 3600,
+        "seconds": 1 / 3600,
+        "m": 1 / 60,
+        "min": 1 / 60,
+        "minute": 1 / 60,
+        "minutes": 1 / 60,
+        "h": 1,
+        "hour": 1,
+        "hours": 1,
+        "d": 24,
+        "day": 24,
+        "days": 24,
+    },
+    "cpus": {},
+}
+
+# 6.GB, 6 GB, '4h', 1.5.h
+_QUANTITY = re.compile(r"(?<![\w.])(\d+(?:\.\d+)?)\s*\.?\s*([A-Za-z]+)\b")
+_QUANTITIES = re.compile(r"(?:\s*\d+(?:\.\d+)?\s*\.?\s*[A-Za-z]+\s*)+")
+_CHECK_MAX = re.compile(r"check_max\s*\((.*),\s*['\"](\w+)['\"]\s*\)", flags=re.DOTALL)
+_PARAMS = re.compile(r"\bparams\.(\w+)")
+_RESOURCE_LIMIT = re.compile(r"\b(cpus|memory|time)\s*:\s*([^,\]]+)")
+
+_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.FloorDiv: operator.floordiv,
+    ast.USub: operator.neg,
+}
+
+
+def _arithmetic(node):
+    if isinstance(node, ast.Expression):
+        return _arithmetic(node.body)
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)):
+        return node.value
+    if isinstance(node, ast.BinOp) and type(node.op) in _OPERATORS:
+        left, right = _arithmetic(node.left), _arithmetic(node.right)
+        return _OPERATORS[type(node.op)](left, right)
+    if isinstance(node, ast.UnaryOp) and type(node.op) in _OPERATORS:
+        return _OPERATORS[type(node.op)](_arithmetic(node.operand))
+    raise ValueError("not an arithmetic expression")
+
+
+def _unit(units: dict, unit: str, kind: str) -> float:
+    # memory units are case insensitive, duration units are not
+    return units.get(unit.upper() if kind == "memory" else unit)
+
+
+def evaluate_resource(value, kind: str, attempt: int = 1, params: dict = None):
+    """
+    evaluates a cpus, memory or time setting to a number of cpus, GiB or
+    hours. returns None for settings that can not be evaluated statically,
+    e.g. ternaries or settings depending on the size of inputs
+
+    :param: value: setting or directive value, e.g. 2, '6 GB', 4.h or
+        { check_max( 6.GB * task.attempt, 'memory' ) }
+    :param: kind: one of cpus, memory or time
+    :param: attempt: value of task.attempt
+    :param: params: workflow params, used by params.* and check_max
+    """
+    if value is None or isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, (list, tuple)):
+        # repeated directives, the last one wins
+        return evaluate_resource(value[-1], kind, attempt=attempt, params=params)
+
+    params = params or dict()
+    text = str(value).strip()
+    if text.startswith("{") and text.endswith("}"):
+        text = text[1:-1].strip()
+    quoted = len(text) > 1 and text[0] == text[-1] and text[0] in "'\""
+    if quoted and "$" not in text:
+        text = text[1:-1].strip()
+
+    match = _CHECK_MAX.fullmatch(text)
+    if match:
+        result = evaluate_resource(match.group(1), kind, attempt, params)
+        maximum = evaluate_resource(
+            params.get(f"max_{match.group(2)}"), kind, attempt, params
+        )
+        if result is not None and maximum is not None:
+            result = min(result, maximum)
+        return result
+
+    units = _UNITS[kind]
+    if units and _QUANTITIES.fullmatch(text):
+        # '1d 2h'
+        total = 0.0
+        for number, unit in _QUANTITY.findall(text):
+            factor = _unit(units, unit, kind)
+            if factor is None:
+                return None
+            total += float(number) * factor
+        return total
+
+    unknown = []
+
+    def quantity(match):
+        number, unit = match.groups()
+        factor = _unit(units, unit, kind)
+        if factor is None:
+            unknown.append(unit)
+            return match.group(0)
+        return repr(float(number) * factor)
+
+    def param(match):
+        result = evaluate_resource(params.get(match.group(1)), kind, attempt, params)
+        if result is None:
+            unknown.append(match.group(0))
+            return match.group(0)
+        return repr(result)
+
+    text = _QUANTITY.sub(quantity, text)
+    text = _PARAMS.sub(param, text)
+    text = re.sub(r"\btask\.attempt\b", str(attempt), text)
+    if unknown:
+        return None
+
+    try:
+        return float(_arithmetic(ast.parse(text, mode="eval")))
+    except (SyntaxError, ValueError, TypeError, ZeroDivisionError):
+        return None
+
+
+def find_instance(cpus: float, memory_gib: float) -> OmicsInstance:
+    """
+    returns the smallest HealthOmics instance with at least cpus vCPUs and
+    memory_gib GiB of memory, or None when no instance is large enough
+    """
+    for instance in OMICS_INSTANCES:
+        if instance.cpus >= (cpus or 0) and instance.memory_gib >= (memory_gib or 0):
+            return instance
+    return None
+
+
+def _resource_limits(value, attempt: int, params: dict) -> dict:
+    # resourceLimits = [ cpus: 16, memory: 128.GB, time: 240.h ]
+    limits = dict()
+    for kind, limit in _RESOURCE_LIMIT.findall(str(value or "")):
+        limits[kind] = evaluate_resource(limit.strip(), kind, attempt, params)
+    return limits
+
+
+def resolve_resources(
+    name: str,
+    settings: dict,
+    params: dict = None,
+    pricing: dict = None,
+    attempt: int = 1,
+) -> ProcessResources:
+    """
+    returns the effective resources of a process and the HealthOmics instance
+    that fits them. processes without a cpus setting use 1 cpu.
+
+    :param: name: name of the process
+    :param: settings: cpus, memory, time and resourceLimits settings of the
+        process, see NextflowConfig.process_settings
+    :param: params: workflow params
+    :param: pricing: instance pricing, see OmicsRun.get_pricing
+    :param: attempt: value of task.attempt
+    """
+    settings = settings or dict()
+    limits = _resource_limits(settings.get("resourceLimits"), attempt, params)
+
+    resources = dict()
+    for kind in ("cpus", "memory", "time"):
+        value = evaluate_resource(settings.get(kind), kind, attempt, params)
+        if value is not None and limits.get(kind) is not None:
+            value = min(value, limits[kind])
+        resources[kind] = value
+    if resources["cpus"] is None:
+        resources["cpus"] = 1.0
+
+    instance = find_instance(resources["cpus"], resources["memory"])
+    usd_per_hour = None
+    if pricing and instance and instance.name in pricing:
+        usd_per_hour = float(
+            pricing[instance.name]["priceDimensions"]["pricePerUnit"]["USD"]
+        )
+
+    # the time directive bounds how long a task may run
+    max_cost = None
+    if usd_per_hour is not None and resources["time"] is not None:
+        max_cost = usd_per_hour * resources["time"]
+
+    return ProcessResources(
+        name=name,
+        cpus=resources["cpus"],
+        memory_gib=resources["memory"],
+        time_hours=resources["time"],
+        instance=instance.name if instance else None,
+        usd_per_hour=usd_per_hour,
+        max_cost=max_cost,
+    )
@@ -0,0 +1,108 @@
+from collections import namedtuple
+from functools import lru_cache
+import re
+
+# upper bound for the number of distinct directives and uris kept resolved.
+# nf-core pipelines repeat the same few hundred container directives
+CACHE_SIZE: int = 4096
+
+_QUOTED = re.compile("^(['\"])")
+
+# spot check of several nf-core workflows shows container directives use a
+# ternary definition to select between singularity and docker
+_DOCKER_URI = re.compile("(\\:|params.ecr_registry \\+)\\s+?'(.+?)'")
+
+
+class ImageURI(namedtuple("ImageURI", ["registry", "repository", "tag", "digest"])):
+    """
+    a container image reference split into its parts
+
+    registry is empty for images without an explicit registry host, tag and
+    digest are None when not given. str() returns the reference it was
+    parsed from.
+    """
+
+    __slots__ = ()
+
+    @property
+    def name(self) -> str:
+        """
+        the reference without its registry, e.g. biocontainers/fastqc:0.12.1--0
+        """
+        name = self.repository
+        if self.tag is not None:
+            name = f"{name}:{self.tag}"
+        if self.digest is not None:
+            name = f"{name}@{self.digest}"
+        return name
+
+    def __str__(self) -> str:
+        if self.registry:
+            return f"{self.registry}/{self.name}"
+        return self.name
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def resolve_container(container: str) -> str:
+    """
+    returns the docker image uri selected by a container directive
+
+    :param: container: value of a container directive, either a uri or a
+        ternary expression choosing between singularity and docker images
+    """
+    # check if provided a quoted string and strip bounding quotes
+    if _QUOTED.match(container):
+        container = container[1:-1]
+
+    # only look for public docker container uri
+    match = _DOCKER_URI.search(container)
+    if match:
+        return match.group(2)
+
+    # there are edge cases where a "simple" container directive is used - e.g.
+    # only a URI string
+    return container
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_image_uri(uri: str) -> ImageURI:
+    """
+    splits an image uri into registry, repository, tag and digest
+
+    the first path component is the registry if it looks like a host, i.e.
+    contains a '.' or ':' or is localhost, the same rule docker applies.
+    """
+    digest = None
+    if "@" in uri:
+        uri, digest = uri.split("@", 1)
+
+    registry = ""
+    repository = uri
+    if "/" in uri:
+        host, remainder = uri.split("/", 1)
+        if "." in host or ":" in host or host == "localhost":
+            registry, repository = host, remainder
+
+    tag = None
+    head, sep, last = repository.rpartition("/")
+    if ":" in last:
+        last, tag = last.split(":", 1)
+        repository = head + sep + last
+
+    return ImageURI(registry, repository, tag, digest)
+
+
+def normalize_containers(containers: list) -> list:
+    """
+    resolves and parses a batch of container directives
+
+    returns an ImageURI for each directive in containers, in order, or None
+    for empty ones. repeated directives are only resolved once.
+
+    :param: containers: container directive values or image uris
+    """
+    images = dict()
+    for container in containers:
+        if container and container not in images:
+            images[container] = parse_image_uri(resolve_container(container))
+    return [images.get(container) if container else None for container in containers]
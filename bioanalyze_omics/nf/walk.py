@@ -0,0 +1,56 @@
+from fnmatch import fnmatch
+import os
+from os import path
+
+# directories that never hold workflow definitions but can hold millions of
+# files after a local run. hidden directories (.git, .nextflow, ...) are
+# always skipped
+DEFAULT_PRUNE: tuple = ("work", "results", "node_modules", "__pycache__")
+
+
+def _ignored(name: str, relative_path: str, patterns) -> bool:
+    return any(
+        fnmatch(name, pattern) or fnmatch(relative_path, pattern)
+        for pattern in patterns
+    )
+
+
+def walk_nf_files(
+    project_path: str, ignore: list = None, prune: tuple = DEFAULT_PRUNE
+) -> list:
+    """
+    returns the sorted list of *.nf files under project_path
+
+    :param: project_path: directory to search
+    :param: ignore: glob patterns of files and directories to skip, matched
+        against both the name and the path relative to project_path
+    :param: prune: names of directories that are never descended into
+    """
+    patterns = list(ignore or [])
+    prune = set(prune or [])
+
+    nf_files = []
+    stack = [(project_path, "")]
+    while stack:
+        directory, relative_directory = stack.pop()
+        try:
+            entries = list(os.scandir(directory))
+        except (FileNotFoundError, NotADirectoryError, PermissionError):
+            continue
+
+        for entry in entries:
+            relative_path = path.join(relative_directory, entry.name)
+            if entry.is_dir(follow_symlinks=False):
+                if (
+                    entry.name.startswith(".")
+                    or entry.name in prune
+                    or _ignored(entry.name, relative_path, patterns)
+                ):
+                    continue
+                stack.append((entry.path, relative_path))
+            elif entry.name.endswith(".nf") and not _ignored(
+                entry.name, relative_path, patterns
+            ):
+                nf_files.append(entry.path)
+
+    return sorted(nf_files)
@@ -1,8 +1,14 @@
 import os
 import argparse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime, timezone
 from glob import glob
 import base64
 import json
+import tempfile
+import threading
+import time
 from typing import List, Any, Optional
 from os import path
 from textwrap import dedent
@@ -11,7 +17,18 @@ import boto3
 import docker
 
 from bioanalyze_omics.nf import NextflowWorkflow
-from bioanalyze_omics.resources.account import get_aws_account_id
+from bioanalyze_omics.nf.cache import ParseCache
+from bioanalyze_omics.nf.catalog import WorkflowCatalog
+from bioanalyze_omics.nf.diff import diff_workflows, export_git_ref
+from bioanalyze_omics.nf.uri import normalize_containers
+from bioanalyze_omics.resources.registry import (
+    MANIFEST_MEDIA_TYPES,
+    EcrDestination,
+    LayerIndex,
+    RegistryClient,
+    copy_image,
+    split_reference,
+)
 from rich.console import Console
 from rich.table import Table
 
@@ -62,19 +79,162 @@ POLICY = """{
     ]
 }"""
 
+# registries whose name is dropped from the ECR repository name of a mirrored image
+PUBLIC_REGISTRIES = ("quay.io", "docker.io", "registry.hub.docker.com")
+
+# docker pulls and pushes images through the local docker daemon, registry
+# copies their blobs from the source registry to ECR directly
+MIRROR_ENGINES = ("docker", "registry")
+
+
+def aws_session(aws_region: str = None, aws_profile: str = None) -> boto3.Session:
+    """
+    returns a boto3 session. the default profile is left to the default
+    credential chain, so environment variables and instance roles are used
+    on machines without an AWS config file
+    """
+    if aws_profile == "default":
+        aws_profile = None
+    return boto3.Session(profile_name=aws_profile, region_name=aws_region)
+
+
+class MirrorContext:
+    """
+    clients and credentials shared by all images of a mirroring run
+
+    the ECR, STS, docker and source registry clients are created once, the
+    account id is looked up once and the ECR auth token is reused until
+    shortly before it expires. safe to share between threads
+    """
 
-def create_ecr_repo(repo_name: str) -> str:
+    # renew the ECR auth token when it expires within this many seconds
+    TOKEN_RENEWAL_SECONDS = 15 * 60
+
+    def __init__(
+        self, aws_region: str = None, aws_profile: str = None, docker_client=None
+    ) -> None:
+        """
+        :param: aws_region: region of the ECR repositories
+        :param: aws_profile: AWS profile of the ECR repositories
+        :param: docker_client: docker client to use, created from the
+            environment when first needed when None
+        """
+        self.session = aws_session(aws_region=aws_region, aws_profile=aws_profile)
+        self.aws_region = self.session.region_name or aws_region
+        self.ecr_client = self.session.client("ecr")
+        self.sts_client = self.session.client("sts")
+        self._docker_client = docker_client
+        self._registries = dict()
+        self._ecr_destination = None
+        self._ecr_destination_auth = None
+        # blobs copied by the registry engine during the run
+        self.layer_index = LayerIndex()
+        self._account_id = None
+        self._auth = None
+        self._lock = threading.Lock()
+
+    @property
+    def docker_client(self):
+        with self._lock:
+            if self._docker_client is None:
+                self._docker_client = docker.from_env()
+            return self._docker_client
+
+    def source_registry(self, registry: str) -> RegistryClient:
+        """
+        returns the client of a source registry, anonymous
+        """
+        with self._lock:
+            if registry not in self._registries:
+                self._registries[registry] = RegistryClient(registry)
+            return self._registries[registry]
+
+    @property
+    def account_id(self) -> str:
+        with self._lock:
+            if self._account_id is None:
+                self._account_id = self.sts_client.get_caller_identity()["Account"]
+            return self._account_id
+
+    def repository_uri(self, repo_name: str) -> str:
+        return f"{self.account_id}.dkr.ecr.{self.aws_region}.amazonaws.com/{repo_name}"
+
+    def _authorization(self) -> dict:
+        # the current ECR auth token, renewed when it expires soon. called
+        # with the lock held
+        if self._auth is not None:
+            remaining = self._auth["expires_at"] - datetime.now(timezone.utc)
+            if remaining.total_seconds() > self.TOKEN_RENEWAL_SECONDS:
+                return self._auth
+
+        token = self.ecr_client.get_authorization_token()
+        authorization = token["authorizationData"][0]
+        username, password = (
+            base64.b64decode(authorization["authorizationToken"]).decode().split(":")
+        )
+        self._auth = {
+            "auth_config": {"username": username, "password": password},
+            "registry": authorization["proxyEndpoint"],
+            "expires_at": authorization["expiresAt"],
+            "logged_in": False,
+        }
+        return self._auth
+
+    def auth_config(self) -> dict:
+        """
+        returns the username and password of the ECR registry, logging the
+        docker client in whenever a new auth token is issued
+        """
+        docker_client = self.docker_client
+        with self._lock:
+            auth = self._authorization()
+            if not auth["logged_in"]:
+                try:
+                    docker_client.login(
+                        auth["auth_config"]["username"],
+                        auth["auth_config"]["password"],
+                        registry=auth["registry"],
+                    )
+                except Exception as e:
+                    log.warning(f"Error authenticating Docker client with ECR. {e}")
+                auth["logged_in"] = True
+            return auth["auth_config"]
+
+    @property
+    def ecr_destination(self) -> EcrDestination:
+        """
+        destination of the registry engine, mounting blobs across
+        repositories through the registry API of ECR with the current token
+        """
+        registry = self.repository_uri("").rstrip("/")
+        with self._lock:
+            auth = self._authorization()
+            if self._ecr_destination is None or self._ecr_destination_auth is not auth:
+                self._ecr_destination = EcrDestination(
+                    self.ecr_client,
+                    registry=RegistryClient(
+                        registry,
+                        username=auth["auth_config"]["username"],
+                        password=auth["auth_config"]["password"],
+                    ),
+                )
+                self._ecr_destination_auth = auth
+            return self._ecr_destination
+
+
+def create_ecr_repo(repo_name: str, ecr_client=None) -> str:
     """
     Create an ECR repository if it doesn't exist.
 
     Parameters:
     - repo_name (str): The name of the ECR repository to be created.
+    - ecr_client: ECR client to use, a new one is created when None.
 
     Returns:
     - bool: True if the repository was created or already exists, False otherwise.
     """
     # Create an ECR client
-    ecr_client = boto3.client("ecr")
+    ecr_client = ecr_client or boto3.client("ecr")
 
     # Check if the repository already exists
     try:
@@ -99,36 +259,45 @@ def create_ecr_repo(repo_name: str) -> str:
 # create_ecr_repo(repo_name)
 
 
-def tag_and_push_to_ecr(source_image_uri, ecr_image_uri, ecr_image_tag="latest"):
-    # 1. Tag the Docker image with the ECR repository URI
-    docker_client = docker.from_env()
-    image_tagged = f"{ecr_image_uri}:{ecr_image_tag}"
+def pull_image(source_image_uri, docker_client=None):
+    """
+    pulls an image and returns it. falls back to a local image of the same
+    name when the pull fails
 
+    :param: source_image_uri: image to pull, e.g. quay.io/biocontainers/fastqc:0.12.1
+    :param: docker_client: docker client to use, a new one is created when None
+    """
+    docker_client = docker_client or docker.from_env()
     try:
-        docker_client.images.pull(source_image_uri)
+        return docker_client.images.pull(source_image_uri)
     except Exception as e:
         log.warning(f"Error pulling image: {e}")
+    return docker_client.images.get(source_image_uri)
+
 
+def push_to_ecr(
+    source_image_uri,
+    ecr_image_uri,
+    ecr_image_tag="latest",
+    context: MirrorContext = None,
+):
+    """
+    tags a pulled image with the ECR repository URI and pushes it
+
+    :param: source_image_uri: pulled image, see pull_image
+    :param: ecr_image_uri: URI of the ECR repository
+    :param: ecr_image_tag: tag of the pushed image
+    :param: context: clients and credentials of the mirroring run
+    """
+    context = context or MirrorContext()
+
+    # 1. Tag the Docker image with the ECR repository URI
+    docker_client = context.docker_client
+    image_tagged = f"{ecr_image_uri}:{ecr_image_tag}"
     docker_client.images.get(source_image_uri).tag(image_tagged)
 
     # 2. Authenticate Docker client with ECR
-    ecr_client = boto3.client("ecr")
-    token = ecr_client.get_authorization_token()
-    username, password = (
-        base64.b64decode(token["authorizationData"][0]["authorizationToken"])
-        .decode()
-        .split(":")
-    )
-    registry = token["authorizationData"][0]["proxyEndpoint"]
-
-    try:
-        docker_client.login(
-            username,
-            password,
-            registry=registry,
-        )
-    except Exception as e:
-        log.warning(f"Error authenticating Docker client with ECR. {e}")
+    auth_config = context.auth_config()
 
     # 3. Push the tagged image to ECR
     try:
@@ -136,9 +305,13 @@ def tag_and_push_to_ecr(source_image_uri, ecr_image_uri, ecr_image_tag="latest")
         for line in docker_client.images.push(
             image_tagged,
             stream=True,
-            auth_config={"username": username, "password": password},
+            decode=True,
+            auth_config=auth_config,
         ):
-            log.info(line.decode("utf-8").strip())
+            # the daemon reports failed pushes in the stream, not as an error
+            if "error" in line:
+                raise docker.errors.APIError(line["error"])
+            log.debug(line)
         log.info(f"Image '{image_tagged}' pushed to ECR successfully.")
     except docker.errors.APIError as e:
         log.fatal(f"Error pushing image to ECR: {e}")
@@ -146,8 +319,21 @@ def tag_and_push_to_ecr(source_image_uri, ecr_image_uri, ecr_image_tag="latest")
     return True
 
 
-def apply_omics_ecr_policy(repo_name: str):
-    client = boto3.client("ecr")
+def tag_and_push_to_ecr(
+    source_image_uri,
+    ecr_image_uri,
+    ecr_image_tag="latest",
+    context: MirrorContext = None,
+):
+    context = context or MirrorContext()
+    pull_image(source_image_uri, docker_client=context.docker_client)
+    return push_to_ecr(
+        source_image_uri, ecr_image_uri, ecr_image_tag=ecr_image_tag, context=context
+    )
+
+
+def apply_omics_ecr_policy(repo_name: str, ecr_client=None):
+    client = ecr_client or boto3.client("ecr")
     try:
         response = client.set_repository_policy(
             repositoryName=repo_name, policyText=POLICY, force=True
@@ -157,36 +343,416 @@ def apply_omics_ecr_policy(repo_name: str):
     return
 
 
+# an image to mirror, repository is the name of its ECR repository and uri
+# the URI of that repository
+MirrorTarget = namedtuple("MirrorTarget", ["source", "repository", "uri", "tag"])
+
+# status is one of pushed, up to date or failed, error names the failed stage.
+# bytes are only counted by the registry engine, bytes_mounted are the bytes
+# of blobs mounted from another repository instead of being uploaded again
+MirrorResult = namedtuple(
+    "MirrorResult",
+    [
+        "source",
+        "image",
+        "status",
+        "error",
+        "pull_seconds",
+        "push_seconds",
+        "bytes_copied",
+        "bytes_skipped",
+        "bytes_mounted",
+    ],
+)
+
+
+def _create_repository(target: MirrorTarget, context: MirrorContext):
+    if create_ecr_repo(target.repository, ecr_client=context.ecr_client) is False:
+        raise RuntimeError(f"unable to create ECR repository {target.repository}")
+    apply_omics_ecr_policy(target.repository, ecr_client=context.ecr_client)
+
+
+def _pull_stage(target: MirrorTarget, context: MirrorContext) -> float:
+    # creates the repository while the image is pulled, returns the seconds
+    # the stage took
+    started = time.perf_counter()
+    _create_repository(target, context)
+    pull_image(target.source, docker_client=context.docker_client)
+    return time.perf_counter() - started
+
+
+def _push_stage(target: MirrorTarget, context: MirrorContext) -> float:
+    started = time.perf_counter()
+    if not push_to_ecr(
+        target.source, target.uri, ecr_image_tag=target.tag, context=context
+    ):
+        raise RuntimeError(f"unable to push {target.uri}:{target.tag}")
+    return time.perf_counter() - started
+
+
+def _copy_stage(target: MirrorTarget, context: MirrorContext) -> tuple:
+    # returns the seconds the copy took and its CopyResult
+    started = time.perf_counter()
+    _create_repository(target, context)
+    registry, repository, reference = split_reference(target.source)
+    copy = copy_image(
+        context.source_registry(registry),
+        repository,
+        reference,
+        context.ecr_destination,
+        target.repository,
+        target.tag,
+        index=context.layer_index,
+    )
+    return time.perf_counter() - started, copy
+
+
+def _copy_images(
+    targets: List[MirrorTarget], context: MirrorContext, workers: int
+) -> list:
+    results = dict()
+    with ThreadPoolExecutor(max_workers=workers) as copies:
+        copied = {
+            copies.submit(_copy_stage, target, context): target for target in targets
+        }
+        for future in as_completed(copied):
+            target = copied[future]
+            image = f"{target.uri}:{target.tag}"
+            try:
+                seconds, copy = future.result()
+            except Exception as e:
+                log.error(f"Error copying {target.source}: {e}")
+                results[target] = MirrorResult(
+                    target.source,
+                    image,
+                    "failed",
+                    f"copy: {e}",
+                    None,
+                    None,
+                    None,
+                    None,
+                    None,
+                )
+                continue
+            results[target] = MirrorResult(
+                target.source,
+                image,
+                "pushed",
+                None,
+                None,
+                seconds,
+                copy.bytes_copied,
+                copy.bytes_skipped,
+                copy.bytes_mounted,
+            )
+    return [results[target] for target in targets]
+
+
+def mirror_images(
+    targets: List[MirrorTarget],
+    context: MirrorContext,
+    workers: int = 4,
+    engine: str = "docker",
+) -> list:
+    """
+    pulls and pushes images concurrently and returns a MirrorResult per
+    target, in the order of targets
+
+    with the docker engine, pulls and pushes run in two pools of workers
+    threads each, the push of an image is queued as soon as its pull
+    completes, so pulls of the next images overlap with pushes. the registry
+    engine streams the blobs of workers images at once from their source
+    registries to ECR, see copy_image. an image failing does not stop the
+    others.
+
+    :param: targets: images to mirror
+    :param: context: clients and credentials shared by all workers
+    :param: workers: maximum number of concurrent pulls, and of pushes
+    :param: engine: one of MIRROR_ENGINES
+    """
+    if engine == "registry":
+        return _copy_images(targets, context, workers)
+
+    results = dict()
+    with ThreadPoolExecutor(max_workers=workers) as pulls, ThreadPoolExecutor(
+        max_workers=workers
+    ) as pushes:
+        pulled = {
+            pulls.submit(_pull_stage, target, context): target for target in targets
+        }
+        pushed = dict()
+        for future in as_completed(pulled):
+            target = pulled[future]
+            try:
+                pull_seconds = future.result()
+            except Exception as e:
+                log.error(f"Error pulling {target.source}: {e}")
+                results[target] = MirrorResult(
+                    target.source,
+                    None,
+                    "failed",
+                    f"pull: {e}",
+                    None,
+                    None,
+                    None,
+                    None,
+                    None,
+                )
+                continue
+            push = pushes.submit(_push_stage, target, context)
+            pushed[push] = (target, pull_seconds)
+
+        for future in as_completed(pushed):
+            target, pull_seconds = pushed[future]
+            image = f"{target.uri}:{target.tag}"
+            try:
+                push_seconds = future.result()
+            except Exception as e:
+                log.error(f"Error pushing {image}: {e}")
+                results[target] = MirrorResult(
+                    target.source,
+                    image,
+                    "failed",
+                    f"push: {e}",
+                    pull_seconds,
+                    None,
+                    None,
+                    None,
+                    None,
+                )
+                continue
+            results[target] = MirrorResult(
+                target.source,
+                image,
+                "pushed",
+                None,
+                pull_seconds,
+                push_seconds,
+                None,
+                None,
+                None,
+            )
+    return [results[target] for target in targets]
+
+
+def list_ecr_images(targets: List[MirrorTarget], ecr_client) -> dict:
+    """
+    returns the images of ECR tagged like targets, by (repository, tag)
+
+    repositories are listed once, and the tags of each existing repository
+    are fetched with one batch_get_image call per 100 tags
+
+    :param: targets: images to mirror
+    :param: ecr_client: ECR client
+    """
+    repositories = set()
+    for page in ecr_client.get_paginator("describe_repositories").paginate():
+        repositories.update(
+            repository["repositoryName"] for repository in page["repositories"]
+        )
+
+    tags = dict()
+    for target in targets:
+        if target.repository in repositories:
+            tags.setdefault(target.repository, set()).add(target.tag)
+
+    images = dict()
+    for repository, repository_tags in tags.items():
+        image_ids = [{"imageTag": tag} for tag in sorted(repository_tags)]
+        for start in range(0, len(image_ids), 100):
+            response = ecr_client.batch_get_image(
+                repositoryName=repository,
+                imageIds=image_ids[start : start + 100],
+                acceptedMediaTypes=MANIFEST_MEDIA_TYPES,
+            )
+            for image in response["images"]:
+                images[(repository, image["imageId"]["imageTag"])] = image
+    return images
+
+
+def _is_mirrored(
+    target: MirrorTarget, ecr_image: dict, context: MirrorContext, engine: str
+) -> bool:
+    docker_client = context.docker_client if engine == "docker" else None
+    try:
+        if docker_client is not None:
+            digest = docker_client.images.get_registry_data(target.source).id
+        else:
+            registry, repository, reference = split_reference(target.source)
+            source = context.source_registry(registry)
+            digest = source.get_digest(repository, reference)
+    except Exception as e:
+        log.warning(f"Unable to look up the digest of {target.source}: {e}")
+        return False
+    if ecr_image["imageId"]["imageDigest"] == digest:
+        return True
+    if docker_client is None:
+        # the registry engine copies manifests unchanged
+        return False
+
+    # multi platform sources are pushed as the single platform image pulled
+    # earlier, which matches when the local image is the current source and
+    # the ECR manifest references its config
+    try:
+        local = docker_client.images.get(target.source)
+    except Exception:
+        return False
+    repo_digests = local.attrs.get("RepoDigests") or []
+    if not any(repo_digest.endswith(f"@{digest}") for repo_digest in repo_digests):
+        return False
+    manifest = json.loads(ecr_image.get("imageManifest") or "{}")
+    return manifest.get("config", {}).get("digest") == local.id
+
+
+def find_mirrored(
+    targets: List[MirrorTarget],
+    context: MirrorContext,
+    workers: int = 4,
+    engine: str = "docker",
+) -> set:
+    """
+    returns the targets whose tag in ECR already holds the current source
+    image, comparing the ECR digests with the digests of the source
+    registries. nothing is pulled
+
+    :param: targets: images to mirror
+    :param: context: clients of the mirroring run
+    :param: workers: number of source registry lookups run at once
+    :param: engine: one of MIRROR_ENGINES, the registry engine looks up
+        digests without the docker daemon
+    """
+    ecr_images = list_ecr_images(targets, context.ecr_client)
+    candidates = [
+        target for target in targets if (target.repository, target.tag) in ecr_images
+    ]
+    if not candidates:
+        return set()
+
+    with ThreadPoolExecutor(max_workers=workers) as lookups:
+        mirrored = lookups.map(
+            lambda target: _is_mirrored(
+                target, ecr_images[(target.repository, target.tag)], context, engine
+            ),
+            candidates,
+        )
+        return {
+            target for target, up_to_date in zip(candidates, mirrored) if up_to_date
+        }
+
+
+def _megabytes(size: int) -> str:
+    return f"{size / 1024**2:.1f}" if size is not None else ""
+
+
+def print_mirror_summary(results: List[MirrorResult]):
+    table = Table(title="Mirrored container images")
+    table.add_column("Image")
+    table.add_column("ECR image")
+    table.add_column("Status")
+    table.add_column("Pull (s)", justify="right")
+    table.add_column("Push (s)", justify="right")
+    table.add_column("Copied (MB)", justify="right")
+    table.add_column("Skipped (MB)", justify="right")
+    table.add_column("Mounted (MB)", justify="right")
+    table.add_column("Error")
+    for result in results:
+        table.add_row(
+            result.source,
+            result.image or "",
+            result.status,
+            f"{result.pull_seconds:.1f}" if result.pull_seconds is not None else "",
+            f"{result.push_seconds:.1f}" if result.push_seconds is not None else "",
+            _megabytes(result.bytes_copied),
+            _megabytes(result.bytes_skipped),
+            _megabytes(result.bytes_mounted),
+            result.error or "",
+        )
+    console = Console()
+    console.print(table)
+
+    failed = [result for result in results if result.status == "failed"]
+    if failed:
+        log.error(f"{len(failed)} of {len(results)} images failed to mirror")
+    copied = sum(result.bytes_copied or 0 for result in results)
+    if copied:
+        log.info(f"Copied {_megabytes(copied)} MB of blobs to ECR")
+    mounted = sum(result.bytes_mounted or 0 for result in results)
+    if mounted:
+        log.info(
+            f"Deduplication saved {_megabytes(mounted)} MB, blobs shared between "
+            "images were mounted instead of uploaded again"
+        )
+
+
 def create_ecrs(
     docker_image_names: List[str],
     tag_and_push_file: str,
     aws_region: str = os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
-):
-    client = boto3.client("ecr")
+    workers: int = 4,
+    skip_mirrored: bool = True,
+    aws_profile: str = None,
+    context: MirrorContext = None,
+    engine: str = "docker",
+) -> list:
+    """
+    creates an ECR repository with the omics policy for each image and
+    mirrors the images into them, see mirror_images
+
+    :param: docker_image_names: container image URIs of the manifest
+    :param: workers: maximum number of concurrent pulls, and of pushes
+    :param: skip_mirrored: skip images ECR already holds, see find_mirrored
+    :param: context: clients and credentials of the mirroring run, created
+        for aws_region and aws_profile when None
+    :param: engine: one of MIRROR_ENGINES
+    """
+    if engine not in MIRROR_ENGINES:
+        raise ValueError(f"engine must be one of {', '.join(MIRROR_ENGINES)}")
+    context = context or MirrorContext(aws_region=aws_region, aws_profile=aws_profile)
+    images = normalize_containers(docker_image_names)
+    targets = []
     with open(tag_and_push_file, "w") as fh:
         fh.write("#!/usr/bin/env bash\n\n")
-        for docker_image_name in docker_image_names:
-            docker_repo = docker_image_name
-            docker_image_name = docker_image_name.replace("quay.io/", "")
-            docker_image_name = docker_image_name.replace("docker.io/", "")
-            docker_image_name = docker_image_name.replace("registry.hub.docker.com", "")
-            tag = "latest"
-            if len(docker_image_name.split(":")) == 2:
-                tag = docker_image_name.split(":")[1]
-            docker_image_name = docker_image_name.split(":")[0]
-            create_ecr_repo(docker_image_name)
-            apply_omics_ecr_policy(docker_image_name)
-            account_id = get_aws_account_id()
-            ecr_repo_uri = (
-                f"{account_id}.dkr.ecr.{aws_region}.amazonaws.com/{docker_image_name}"
-            )
-            tag_and_push_to_ecr(
-                source_image_uri=docker_repo,
-                ecr_image_uri=ecr_repo_uri,
-                ecr_image_tag=tag,
+        for docker_repo, image in zip(docker_image_names, images):
+            if image is None:
+                continue
+            docker_image_name = image.repository
+            if image.registry and image.registry not in PUBLIC_REGISTRIES:
+                docker_image_name = "/".join([image.registry, image.repository])
+            tag = image.tag or "latest"
+            ecr_repo_uri = context.repository_uri(docker_image_name)
+            targets.append(
+                MirrorTarget(docker_repo, docker_image_name, ecr_repo_uri, tag)
             )
 
-    return
+    mirrored = set()
+    if skip_mirrored:
+        mirrored = find_mirrored(
+            targets, context=context, workers=workers, engine=engine
+        )
+        log.info(f"{len(mirrored)} of {len(targets)} images are already mirrored")
+
+    pending = [target for target in targets if target not in mirrored]
+    results = dict(
+        zip(
+            pending,
+            mirror_images(pending, context=context, workers=workers, engine=engine),
+        )
+    )
+    for target in mirrored:
+        results[target] = MirrorResult(
+            target.source,
+            f"{target.uri}:{target.tag}",
+            "up to date",
+            None,
+            None,
+            None,
+            None,
+            None,
+            None,
+        )
+    results = [results[target] for target in targets]
+    print_mirror_summary(results)
+    return results
 
 
 def append_omics_config(nf_workflow: str):
@@ -235,9 +801,26 @@ def inspect_nf(
     output_manifest_file: str = "container_image_manifest.json",
     nf_workflow: str = os.getcwd(),
     create_ecr: bool = True,
+    workers: int = 1,
+    cache: bool = True,
+    prune_unreachable: bool = True,
+    ignore: List[str] = None,
+    mirror_workers: int = 4,
+    skip_mirrored: bool = True,
+    engine: str = "docker",
 ):
-    session = boto3.Session(profile_name=aws_profile, region_name=aws_region)
-    workflow = NextflowWorkflow(nf_workflow)
+    session = aws_session(aws_region=aws_region, aws_profile=aws_profile)
+    # processes are streamed file by file and not kept in memory, the config
+    # pass reads the records of the manifest pass from the parse cache
+    workflow = NextflowWorkflow(
+        nf_workflow,
+        workers=workers,
+        cache=ParseCache() if cache else None,
+        main="main.nf" if prune_unreachable else None,
+        ignore=ignore,
+        memoize=False,
+        lazy=True,
+    )
 
     substitutions = None
     # if args.container_substitutions:
@@ -255,11 +838,13 @@ def inspect_nf(
         json.dump({"manifest": manifest}, file, indent=4)
 
     log.info(f"Creating nextflow config file: {output_config_file}")
-    config = workflow.get_omics_config(
-        session=session, substitutions=substitutions, namespace_config=namespace_config
-    )
     with open(output_config_file, "w") as file:
-        file.write(config)
+        workflow.write_omics_config(
+            file,
+            session=session,
+            substitutions=substitutions,
+            namespace_config=namespace_config,
+        )
 
     if create_ecr:
         log.info("Creating ECR repositories")
@@ -267,7 +852,152 @@ def inspect_nf(
             docker_image_names=manifest,
             tag_and_push_file="tag_and_push.sh",
             aws_region=aws_region,
+            workers=mirror_workers,
+            skip_mirrored=skip_mirrored,
+            aws_profile=aws_profile,
+            engine=engine,
         )
 
     append_omics_config(nf_workflow=nf_workflow)
     return
+
+
+def _workflow_revision(revision: str, repository: str, directory: str) -> str:
+    # a checkout directory or a git ref of repository
+    if path.isdir(revision):
+        return revision
+    return export_git_ref(repository, revision, directory)
+
+
+def inspect_nf_diff(
+    old: str,
+    new: str,
+    aws_region: str,
+    aws_profile: str = None,
+    repository: str = os.getcwd(),
+    output_config_file: str = "omics.diff.config",
+    output_manifest_file: str = "container_image_manifest.diff.json",
+    create_ecr: bool = True,
+    workers: int = 1,
+    cache: bool = True,
+    mirror_workers: int = 4,
+    skip_mirrored: bool = True,
+    engine: str = "docker",
+):
+    """
+    diffs two revisions of a workflow and only mirrors the container images
+    the new revision adds
+
+    :param: old: checkout directory or git ref of the previous revision
+    :param: new: checkout directory or git ref of the new revision
+    :param: repository: git repository that old and new refs belong to
+    """
+    session = aws_session(aws_region=aws_region, aws_profile=aws_profile)
+    parse_cache = ParseCache() if cache else None
+
+    with tempfile.TemporaryDirectory(prefix="bioanalyze_omics_diff_") as tmp:
+        old_workflow, new_workflow = [
+            NextflowWorkflow(
+                _workflow_revision(revision, repository, path.join(tmp, name)),
+                workers=workers,
+                cache=parse_cache,
+                lazy=True,
+            )
+            for name, revision in (("old", old), ("new", new))
+        ]
+        diff = diff_workflows(old_workflow, new_workflow)
+
+        table = Table(title=f"Processes changed from {old} to {new}")
+        table.add_column("Process")
+        table.add_column("Change")
+        table.add_column("Container")
+        for process in diff.added:
+            table.add_row(process.name, "added", process.container or "")
+        for process in diff.removed:
+            table.add_row(process.name, "removed", process.container or "")
+        for previous, process in diff.changed:
+            container = process.container or ""
+            if previous.container != process.container:
+                container = f"{previous.container} -> {process.container}"
+            table.add_row(process.name, "changed", container)
+        console = Console()
+        console.print(table)
+
+        log.info(f"Creating incremental image manifest: {output_manifest_file}")
+        with open(output_manifest_file, "w") as file:
+            json.dump(
+                {"manifest": diff.manifest, "removed": diff.removed_manifest},
+                file,
+                indent=4,
+            )
+
+        log.info(f"Creating nextflow config delta: {output_config_file}")
+        with open(output_config_file, "w") as file:
+            new_workflow.write_omics_config(
+                file,
+                session=session,
+                processes=diff.added + [process for _, process in diff.changed],
+            )
+
+    if create_ecr and diff.manifest:
+        log.info(f"Mirroring {len(diff.manifest)} new container images to ECR")
+        create_ecrs(
+            docker_image_names=diff.manifest,
+            tag_and_push_file="tag_and_push.sh",
+            aws_region=aws_region,
+            workers=mirror_workers,
+            skip_mirrored=skip_mirrored,
+            aws_profile=aws_profile,
+            engine=engine,
+        )
+    return diff
+
+
+def inspect_catalog(
+    nf_workflows: List[str],
+    aws_region: str,
+    aws_profile: str = None,
+    output_manifest_file: str = "container_image_manifest.json",
+    output_dir: str = os.getcwd(),
+    create_ecr: bool = True,
+    workers: int = 1,
+    cache: bool = True,
+    mirror_workers: int = 4,
+    skip_mirrored: bool = True,
+    engine: str = "docker",
+):
+    """
+    inspects many workflows together, parsing modules they share once, and
+    writes one container image manifest plus an omics.config per workflow
+    """
+    session = aws_session(aws_region=aws_region, aws_profile=aws_profile)
+    catalog = WorkflowCatalog(
+        nf_workflows, workers=workers, cache=ParseCache() if cache else None
+    )
+
+    stats = catalog.parse()
+    log.info(
+        f"Parsed {stats['parsed']} of {stats['distinct']} distinct *.nf files "
+        f"({stats['files']} files in {len(nf_workflows)} workflows)"
+    )
+
+    log.info(f"Creating container image manifest: {output_manifest_file}")
+    manifest = catalog.get_container_manifest()
+    with open(output_manifest_file, "w") as file:
+        json.dump({"manifest": manifest}, file, indent=4)
+
+    log.info(f"Creating nextflow config files in: {output_dir}")
+    catalog.write_omics_configs(output_dir, session=session)
+
+    if create_ecr:
+        log.info("Creating ECR repositories")
+        create_ecrs(
+            docker_image_names=manifest,
+            tag_and_push_file="tag_and_push.sh",
+            aws_region=aws_region,
+            workers=mirror_workers,
+            skip_mirrored=skip_mirrored,
+            aws_profile=aws_profile,
+            engine=engine,
+        )
+    return catalog
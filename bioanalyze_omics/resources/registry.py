@@ -0,0 +1,593 @@
+import base64
+from collections import namedtuple
+import hashlib
+import json
+import logging
+import re
+import threading
+from urllib.parse import urljoin
+
+import requests
+
+from bioanalyze_omics.nf.uri import parse_image_uri
+
+log = logging.getLogger("registry")
+
+"""
+Copy container images between registries over the OCI distribution API.
+
+Blobs are streamed from the source registry to the destination in chunks,
+nothing is written to local disk and no docker daemon is needed. Manifests
+are copied byte for byte, so mirrored images keep the digests of their
+source. Blobs shared by several images are uploaded once per run and
+mounted from the repository holding them into the others.
+"""
+
+MANIFEST_LIST_MEDIA_TYPES = (
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.index.v1+json",
+)
+
+# manifest media types accepted from registries, and that ECR returns
+# without converting them
+MANIFEST_MEDIA_TYPES = [
+    "application/vnd.docker.distribution.manifest.v2+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.oci.image.index.v1+json",
+]
+
+DOCKER_HUB = "registry-1.docker.io"
+DOCKER_HUB_ALIASES = ("", "docker.io", "index.docker.io", "registry.hub.docker.com")
+
+# size of the chunks blobs are streamed in
+CHUNK_SIZE = 1024 * 1024
+
+Manifest = namedtuple("Manifest", ["content", "media_type", "digest"])
+
+# bytes_mounted counts blobs mounted from another repository instead of
+# being uploaded again
+CopyResult = namedtuple(
+    "CopyResult",
+    [
+        "image",
+        "digest",
+        "blobs",
+        "copied",
+        "bytes_copied",
+        "bytes_skipped",
+        "bytes_mounted",
+    ],
+)
+
+
+def sha256_digest(content: bytes) -> str:
+    return f"sha256:{hashlib.sha256(content).hexdigest()}"
+
+
+def split_reference(uri: str) -> tuple:
+    """
+    returns the registry host, repository and tag or digest of an image uri,
+    resolving images without a registry to Docker Hub
+
+    :param: uri: image uri, e.g. quay.io/biocontainers/fastqc:0.12.1--hdfd78af_0
+    """
+    image = parse_image_uri(uri)
+    registry, repository = image.registry, image.repository
+    if registry in DOCKER_HUB_ALIASES:
+        registry = DOCKER_HUB
+        if "/" not in repository:
+            repository = f"library/{repository}"
+    return registry, repository, image.digest or image.tag or "latest"
+
+
+def blob_descriptors(manifest: dict) -> list:
+    """
+    returns the config and layer descriptors of an image manifest. foreign
+    layers, which registries do not store, are left out
+    """
+    blobs = []
+    if manifest.get("config"):
+        blobs.append(manifest["config"])
+    for layer in manifest.get("layers", []):
+        if not layer.get("urls"):
+            blobs.append(layer)
+    return blobs
+
+
+def rechunk(chunks, size: int):
+    """
+    regroups a stream of byte chunks into parts of size bytes, the last
+    part may be smaller
+    """
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while len(buffer) >= size:
+            yield bytes(buffer[:size])
+            del buffer[:size]
+    if buffer:
+        yield bytes(buffer)
+
+
+class RegistryClient:
+    """
+    client of the OCI distribution API of one registry
+
+    anonymous or basic credentials are exchanged for bearer tokens when the
+    registry asks for them, tokens are kept by scope. safe to share between
+    threads
+    """
+
+    def __init__(
+        self,
+        registry: str,
+        username: str = None,
+        password: str = None,
+        scheme: str = None,
+        session: requests.Session = None,
+    ) -> None:
+        """
+        :param: registry: registry host, e.g. quay.io or localhost:5000
+        :param: username: registry username, anonymous when None
+        :param: password: registry password
+        :param: scheme: http or https, http only for localhost by default
+        :param: session: requests session to use
+        """
+        if scheme is None:
+            local = registry.split(":")[0] in ("localhost", "127.0.0.1")
+            scheme = "http" if local else "https"
+        self.registry = registry
+        self.base_url = f"{scheme}://{registry}"
+        self.credentials = (username, password) if username is not None else None
+        self.session = session or requests.Session()
+        self._authorizations = dict()
+        self._lock = threading.Lock()
+
+    def _authorize(self, response: requests.Response, scope: str) -> str:
+        challenge = response.headers.get("WWW-Authenticate", "")
+        scheme, _, fields = challenge.partition(" ")
+        if scheme.lower() == "basic" and self.credentials:
+            username, password = self.credentials
+            basic = base64.b64encode(f"{username}:{password}".encode()).decode()
+            return f"Basic {basic}"
+        if scheme.lower() != "bearer":
+            response.raise_for_status()
+
+        fields = dict(re.findall(r'(\w+)="([^"]*)"', fields))
+        token_response = self.session.get(
+            fields["realm"],
+            params={"service": fields.get("service"), "scope": scope.split(" ")},
+            auth=self.credentials,
+        )
+        token_response.raise_for_status()
+        body = token_response.json()
+        return f"Bearer {body.get('token') or body.get('access_token')}"
+
+    def request(self, method: str, url: str, scope: str, **kwargs):
+        """
+        sends a request, authorizing for scope when the registry asks to
+
+        :param: url: path below the registry, e.g. /v2/, or an absolute url
+        :param: scope: token scope, e.g. repository:biocontainers/fastqc:pull,
+            several scopes are separated by spaces
+        """
+        url = urljoin(self.base_url, url)
+        headers = dict(kwargs.pop("headers", None) or dict())
+        with self._lock:
+            authorization = self._authorizations.get(scope)
+        if authorization:
+            headers["Authorization"] = authorization
+
+        response = self.session.request(method, url, headers=headers, **kwargs)
+        if response.status_code != 401:
+            return response
+
+        authorization = self._authorize(response, scope)
+        with self._lock:
+            self._authorizations[scope] = authorization
+        if not isinstance(kwargs.get("data"), (type(None), bytes, str, dict)):
+            # streamed bodies are used up by the first request and can not be
+            # sent twice. uploads are authorized by the request starting them,
+            # a token expiring in the middle of one fails the upload
+            response.raise_for_status()
+        headers["Authorization"] = authorization
+        return self.session.request(method, url, headers=headers, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+    @staticmethod
+    def scope(repository: str, actions: str = "pull") -> str:
+        return f"repository:{repository}:{actions}"
+
+    def get_manifest(self, repository: str, reference: str) -> Manifest:
+        """
+        returns the manifest of a tag or digest
+
+        :param: repository: repository in the registry, e.g. biocontainers/fastqc
+        :param: reference: tag or digest
+        """
+        response = self.request(
+            "GET",
+            f"/v2/{repository}/manifests/{reference}",
+            self.scope(repository),
+            headers={"Accept": ", ".join(MANIFEST_MEDIA_TYPES)},
+        )
+        response.raise_for_status()
+        content = response.content
+        media_type = response.headers.get("Content-Type", "").split(";")[0]
+        if not media_type or media_type == "application/json":
+            media_type = json.loads(content).get("mediaType", media_type)
+        return Manifest(content, media_type, sha256_digest(content))
+
+    def get_digest(self, repository: str, reference: str) -> str:
+        """
+        returns the digest of a tag, without downloading its manifest when
+        the registry reports it
+        """
+        response = self.request(
+            "HEAD",
+            f"/v2/{repository}/manifests/{reference}",
+            self.scope(repository),
+            headers={"Accept": ", ".join(MANIFEST_MEDIA_TYPES)},
+        )
+        response.raise_for_status()
+        digest = response.headers.get("Docker-Content-Digest")
+        return digest or self.get_manifest(repository, reference).digest
+
+    def iter_blob(self, repository: str, digest: str, chunk_size: int = CHUNK_SIZE):
+        """
+        streams a blob in chunks and checks its digest once it is read
+        """
+        response = self.request(
+            "GET",
+            f"/v2/{repository}/blobs/{digest}",
+            self.scope(repository),
+            stream=True,
+        )
+        response.raise_for_status()
+        algorithm, _, expected = digest.partition(":")
+        hasher = hashlib.new(algorithm)
+        with response:
+            for chunk in response.iter_content(chunk_size=chunk_size):
+                hasher.update(chunk)
+                yield chunk
+        if hasher.hexdigest() != expected:
+            raise ValueError(f"blob {digest} of {repository} does not match its digest")
+
+    def has_blob(self, repository: str, digest: str) -> bool:
+        response = self.request(
+            "HEAD",
+            f"/v2/{repository}/blobs/{digest}",
+            self.scope(repository, "pull,push"),
+        )
+        if response.status_code == 404:
+            return False
+        response.raise_for_status()
+        return True
+
+
+class LayerIndex:
+    """
+    run-wide index of the blobs present in a destination, by a repository
+    holding them
+
+    the first copy needing a blob uploads it, copies needing the same blob
+    at the same time wait for that upload and then mount the blob instead.
+    safe to share between threads
+    """
+
+    def __init__(self) -> None:
+        self._repositories = dict()
+        self._uploads = dict()
+        self._lock = threading.Lock()
+
+    def add(self, digest: str, repository: str):
+        with self._lock:
+            self._repositories.setdefault(digest, repository)
+
+    def acquire(self, digest: str) -> str:
+        """
+        returns a repository holding the blob, or None when the caller has
+        to upload it and release it afterwards
+        """
+        while True:
+            with self._lock:
+                if digest in self._repositories:
+                    return self._repositories[digest]
+                upload = self._uploads.get(digest)
+                if upload is None:
+                    self._uploads[digest] = threading.Event()
+                    return None
+            upload.wait()
+
+    def release(self, digest: str, repository: str = None):
+        """
+        ends the upload of a blob acquired before, repository is None when
+        the upload failed and the next copy needing the blob uploads it
+        """
+        with self._lock:
+            upload = self._uploads.pop(digest, None)
+            if repository is not None:
+                self._repositories.setdefault(digest, repository)
+        if upload is not None:
+            upload.set()
+
+
+def _mount_blob(
+    client: RegistryClient, repository: str, digest: str, from_repository: str
+) -> bool:
+    # registries that can not mount start a regular upload, which is
+    # cancelled
+    response = client.request(
+        "POST",
+        f"/v2/{repository}/blobs/uploads/",
+        " ".join(
+            [
+                client.scope(repository, "pull,push"),
+                client.scope(from_repository, "pull"),
+            ]
+        ),
+        params={"mount": digest, "from": from_repository},
+    )
+    if response.status_code == 201:
+        return True
+    if response.status_code == 202 and "Location" in response.headers:
+        client.request(
+            "DELETE",
+            urljoin(client.base_url, response.headers["Location"]),
+            client.scope(repository, "pull,push"),
+        )
+    return False
+
+
+class RegistryDestination:
+    """
+    pushes blobs and manifests to a registry over the OCI distribution API,
+    e.g. a local registry:2
+    """
+
+    def __init__(self, client: RegistryClient) -> None:
+        self.client = client
+
+    def missing_blobs(self, repository: str, digests: list) -> set:
+        return {
+            digest for digest in digests if not self.client.has_blob(repository, digest)
+        }
+
+    def mount_blob(self, repository: str, blob: dict, from_repository: str) -> bool:
+        """
+        mounts a blob of another repository of the registry, returns False
+        when the registry does not mount it
+        """
+        return _mount_blob(self.client, repository, blob["digest"], from_repository)
+
+    def upload_blob(self, repository: str, blob: dict, chunks) -> None:
+        """
+        uploads a blob streamed from chunks in one PATCH of a chunked upload
+        """
+        scope = self.client.scope(repository, "pull,push")
+        response = self.client.request(
+            "POST", f"/v2/{repository}/blobs/uploads/", scope
+        )
+        response.raise_for_status()
+        location = urljoin(self.client.base_url, response.headers["Location"])
+
+        response = self.client.request(
+            "PATCH",
+            location,
+            scope,
+            data=chunks,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        response.raise_for_status()
+        location = urljoin(self.client.base_url, response.headers["Location"])
+
+        response = self.client.request(
+            "PUT", location, scope, params={"digest": blob["digest"]}
+        )
+        response.raise_for_status()
+
+    def put_manifest(self, repository: str, reference: str, manifest: Manifest):
+        response = self.client.request(
+            "PUT",
+            f"/v2/{repository}/manifests/{reference}",
+            self.client.scope(repository, "pull,push"),
+            data=manifest.content,
+            headers={"Content-Type": manifest.media_type},
+        )
+        response.raise_for_status()
+
+
+class EcrDestination:
+    """
+    pushes blobs and manifests to ECR through the ECR API of boto3, blobs
+    are mounted across repositories through the registry API of ECR
+    """
+
+    def __init__(self, ecr_client, registry: RegistryClient = None) -> None:
+        """
+        :param: ecr_client: boto3 ECR client
+        :param: registry: client of the ECR registry, blobs are not mounted
+            when None
+        """
+        self.ecr_client = ecr_client
+        self.registry = registry
+
+    def missing_blobs(self, repository: str, digests: list) -> set:
+        missing = set()
+        for start in range(0, len(digests), 100):
+            response = self.ecr_client.batch_check_layer_availability(
+                repositoryName=repository, layerDigests=digests[start : start + 100]
+            )
+            for layer in response["layers"]:
+                if layer.get("layerAvailability") != "AVAILABLE":
+                    missing.add(layer["layerDigest"])
+            for failure in response.get("failures", []):
+                missing.add(failure["layerDigest"])
+        return missing
+
+    def mount_blob(self, repository: str, blob: dict, from_repository: str) -> bool:
+        """
+        mounts a blob of another ECR repository, returns False when it is
+        not mounted
+        """
+        if self.registry is None:
+            return False
+        try:
+            return _mount_blob(
+                self.registry, repository, blob["digest"], from_repository
+            )
+        except requests.RequestException as e:
+            log.debug(f"Unable to mount {blob['digest']} into {repository}: {e}")
+            return False
+
+    def upload_blob(self, repository: str, blob: dict, chunks) -> None:
+        """
+        uploads a blob streamed from chunks in parts of the size ECR asks for
+        """
+        upload = self.ecr_client.initiate_layer_upload(repositoryName=repository)
+        first_byte = 0
+        for part in rechunk(chunks, upload["partSize"]):
+            self.ecr_client.upload_layer_part(
+                repositoryName=repository,
+                uploadId=upload["uploadId"],
+                partFirstByte=first_byte,
+                partLastByte=first_byte + len(part) - 1,
+                layerPartBlob=part,
+            )
+            first_byte += len(part)
+        try:
+            self.ecr_client.complete_layer_upload(
+                repositoryName=repository,
+                uploadId=upload["uploadId"],
+                layerDigests=[blob["digest"]],
+            )
+        except self.ecr_client.exceptions.LayerAlreadyExistsException:
+            pass
+
+    def put_manifest(self, repository: str, reference: str, manifest: Manifest):
+        kwargs = {"imageDigest": reference}
+        if not reference.startswith("sha256:"):
+            kwargs = {"imageTag": reference, "imageDigest": manifest.digest}
+        try:
+            self.ecr_client.put_image(
+                repositoryName=repository,
+                imageManifest=manifest.content.decode("utf-8"),
+                imageManifestMediaType=manifest.media_type,
+                **kwargs,
+            )
+        except self.ecr_client.exceptions.ImageAlreadyExistsException:
+            pass
+
+
+def _copy_blobs(
+    source: RegistryClient,
+    source_repository: str,
+    destination,
+    repository: str,
+    manifest: Manifest,
+    index: LayerIndex,
+    totals: dict,
+):
+    blobs = blob_descriptors(json.loads(manifest.content))
+    missing = destination.missing_blobs(repository, [blob["digest"] for blob in blobs])
+    for blob in blobs:
+        digest, size = blob["digest"], blob.get("size", 0)
+        totals["blobs"] += 1
+        if digest not in missing:
+            index.add(digest, repository)
+            totals["bytes_skipped"] += size
+            continue
+        # an image may list a blob twice
+        missing.discard(digest)
+
+        holder = index.acquire(digest)
+        if holder == repository:
+            totals["bytes_skipped"] += size
+            continue
+        if holder is not None and destination.mount_blob(repository, blob, holder):
+            log.debug(f"Mounted {digest} from {holder} into {repository}")
+            totals["bytes_mounted"] += size
+            continue
+
+        log.debug(f"Copying {digest} to {repository}")
+        uploaded = False
+        try:
+            destination.upload_blob(
+                repository, blob, source.iter_blob(source_repository, digest)
+            )
+            uploaded = True
+        finally:
+            if holder is None:
+                index.release(digest, repository if uploaded else None)
+        totals["copied"] += 1
+        totals["bytes_copied"] += size
+
+
+def copy_image(
+    source: RegistryClient,
+    source_repository: str,
+    reference: str,
+    destination,
+    repository: str,
+    tag: str,
+    index: LayerIndex = None,
+) -> CopyResult:
+    """
+    copies an image, and every platform of multi platform images, from a
+    registry to a destination and returns the blobs and bytes copied
+
+    blobs the destination already has are skipped, blobs index knows in
+    another repository are mounted from there and the others are streamed
+    from source to destination without being stored locally.
+
+    :param: source: client of the source registry
+    :param: source_repository: repository in the source registry
+    :param: reference: tag or digest of the source image
+    :param: destination: RegistryDestination or EcrDestination
+    :param: repository: repository in the destination
+    :param: tag: tag of the copied image
+    :param: index: LayerIndex shared by the copies of a run
+    """
+    index = index or LayerIndex()
+    manifest = source.get_manifest(source_repository, reference)
+    totals = {
+        "blobs": 0,
+        "copied": 0,
+        "bytes_copied": 0,
+        "bytes_skipped": 0,
+        "bytes_mounted": 0,
+    }
+
+    if manifest.media_type in MANIFEST_LIST_MEDIA_TYPES:
+        for descriptor in json.loads(manifest.content).get("manifests", []):
+            platform_manifest = source.get_manifest(
+                source_repository, descriptor["digest"]
+            )
+            _copy_blobs(
+                source,
+                source_repository,
+                destination,
+                repository,
+                platform_manifest,
+                index,
+                totals,
+            )
+            destination.put_manifest(
+                repository, platform_manifest.digest, platform_manifest
+            )
+    else:
+        _copy_blobs(
+            source,
+            source_repository,
+            destination,
+            repository,
+            manifest,
+            index,
+            totals,
+        )
+
+    destination.put_manifest(repository, tag, manifest)
+    return CopyResult(image=f"{repository}:{tag}", digest=manifest.digest, **totals)
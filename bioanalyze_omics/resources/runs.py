@@ -19,6 +19,8 @@ import pandas as pd
 from rich.console import Console
 from rich.table import Table
 
+from bioanalyze_omics.nf import NextflowWorkflow
+
 MINIMUM_STORAGE_CAPACITY_GIB = 1200
 from rich.console import Console
 from rich.table import Table
@@ -356,3 +358,49 @@ def calculate_cost(
     # print(json.dumps(cost, indent=4, default=str))
     pprint(cost, expand_all=True)
     return cost
+
+
+def estimate_process_resources(
+    nf_workflow: str = os.getcwd(),
+    offering: str = None,
+    pricing: bool = True,
+    profile: str = None,
+    aws_region: str = os.environ.get("AWS_DEFAULT_REGION", "us-east-1"),
+):
+    """
+    prints the effective resources of each process of a nextflow workflow
+    and the HealthOmics instance it would run on, before submitting a run
+    """
+    workflow = NextflowWorkflow(nf_workflow, lazy=True)
+    instance_pricing = None
+    if pricing or offering:
+        session = boto3.Session(profile_name=profile, region_name=aws_region)
+        omics_runs = OmicsRun(client=session.client("omics"))
+        instance_pricing = omics_runs.get_pricing(offering=offering)
+
+    resources = workflow.get_process_resources(pricing=instance_pricing)
+
+    def _format(value, fmt="{:g}"):
+        return "" if value is None else fmt.format(value)
+
+    table = Table(title="Process resources")
+    table.add_column("Process")
+    table.add_column("CPUs", justify="right")
+    table.add_column("Memory (GiB)", justify="right")
+    table.add_column("Time (h)", justify="right")
+    table.add_column("Instance")
+    table.add_column("USD/h", justify="right")
+    table.add_column("Max cost (USD)", justify="right")
+    for process in resources:
+        table.add_row(
+            process.name,
+            _format(process.cpus),
+            _format(process.memory_gib),
+            _format(process.time_hours),
+            process.instance or "",
+            _format(process.usd_per_hour, "{:.4f}"),
+            _format(process.max_cost, "{:.2f}"),
+        )
+    console = Console()
+    console.print(table)
+    return resources
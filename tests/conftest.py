@@ -0,0 +1,21 @@
+"""Shared fixtures of the tests."""
+
+import pytest
+from tests.fakes import FakeRegistry
+
+
+@pytest.fixture
+def registries():
+    started = []
+
+    def start(token=False):
+        fake = FakeRegistry(token=token)
+        started.append(fake)
+        return fake
+
+    yield start
+    for fake in started:
+        for client in fake.clients:
+            client.close()
+        fake.server.shutdown()
+        fake.server.server_close()
@@ -0,0 +1,256 @@
+"""In memory fakes of registries and ECR shared by the tests."""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import json
+import re
+import threading
+import uuid
+from urllib.parse import parse_qs, urlparse
+
+from bioanalyze_omics.resources import registry
+from bioanalyze_omics.resources.registry import RegistryClient, sha256_digest
+
+MANIFEST_TYPE = "application/vnd.oci.image.manifest.v1+json"
+
+
+class FakeRegistry:
+    """
+    in memory stand-in of a registry:2 speaking the OCI distribution API,
+    optionally asking for bearer tokens
+    """
+
+    def __init__(self, token: bool = False) -> None:
+        self.token = token
+        # method of the next request rejected as if its token expired
+        self.expire = None
+        self.blobs = dict()
+        self.manifests = dict()
+        self.uploads = dict()
+        self.requests = []
+        self.clients = []
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.host = f"127.0.0.1:{self.server.server_port}"
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def client(self) -> RegistryClient:
+        client = RegistryClient(self.host)
+        self.clients.append(client)
+        return client
+
+    def add_blob(self, repository: str, content: bytes) -> dict:
+        digest = sha256_digest(content)
+        self.blobs[(repository, digest)] = content
+        return {
+            "mediaType": "application/octet-stream",
+            "digest": digest,
+            "size": len(content),
+        }
+
+    def add_manifest(self, repository, reference, manifest, media_type) -> str:
+        content = json.dumps(manifest).encode()
+        self.manifests[(repository, reference)] = (content, media_type)
+        self.manifests[(repository, sha256_digest(content))] = (content, media_type)
+        return sha256_digest(content)
+
+    def _handler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body=b"", headers=None):
+                self.send_response(status)
+                for name, value in (headers or dict()).items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if self.command != "HEAD":
+                    self.wfile.write(body)
+
+            def _body(self) -> bytes:
+                if self.headers.get("Transfer-Encoding") == "chunked":
+                    body = b""
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        chunk = self.rfile.read(size + 2)[:size]
+                        if not size:
+                            return body
+                        body += chunk
+                return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+            def _route(self):
+                url = urlparse(self.path)
+                fake.requests.append((self.command, url.path))
+                if url.path == "/token":
+                    return self._send(200, json.dumps({"token": "secret"}).encode())
+                expired = fake.expire == self.command
+                if expired:
+                    fake.expire = None
+                    self._body()
+                if expired or (
+                    fake.token and self.headers.get("Authorization") != "Bearer secret"
+                ):
+                    realm = f"http://{fake.host}/token"
+                    challenge = f'Bearer realm="{realm}",service="fake"'
+                    return self._send(401, headers={"WWW-Authenticate": challenge})
+
+                body = self._body()
+                match = re.match(r"^/v2/(.+)/blobs/uploads/(.*)$", url.path)
+                if match:
+                    repository, upload = match.groups()
+                    query = parse_qs(url.query)
+                    if "mount" in query:
+                        digest, source = query["mount"][0], query["from"][0]
+                        if (source, digest) in fake.blobs:
+                            fake.blobs[(repository, digest)] = fake.blobs[
+                                (source, digest)
+                            ]
+                            return self._send(201)
+                    if self.command == "DELETE":
+                        fake.uploads.pop(upload, None)
+                        return self._send(204)
+                    if self.command == "POST":
+                        upload = str(uuid.uuid4())
+                        fake.uploads[upload] = b""
+                    else:
+                        fake.uploads[upload] += body
+                    location = f"/v2/{repository}/blobs/uploads/{upload}"
+                    if self.command != "PUT":
+                        return self._send(202, headers={"Location": location})
+                    digest = query["digest"][0]
+                    content = fake.uploads.pop(upload)
+                    if sha256_digest(content) != digest:
+                        return self._send(400)
+                    fake.blobs[(repository, digest)] = content
+                    return self._send(201)
+
+                repository, kind, reference = re.match(
+                    r"^/v2/(.+)/(manifests|blobs)/(.+)$", url.path
+                ).groups()
+                if kind == "blobs":
+                    content = fake.blobs.get((repository, reference))
+                    if content is None:
+                        return self._send(404)
+                    return self._send(200, content)
+                if self.command == "PUT":
+                    media_type = self.headers["Content-Type"]
+                    fake.manifests[(repository, reference)] = (body, media_type)
+                    fake.manifests[(repository, sha256_digest(body))] = (
+                        body,
+                        media_type,
+                    )
+                    return self._send(201)
+                if (repository, reference) not in fake.manifests:
+                    return self._send(404)
+                content, media_type = fake.manifests[(repository, reference)]
+                headers = {
+                    "Content-Type": media_type,
+                    "Docker-Content-Digest": sha256_digest(content),
+                }
+                return self._send(200, content, headers)
+
+            do_GET = do_HEAD = do_PUT = do_POST = do_PATCH = do_DELETE = _route
+
+        return Handler
+
+
+class FakeEcr:
+    """
+    in memory stand-in of the boto3 ECR client, layers are pushed through
+    the layer upload API and manifests with put_image
+    """
+
+    class exceptions:
+        class LayerAlreadyExistsException(Exception):
+            pass
+
+        class ImageAlreadyExistsException(Exception):
+            pass
+
+        class RepositoryNotFoundException(Exception):
+            pass
+
+    def __init__(self, part_size: int = 1024) -> None:
+        self.part_size = part_size
+        self.layers = dict()
+        self.images = dict()
+        self.uploads = dict()
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def _call(self, name: str, **kwargs) -> None:
+        with self._lock:
+            self.calls.append((name, kwargs))
+
+    def count(self, name: str) -> int:
+        return len([call for call in self.calls if call[0] == name])
+
+    def batch_check_layer_availability(self, repositoryName, layerDigests):
+        self._call("batch_check_layer_availability", layerDigests=layerDigests)
+        layers, failures = [], []
+        for digest in layerDigests:
+            if (repositoryName, digest) in self.layers:
+                layers.append({"layerDigest": digest, "layerAvailability": "AVAILABLE"})
+            else:
+                failures.append(
+                    {"layerDigest": digest, "failureCode": "MissingLayerDigest"}
+                )
+        return {"layers": layers, "failures": failures}
+
+    def initiate_layer_upload(self, repositoryName):
+        self._call("initiate_layer_upload")
+        upload = str(uuid.uuid4())
+        self.uploads[upload] = []
+        return {"uploadId": upload, "partSize": self.part_size}
+
+    def upload_layer_part(
+        self, repositoryName, uploadId, partFirstByte, partLastByte, layerPartBlob
+    ):
+        self._call("upload_layer_part", size=len(layerPartBlob))
+        parts = self.uploads[uploadId]
+        assert partFirstByte == sum(len(part) for part in parts)
+        assert partLastByte == partFirstByte + len(layerPartBlob) - 1
+        parts.append(layerPartBlob)
+
+    def complete_layer_upload(self, repositoryName, uploadId, layerDigests):
+        self._call("complete_layer_upload", layerDigests=layerDigests)
+        content = b"".join(self.uploads.pop(uploadId))
+        assert sha256_digest(content) == layerDigests[0]
+        if (repositoryName, layerDigests[0]) in self.layers:
+            raise self.exceptions.LayerAlreadyExistsException()
+        self.layers[(repositoryName, layerDigests[0])] = content
+
+    def put_image(
+        self,
+        repositoryName,
+        imageManifest,
+        imageManifestMediaType,
+        imageDigest,
+        imageTag=None,
+    ):
+        self._call("put_image", imageTag=imageTag, imageDigest=imageDigest)
+        assert sha256_digest(imageManifest.encode()) == imageDigest
+        for digest in registry.blob_descriptors(json.loads(imageManifest)):
+            assert (repositoryName, digest["digest"]) in self.layers
+        image = {
+            "imageId": {"imageTag": imageTag, "imageDigest": imageDigest},
+            "imageManifest": imageManifest,
+            "imageManifestMediaType": imageManifestMediaType,
+        }
+        if self.images.get((repositoryName, imageTag or imageDigest)) == image:
+            raise self.exceptions.ImageAlreadyExistsException()
+        self.images[(repositoryName, imageTag or imageDigest)] = image
+
+
+def add_image(fake, repository, tag, layers):
+    config = fake.add_blob(
+        repository, json.dumps({"repository": repository, "tag": tag}).encode()
+    )
+    manifest = {
+        "schemaVersion": 2,
+        "mediaType": MANIFEST_TYPE,
+        "config": config,
+        "layers": [fake.add_blob(repository, layer) for layer in layers],
+    }
+    return fake.add_manifest(repository, tag, manifest, MANIFEST_TYPE)
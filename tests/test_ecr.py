@@ -0,0 +1,449 @@
+#!/usr/bin/env python
+
+"""Tests for `bioanalyze_omics.resources.ecr` module."""
+
+import base64
+from datetime import datetime, timedelta, timezone
+import logging
+import threading
+
+import pytest
+
+pytest.importorskip("boto3")
+pytest.importorskip("docker")
+pytest.importorskip("rich")
+
+from bioanalyze_omics.resources import ecr  # noqa: E402
+from bioanalyze_omics.resources.ecr import MirrorTarget  # noqa: E402
+from bioanalyze_omics.resources.registry import split_reference  # noqa: E402
+from tests.fakes import FakeEcr, add_image  # noqa: E402
+
+ACCOUNT = "123456789012"
+
+
+class FakeAwsEcr(FakeEcr):
+    """
+    FakeEcr with the repository, image and authorization APIs used while
+    mirroring images
+    """
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.repositories = set()
+        self.token_lifetime = timedelta(hours=12)
+
+    def describe_repositories(self, repositoryNames):
+        self._call("describe_repositories")
+        if not set(repositoryNames) <= self.repositories:
+            raise self.exceptions.RepositoryNotFoundException()
+        return {"repositories": [{"repositoryName": name} for name in repositoryNames]}
+
+    def describe_registry(self):
+        return {"registryId": ACCOUNT}
+
+    def create_repository(self, repositoryName):
+        self._call("create_repository")
+        self.repositories.add(repositoryName)
+
+    def set_repository_policy(self, repositoryName, policyText, force):
+        self._call("set_repository_policy")
+
+    def get_paginator(self, operation):
+        assert operation == "describe_repositories"
+        return self
+
+    def paginate(self):
+        self._call("paginate")
+        names = sorted(self.repositories)
+        return [
+            {"repositories": [{"repositoryName": name} for name in names[:1]]},
+            {"repositories": [{"repositoryName": name} for name in names[1:]]},
+        ]
+
+    def batch_get_image(self, repositoryName, imageIds, acceptedMediaTypes):
+        self._call("batch_get_image", imageIds=imageIds)
+        assert repositoryName in self.repositories
+        images = [
+            self.images[(repositoryName, image_id["imageTag"])]
+            for image_id in imageIds
+            if (repositoryName, image_id["imageTag"]) in self.images
+        ]
+        return {"images": images, "failures": []}
+
+    def add_image(self, repository, tag, digest, manifest="{}"):
+        self.repositories.add(repository)
+        self.images[(repository, tag)] = {
+            "imageId": {"imageTag": tag, "imageDigest": digest},
+            "imageManifest": manifest,
+        }
+
+    def get_authorization_token(self):
+        self._call("get_authorization_token")
+        password = f"token{self.count('get_authorization_token')}"
+        token = base64.b64encode(f"AWS:{password}".encode()).decode()
+        return {
+            "authorizationData": [
+                {
+                    "authorizationToken": token,
+                    "proxyEndpoint": f"https://{ACCOUNT}.dkr.ecr.us-east-1.amazonaws.com",
+                    "expiresAt": datetime.now(timezone.utc) + self.token_lifetime,
+                }
+            ]
+        }
+
+
+class FakeSts:
+    def __init__(self) -> None:
+        self.calls = 0
+
+    def get_caller_identity(self):
+        self.calls += 1
+        return {"Account": ACCOUNT}
+
+
+class FakeImage:
+    def __init__(self, images, image_id: str, repo_digests: list) -> None:
+        self.images = images
+        self.id = image_id
+        self.attrs = {"RepoDigests": repo_digests}
+
+    def tag(self, name: str) -> None:
+        self.images.local[name] = self
+
+
+class FakeImages:
+    """
+    images of a docker daemon, remote maps the images that can be pulled to
+    their registry digest and image id
+    """
+
+    def __init__(self) -> None:
+        self.remote = dict()
+        self.local = dict()
+        self.denied = set()
+        self.pushed = []
+        # called with the image uri when a pull or push starts
+        self.on_pull = self.on_push = lambda uri: None
+
+    def pull(self, uri):
+        self.on_pull(uri)
+        if uri not in self.remote:
+            raise Exception(f"manifest for {uri} not found")
+        digest, image_id = self.remote[uri]
+        repository = uri.rsplit(":", 1)[0]
+        self.local[uri] = FakeImage(self, image_id, [f"{repository}@{digest}"])
+        return self.local[uri]
+
+    def get(self, uri):
+        if uri not in self.local:
+            raise Exception(f"no such image: {uri}")
+        return self.local[uri]
+
+    def get_registry_data(self, uri):
+        if uri not in self.remote:
+            raise Exception(f"manifest for {uri} not found")
+        return type("RegistryData", (), {"id": self.remote[uri][0]})
+
+    def push(self, image, stream, decode, auth_config):
+        self.on_push(image)
+        assert image in self.local and auth_config["username"] == "AWS"
+        if image.rsplit(":", 1)[0].split("/", 1)[1] in self.denied:
+            yield {"error": "denied: not authorized"}
+            return
+        self.pushed.append(image)
+        yield {"status": "Pushed"}
+
+
+class FakeDocker:
+    def __init__(self) -> None:
+        self.images = FakeImages()
+        self.logins = []
+
+    def login(self, username, password, registry):
+        self.logins.append((username, password, registry))
+
+
+@pytest.fixture
+def context(monkeypatch):
+    clients = {"ecr": FakeAwsEcr(), "sts": FakeSts()}
+
+    class Session:
+        def __init__(self, profile_name=None, region_name=None) -> None:
+            self.profile_name = profile_name
+            self.region_name = region_name
+
+        def client(self, name):
+            return clients[name]
+
+    monkeypatch.setattr(ecr.boto3, "Session", Session)
+    return ecr.MirrorContext(aws_region="us-east-1", docker_client=FakeDocker())
+
+
+def _target(context, source, repository, tag="1") -> MirrorTarget:
+    return MirrorTarget(source, repository, context.repository_uri(repository), tag)
+
+
+def test_mirror_images_isolates_failures(context, caplog):
+    images = context.docker_client.images
+    for name in ("fastqc", "denied", "multiqc"):
+        images.remote[f"quay.io/biocontainers/{name}:1"] = (
+            f"sha256:{name}",
+            f"sha256:{name}-config",
+        )
+    images.denied.add("biocontainers/denied")
+    targets = [
+        _target(context, f"quay.io/biocontainers/{name}:1", f"biocontainers/{name}")
+        for name in ("fastqc", "missing", "denied", "multiqc")
+    ]
+
+    results = ecr.mirror_images(targets, context, workers=2)
+    assert [result.source for result in results] == [t.source for t in targets]
+    assert [result.status for result in results] == [
+        "pushed",
+        "failed",
+        "failed",
+        "pushed",
+    ]
+    fastqc, missing, denied, multiqc = results
+    assert fastqc.image == f"{targets[0].uri}:1" and fastqc.error is None
+    assert fastqc.pull_seconds is not None and fastqc.push_seconds is not None
+    assert missing.error.startswith("pull: ") and missing.image is None
+    assert denied.error.startswith("push: ")
+    assert denied.pull_seconds is not None and denied.push_seconds is None
+    assert sorted(images.pushed) == sorted([fastqc.image, multiqc.image])
+    # repositories are created while images are pulled
+    assert context.ecr_client.repositories == {t.repository for t in targets}
+
+    with caplog.at_level(logging.INFO, logger="ecr"):
+        ecr.print_mirror_summary(results)
+    assert "2 of 4 images failed to mirror" in caplog.text
+    assert "Copied" not in caplog.text
+
+
+def test_mirror_images_overlaps_pulls_and_pushes(context):
+    images = context.docker_client.images
+    names = ("fastqc", "multiqc", "samtools")
+    for name in names:
+        images.remote[f"quay.io/biocontainers/{name}:1"] = (
+            f"sha256:{name}",
+            f"sha256:{name}-config",
+        )
+
+    events, lock = [], threading.Lock()
+    pushing = threading.Event()
+
+    def on_pull(uri):
+        with lock:
+            events.append(("pull", uri.split("/")[-1]))
+        if "multiqc" in uri:
+            # only completes once the push of the first image started
+            pushing.wait(timeout=5)
+
+    def on_push(image):
+        with lock:
+            events.append(("push", image.split("/")[-1]))
+        pushing.set()
+
+    images.on_pull, images.on_push = on_pull, on_push
+    targets = [
+        _target(context, f"quay.io/biocontainers/{name}:1", f"biocontainers/{name}")
+        for name in names
+    ]
+    # a single pull worker, the first push has to run while the next pulls
+    results = ecr.mirror_images(targets, context, workers=1)
+    assert [result.status for result in results] == ["pushed"] * 3
+    assert events.index(("push", "fastqc:1")) < events.index(("pull", "samtools:1"))
+
+
+def test_mirror_images_registry_engine(context, registries, caplog):
+    source = registries()
+    layer = b"layer" * 100000
+    for name in ("fastqc", "multiqc"):
+        add_image(source, f"biocontainers/{name}", "1", [name.encode() + layer])
+    context.source_registry = lambda registry: source.client()
+    targets = [
+        _target(context, f"{source.host}/biocontainers/{name}:1", name)
+        for name in ("fastqc", "missing", "multiqc")
+    ]
+
+    results = ecr.mirror_images(targets, context, workers=2, engine="registry")
+    assert [result.status for result in results] == ["pushed", "failed", "pushed"]
+    fastqc, missing, multiqc = results
+    assert missing.error.startswith("copy: ") and missing.bytes_copied is None
+    assert fastqc.bytes_copied > len(layer) and fastqc.bytes_skipped == 0
+    assert fastqc.pull_seconds is None and fastqc.push_seconds is not None
+    assert ("fastqc", "1") in context.ecr_client.images
+    # nothing goes through the docker daemon
+    assert not context.docker_client.images.local
+
+    with caplog.at_level(logging.INFO, logger="ecr"):
+        ecr.print_mirror_summary(results)
+    assert "1 of 3 images failed to mirror" in caplog.text
+    copied = ecr._megabytes(fastqc.bytes_copied + multiqc.bytes_copied)
+    assert f"Copied {copied} MB of blobs to ECR" in caplog.text
+
+
+def test_list_ecr_images(context):
+    ecr_client = context.ecr_client
+    tags = [str(number) for number in range(150)]
+    for tag in tags:
+        ecr_client.add_image("fastqc", tag, f"sha256:fastqc{tag}")
+    ecr_client.add_image("multiqc", "1", "sha256:multiqc")
+    targets = [_target(context, f"fastqc:{tag}", "fastqc", tag) for tag in tags]
+    targets += [
+        _target(context, "multiqc:1", "multiqc"),
+        _target(context, "multiqc:2", "multiqc", "2"),
+        _target(context, "samtools:1", "samtools"),
+    ]
+
+    images = ecr.list_ecr_images(targets, ecr_client)
+    assert len(images) == 151
+    assert images[("multiqc", "1")]["imageId"]["imageDigest"] == "sha256:multiqc"
+    # repositories are listed once and their tags fetched 100 at a time
+    assert ecr_client.count("paginate") == 1
+    assert ecr_client.count("batch_get_image") == 3
+
+
+def _mirrored_images(context) -> list:
+    # fastqc and busybox are up to date, multiqc and bash changed since they
+    # were mirrored and samtools never was
+    ecr_client, images = context.ecr_client, context.docker_client.images
+    images.remote.update(
+        {
+            "quay.io/biocontainers/fastqc:1": ("sha256:fastqc", "sha256:fastqc-id"),
+            "quay.io/biocontainers/multiqc:1": ("sha256:multiqc2", "sha256:mqc-id"),
+            "quay.io/biocontainers/samtools:1": ("sha256:samtools", "sha256:st-id"),
+            "busybox:1": ("sha256:busybox-index", "sha256:busybox-id"),
+            "bash:1": ("sha256:bash-index", "sha256:bash-id"),
+        }
+    )
+    ecr_client.add_image("biocontainers/fastqc", "1", "sha256:fastqc")
+    ecr_client.add_image("biocontainers/multiqc", "1", "sha256:multiqc1")
+    # multi platform images are pushed as the platform image pulled earlier
+    for name in ("busybox", "bash"):
+        images.pull(f"{name}:1")
+        ecr_client.add_image(
+            name,
+            "1",
+            f"sha256:{name}-amd64",
+            manifest=f'{{"config": {{"digest": "sha256:{name}-id"}}}}',
+        )
+    images.remote["bash:1"] = ("sha256:bash-index2", "sha256:bash-id2")
+    return [
+        _target(context, "quay.io/biocontainers/fastqc:1", "biocontainers/fastqc"),
+        _target(context, "quay.io/biocontainers/multiqc:1", "biocontainers/multiqc"),
+        _target(context, "quay.io/biocontainers/samtools:1", "biocontainers/samtools"),
+        _target(context, "busybox:1", "busybox"),
+        _target(context, "bash:1", "bash"),
+    ]
+
+
+def test_find_mirrored(context):
+    fastqc, multiqc, samtools, busybox, bash = targets = _mirrored_images(context)
+    assert ecr.find_mirrored(targets, context, workers=2) == {fastqc, busybox}
+
+    ecr_images = ecr.list_ecr_images(targets, context.ecr_client)
+    assert samtools.repository not in context.ecr_client.repositories
+    # a digest mismatch without a local image of the source is not mirrored
+    assert not ecr._is_mirrored(
+        multiqc, ecr_images[("biocontainers/multiqc", "1")], context, "docker"
+    )
+    # the digest of a source that can not be looked up is unknown
+    del context.docker_client.images.remote[fastqc.source]
+    assert not ecr._is_mirrored(
+        fastqc, ecr_images[("biocontainers/fastqc", "1")], context, "docker"
+    )
+
+
+def test_find_mirrored_registry_engine(context, monkeypatch):
+    targets = _mirrored_images(context)
+    digests = {
+        split_reference(source)[1:]: digest
+        for source, (digest, _) in context.docker_client.images.remote.items()
+    }
+
+    class Source:
+        def get_digest(self, repository, reference):
+            return digests[(repository, reference)]
+
+    context.source_registry = lambda registry: Source()
+    context._docker_client = None
+    monkeypatch.setattr(ecr.docker, "from_env", pytest.fail)
+    # manifests are copied unchanged, there is no platform fallback
+    assert ecr.find_mirrored(targets, context, engine="registry") == {targets[0]}
+
+
+def test_mirror_context_shares_credentials(context):
+    images = context.docker_client.images
+    names = [f"tool{number}" for number in range(6)]
+    for name in names:
+        images.remote[f"quay.io/biocontainers/{name}:1"] = (
+            f"sha256:{name}",
+            f"sha256:{name}-id",
+        )
+    targets = [
+        _target(context, f"quay.io/biocontainers/{name}:1", f"biocontainers/{name}")
+        for name in names
+    ]
+
+    results = ecr.mirror_images(targets[:3], context, workers=3)
+    destination = context.ecr_destination
+    assert [result.status for result in results] == ["pushed"] * 3
+    # one account lookup, auth token and docker login for the run
+    assert context.sts_client.calls == 1
+    assert context.ecr_client.count("get_authorization_token") == 1
+    assert [login[1] for login in context.docker_client.logins] == ["token1"]
+    assert context.ecr_destination is destination
+
+    # a token about to expire is renewed and docker logs in again
+    context._auth["expires_at"] = datetime.now(timezone.utc) + timedelta(minutes=5)
+    results = ecr.mirror_images(targets[3:], context, workers=3)
+    assert [result.status for result in results] == ["pushed"] * 3
+    assert context.sts_client.calls == 1
+    assert context.ecr_client.count("get_authorization_token") == 2
+    assert [login[1] for login in context.docker_client.logins] == [
+        "token1",
+        "token2",
+    ]
+    assert context.ecr_destination is not destination
+    assert context.ecr_destination.registry.credentials == ("AWS", "token2")
+
+
+def test_mirror_context_default_profile(context):
+    # the default profile resolves credentials through the default chain
+    assert context.session.profile_name is None
+    default = ecr.MirrorContext(aws_profile="default", docker_client=FakeDocker())
+    assert default.session.profile_name is None
+    named = ecr.MirrorContext(aws_profile="omics", docker_client=FakeDocker())
+    assert named.session.profile_name == "omics"
+
+
+def test_inspect_nf_streams_processes(context, tmp_path, monkeypatch):
+    module = tmp_path / "modules" / "fastqc" / "main.nf"
+    module.parent.mkdir(parents=True)
+    module.write_text(
+        "process FASTQC {\n    container 'biocontainers/fastqc:0.11.9--0'\n"
+        "    script:\n    'fastqc'\n}\n"
+    )
+    (tmp_path / "nextflow.config").write_text("docker.registry = 'quay.io'\n")
+
+    workflows = []
+    workflow_class = ecr.NextflowWorkflow
+
+    def NextflowWorkflow(*args, **kwargs):
+        workflows.append(workflow_class(*args, **kwargs))
+        return workflows[-1]
+
+    monkeypatch.setattr(ecr, "NextflowWorkflow", NextflowWorkflow)
+    ecr.inspect_nf(
+        aws_region="us-east-1",
+        output_config_file=str(tmp_path / "omics.config"),
+        output_manifest_file=str(tmp_path / "manifest.json"),
+        nf_workflow=str(tmp_path),
+        create_ecr=False,
+        cache=False,
+        prune_unreachable=False,
+    )
+    assert "withName: 'FASTQC'" in (tmp_path / "omics.config").read_text()
+    # the processes are not kept once the files are written
+    assert workflows[0]._parsed == dict()
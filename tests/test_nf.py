@@ -0,0 +1,855 @@
+#!/usr/bin/env python
+
+"""Tests for `bioanalyze_omics.nf` package."""
+
+import gc
+import hashlib
+import json
+import pickle
+import shutil
+import sqlite3
+import subprocess
+
+import pytest
+from bioanalyze_omics import nf
+from bioanalyze_omics.nf import diff, lexer, sizing, uri
+from bioanalyze_omics.nf.cache import ParseCache
+from bioanalyze_omics.nf.catalog import WorkflowCatalog
+from bioanalyze_omics.nf.config import NextflowConfig
+from bioanalyze_omics.nf.walk import walk_nf_files
+
+FASTQC = """\
+process FASTQC {
+    tag "$meta.id"
+    label 'process_medium'
+
+    conda "bioconda::fastqc=0.11.9"
+    container "${ workflow.containerEngine == 'singularity' && !task.ext.singularity_pull_docker_container ?
+        'https://depot.galaxyproject.org/singularity/fastqc:0.11.9--0' :
+        'biocontainers/fastqc:0.11.9--0' }"
+
+    input:
+    tuple val(meta), path(reads)
+
+    output:
+    tuple val(meta), path("*.html"), emit: html
+    path  "versions.yml"           , emit: versions
+
+    when:
+    task.ext.when == null || task.ext.when
+
+    script:
+    def args = task.ext.args ?: ''
+    \"\"\"
+    fastqc $args --threads $task.cpus $reads
+    \"\"\"
+
+    stub:
+    \"\"\"
+    touch ${meta.id}.html
+    \"\"\"
+}
+"""
+
+
+def test_parse_processes():
+    processes = nf.parse_processes(FASTQC, nf_file="modules/fastqc/main.nf")
+
+    assert len(processes) == 1
+    process = processes[0]
+    assert process.name == "FASTQC"
+    assert process.nf_file == "modules/fastqc/main.nf"
+    assert process.container == "biocontainers/fastqc:0.11.9--0"
+    assert process.label == "'process_medium'"
+    assert process.tag == '"$meta.id"'
+    assert process.input == "tuple val(meta), path(reads)"
+    assert process.when == "task.ext.when == null || task.ext.when"
+    assert process.stub.endswith('touch ${meta.id}.html\n    """')
+    assert process.memory is None
+
+
+def test_scan_directives_repeated_tokens():
+    body = "label 'big_mem'\n    label 'long'\n    cpus 4\n    script:\n    'echo'"
+    directives = nf._DIRECTIVE_SCANNER.scan(body)
+
+    assert directives["label"] == ["'big_mem'", "'long'"]
+    assert directives["cpus"] == ["4"]
+    assert directives["script"] == ["'echo'"]
+
+
+def test_parse_processes_warns_without_container():
+    with pytest.warns(UserWarning, match="has no container directive"):
+        processes = nf.parse_processes(
+            "process FOO {\n    cpus 2\n    script:\n    'echo'\n}\n"
+        )
+
+    assert processes[0].container is None
+    assert processes[0].cpus == "2"
+
+
+def _write_module(root, name, contents):
+    module = root / "modules" / name.lower()
+    module.mkdir(parents=True)
+    (module / "main.nf").write_text(contents)
+
+
+def test_workflow_parallel_processes(tmp_path):
+    for name in ("FASTQC", "MULTIQC", "SAMTOOLS"):
+        _write_module(tmp_path, name, FASTQC.replace("FASTQC", name))
+    _write_module(
+        tmp_path, "NOCONTAINER", "process FOO {\n    cpus 2\n    script:\n    ''\n}\n"
+    )
+
+    serial = nf.NextflowWorkflow(str(tmp_path))
+    parallel = nf.NextflowWorkflow(str(tmp_path), workers=2)
+
+    with pytest.warns(UserWarning, match="has no container directive") as record:
+        processes = parallel.processes
+
+    assert len(record) == 1
+    assert [p.name for p in processes] == ["FASTQC", "MULTIQC", "FOO", "SAMTOOLS"]
+    with pytest.warns(UserWarning):
+        assert processes == serial.processes
+
+
+def test_workflow_reparses_only_changed_files(tmp_path):
+    for name in ("FASTQC", "MULTIQC"):
+        _write_module(tmp_path, name, FASTQC.replace("FASTQC", name))
+    (tmp_path / "nextflow.config").write_text("docker.registry = 'quay.io'\n")
+
+    workflow = nf.NextflowWorkflow(str(tmp_path))
+    first = workflow.processes
+    assert workflow.docker_registry == "quay.io"
+    assert workflow.processes[1] is first[1]
+
+    multiqc = tmp_path / "modules" / "multiqc" / "main.nf"
+    multiqc.write_text(FASTQC.replace("FASTQC", "MULTIQC").replace("0.11.9", "1.14"))
+    (tmp_path / "nextflow.config").write_text("docker.registry = 'docker.io'\n")
+
+    second = workflow.processes
+    assert second[0] is first[0]
+    assert second[1].container == "biocontainers/fastqc:1.14--0"
+    assert workflow.docker_registry == "docker.io"
+
+
+def test_workflow_persistent_cache(tmp_path, monkeypatch):
+    project = tmp_path / "project"
+    for name in ("FASTQC", "MULTIQC"):
+        _write_module(project, name, FASTQC.replace("FASTQC", name))
+
+    cache = ParseCache(cache_dir=str(tmp_path / "cache"))
+    expected = nf.NextflowWorkflow(str(project), cache=cache).processes
+
+    parsed = []
+    _parse_records = nf._parse_records
+    monkeypatch.setattr(
+        nf,
+        "_parse_records",
+        lambda c, **kwargs: parsed.append(c) or _parse_records(c, **kwargs),
+    )
+    assert nf.NextflowWorkflow(str(project), cache=cache).processes == expected
+    assert parsed == []
+
+    multiqc = project / "modules" / "multiqc" / "main.nf"
+    multiqc.write_text(FASTQC.replace("FASTQC", "MULTIQC").replace("0.11.9", "1.14"))
+    processes = nf.NextflowWorkflow(str(project), cache=cache).processes
+    assert len(parsed) == 1
+    assert processes[1].container == "biocontainers/fastqc:1.14--0"
+
+
+def test_parse_cache_evicts_least_recently_used(tmp_path):
+    cache = ParseCache(cache_dir=str(tmp_path), max_size=40)
+    cache.put("a", "1", [{"name": "A"}])
+    cache.put("b", "1", [{"name": "B"}])
+    cache.evict()
+    assert cache.get("a", "1") == [{"name": "A"}]
+
+    cache.put("c", "1", [{"name": "C"}])
+    cache.evict()
+    assert cache.get("b", "1") is None
+    assert cache.get("a", "2") is None
+    assert cache.get("c", "1") == [{"name": "C"}]
+
+
+def test_parse_cache_shared_between_processes(tmp_path):
+    first = ParseCache(cache_dir=str(tmp_path), busy_timeout=0.5)
+    second = ParseCache(cache_dir=str(tmp_path), busy_timeout=0.5)
+    # reads and writes of one parse do not lock the cache for the other
+    first.put("a", "1", [{"name": "A"}])
+    assert first.get("a", "1") == [{"name": "A"}]
+    second.put("b", "1", [{"name": "B"}])
+    assert second.get("a", "1") == [{"name": "A"}]
+    first.evict()
+    second.evict()
+    assert first.get("b", "1") == [{"name": "B"}]
+    first.close()
+    second.close()
+
+
+def test_parse_cache_locked_is_a_miss(tmp_path):
+    cache = ParseCache(cache_dir=str(tmp_path), busy_timeout=0.1)
+    cache.put("a", "1", [{"name": "A"}])
+
+    lock = sqlite3.connect(str(tmp_path / "parse_cache.sqlite3"))
+    lock.execute("BEGIN EXCLUSIVE")
+    with pytest.warns(UserWarning, match="parse cache unavailable"):
+        # readers are not blocked in WAL mode, writes give up
+        assert cache.get("a", "1") == [{"name": "A"}]
+        cache.put("b", "1", [{"name": "B"}])
+        cache.evict()
+    lock.rollback()
+    lock.close()
+
+    assert cache.get("b", "1") is None
+    cache.put("b", "1", [{"name": "B"}])
+    assert cache.get("b", "1") == [{"name": "B"}]
+    cache.close()
+
+
+def test_parse_cache_unavailable(tmp_path):
+    (tmp_path / "file").write_text("")
+    (tmp_path / "corrupt").mkdir()
+    (tmp_path / "corrupt" / "parse_cache.sqlite3").write_bytes(b"not sqlite" * 100)
+    _write_module(tmp_path / "project", "FASTQC", FASTQC)
+
+    for cache_dir in ("file", "corrupt"):
+        with pytest.warns(UserWarning, match="parse cache unavailable"):
+            cache = ParseCache(cache_dir=str(tmp_path / cache_dir))
+        workflow = nf.NextflowWorkflow(str(tmp_path / "project"), cache=cache)
+        assert [p.name for p in workflow.processes] == ["FASTQC"]
+        cache.put("a", "1", [{"name": "A"}])
+        assert cache.get("a", "1") is None
+        cache.close()
+
+
+def test_workflow_prunes_unreachable_files(tmp_path):
+    for name in ("FASTQC", "MULTIQC", "UNUSED"):
+        _write_module(tmp_path, name, FASTQC.replace("FASTQC", name))
+    _write_module(tmp_path / "work", "STALE", FASTQC.replace("FASTQC", "STALE"))
+    (tmp_path / "workflows").mkdir()
+    (tmp_path / "workflows" / "qc.nf").write_text(
+        "include { FASTQC } from '../modules/fastqc/main'\n"
+        'include {\n    MULTIQC\n} from "${projectDir}/modules/multiqc/main.nf"\n'
+        "// include { UNUSED } from '../modules/unused/main'\n"
+        "include { validateParameters } from 'plugin/nf-validation'\n"
+    )
+    (tmp_path / "main.nf").write_text(
+        "/*\n include { UNUSED } from './modules/unused/main'\n*/\n"
+        "include { QC } from './workflows/qc'\n"
+        "workflow {\n    QC()\n}\n"
+    )
+
+    workflow = nf.NextflowWorkflow(str(tmp_path))
+    assert [p.name for p in workflow.processes] == ["FASTQC", "MULTIQC"]
+
+    workflow = nf.NextflowWorkflow(str(tmp_path), main=None)
+    assert [p.name for p in workflow.processes] == ["FASTQC", "MULTIQC", "UNUSED"]
+
+
+def test_walk_nf_files_prunes_directories(tmp_path):
+    for directory in ("modules/a", "work/ab/cd", ".nextflow", "tests/modules", "b"):
+        (tmp_path / directory).mkdir(parents=True)
+        (tmp_path / directory / "main.nf").write_text("")
+    (tmp_path / "b" / "main.nf.test").write_text("")
+
+    nf_files = walk_nf_files(str(tmp_path), ignore=["tests"])
+    assert nf_files == [
+        str(tmp_path / "b" / "main.nf"),
+        str(tmp_path / "modules" / "a" / "main.nf"),
+    ]
+
+
+def test_find_process_blocks():
+    contents = (
+        "process A {\n"
+        "    container 'quay.io/a:1'\n"
+        "    script:\n"
+        '    """\n'
+        "    awk '{ print \\$1 }' ${meta.id} | sed 's/}//'\n"
+        '    """\n'
+        "}\n"
+        "// process C { }\n"
+        "process B {\n"
+        "    container \"${ params.x ? 'b:1' : \"b:${task.ext.v ?: '2'}\" }\"\n"
+        "    exec:\n"
+        "    def x = [a: 1] /* } */\n"
+        "}\n"
+        "\n"
+        "workflow {\n"
+        "    A()\n"
+        "    B()\n"
+        "}\n"
+    )
+    blocks = lexer.find_process_blocks(contents)
+
+    assert [(b.name, b.start_line, b.end_line) for b in blocks] == [
+        ("A", 1, 7),
+        ("B", 9, 13),
+    ]
+    assert (
+        blocks[0].body.strip().endswith("\\$1 }' ${meta.id} | sed 's/}//'\n    \"\"\"")
+    )
+    assert "workflow" not in blocks[1].body
+
+    processes = nf.parse_processes(contents)
+    assert [p.span for p in processes] == [(1, 7), (9, 13)]
+
+
+def test_strip_comments_keeps_strings():
+    contents = (
+        "/*\n * header\n */\n"
+        "process A { // trailing } comment\n"
+        "    container 'https://depot.galaxyproject.org/singularity/a:1'\n"
+        '    input: path "${params.input}/*.fastq"\n'
+        "    /* } */ script: 'echo'\n"
+        "}\n"
+    )
+    stripped = lexer.strip_comments(contents)
+
+    assert stripped.count("\n") == contents.count("\n")
+    assert "header" not in stripped and "trailing" not in stripped
+    assert "'https://depot.galaxyproject.org/singularity/a:1'" in stripped
+    assert '"${params.input}/*.fastq"' in stripped
+    assert "    script: 'echo'" in stripped
+
+    process = nf.parse_processes(contents)[0]
+    assert process.span == (4, 8)
+    assert process.container == "https://depot.galaxyproject.org/singularity/a:1"
+
+
+def test_workflow_iter_processes_streams_files(tmp_path, monkeypatch):
+    for name in ("FASTQC", "MULTIQC"):
+        _write_module(tmp_path, name, FASTQC.replace("FASTQC", name))
+
+    opened = []
+    _parse_nf_file = nf._parse_nf_file
+    monkeypatch.setattr(
+        nf,
+        "_parse_nf_file",
+        lambda f, **kwargs: opened.append(f) or _parse_nf_file(f, **kwargs),
+    )
+
+    workflow = nf.NextflowWorkflow(str(tmp_path), memoize=False)
+    processes = workflow.iter_processes()
+    assert next(processes).name == "FASTQC"
+    assert len(opened) == 1
+    assert [p.name for p in processes] == ["MULTIQC"]
+
+    assert workflow.containers == ["biocontainers/fastqc:0.11.9--0"]
+    assert len(opened) == 4
+    assert list(nf.iter_processes(FASTQC)) == nf.parse_processes(FASTQC)
+
+
+def test_process_compact_representation(tmp_path):
+    _write_module(tmp_path, "FASTQC", "// fastqc\n" + FASTQC)
+    process = nf.NextflowWorkflow(str(tmp_path)).processes[0]
+    expected = nf.parse_processes(FASTQC)[0]
+
+    assert not hasattr(process, "__dict__")
+    assert process._body is None
+    assert process.body == expected.body
+    assert process.memory is None and "memory" not in process._directives
+    assert process == expected and hash(process) == hash(expected)
+    assert pickle.loads(pickle.dumps(process)) == process
+
+    process.memory = "6.GB"
+    assert process.memory == "6.GB"
+    with pytest.raises(AttributeError):
+        process.unknown_directive
+
+
+def test_workflow_lazy_directives(tmp_path):
+    _write_module(tmp_path, "FASTQC", FASTQC)
+    workflow = nf.NextflowWorkflow(str(tmp_path), lazy=True)
+    process = workflow.processes[0]
+    expected = nf.parse_processes(FASTQC)[0]
+
+    assert process.container == expected.container
+    assert process._lazy and set(process._directives) == {"container"}
+    assert process.label == expected.label
+    assert not process._lazy
+    assert process._directives == expected._directives
+
+    lazy = nf.parse_processes(FASTQC, lazy=True)[0]
+    lazy.cpus = 4
+    assert lazy.cpus == 4 and lazy.tag == expected.tag
+
+
+def test_workflow_lazy_directives_read_file_once(tmp_path, monkeypatch):
+    contents = "\n".join(FASTQC.replace("FASTQC", name) for name in "ABC")
+    _write_module(tmp_path, "FASTQC", contents)
+    processes = nf.NextflowWorkflow(str(tmp_path), lazy=True).processes
+    bodies = [process.body for process in nf.parse_processes(contents)]
+
+    stripped = []
+    strip_comments = nf.strip_comments
+    monkeypatch.setattr(
+        nf,
+        "strip_comments",
+        lambda contents: stripped.append(1) or strip_comments(contents),
+    )
+    assert [p.label for p in processes] == ["'process_medium'"] * 3
+    assert [p.body for p in processes] == bodies
+    assert len(stripped) == 1
+
+
+def test_workflow_lazy_directives_after_block_comment(tmp_path):
+    _write_module(
+        tmp_path,
+        "BIG",
+        "/* header\n */ process BIG {\n    label 'big'\n    container 'ubuntu:22.04'\n"
+        "    script:\n    ''\n}\n",
+    )
+    lazy = nf.NextflowWorkflow(str(tmp_path), lazy=True).processes[0]
+    eager = nf.NextflowWorkflow(str(tmp_path), lazy=False).processes[0]
+
+    assert eager.label == "'big'"
+    assert lazy.label == eager.label
+    assert lazy.body == eager.body
+
+    # a definition that moved since it was parsed is reported
+    (tmp_path / "modules" / "big" / "main.nf").write_text("// moved away\n")
+    stale = nf.NextflowProcess(
+        from_dict={
+            "name": "BIG",
+            "nf_file": lazy.nf_file,
+            "span": list(lazy.span),
+            "lazy": True,
+        }
+    )
+    with pytest.warns(UserWarning, match="was not found"):
+        assert stale.label is None
+
+
+def test_workflow_find_processes(tmp_path):
+    _write_module(tmp_path, "FASTQC", FASTQC)
+    _write_module(
+        tmp_path,
+        "MULTIQC",
+        FASTQC.replace("FASTQC", "MULTIQC").replace(
+            "label 'process_medium'", "label 'process_single'\n    label 'long'"
+        ),
+    )
+    workflow = nf.NextflowWorkflow(str(tmp_path))
+
+    fastqc = workflow.find_processes(name="NFCORE_RNASEQ:RNASEQ:FASTQC (sample_1)")
+    assert [p.name for p in fastqc] == ["FASTQC"]
+    assert workflow.find_processes(label="long")[0].name == "MULTIQC"
+    assert len(workflow.find_processes(container="biocontainers/fastqc:0.11.9--0")) == 2
+    assert (
+        workflow.find_processes(
+            container="biocontainers/fastqc:0.11.9--0", label="'process_medium'"
+        )
+        == fastqc
+    )
+    assert (
+        workflow.find_processes(
+            nf_file=str(tmp_path / "modules" / "multiqc" / "main.nf")
+        )[0].name
+        == "MULTIQC"
+    )
+    assert workflow.find_processes(name="SAMTOOLS") == []
+    assert len(workflow.find_processes()) == 2
+
+    index = workflow._indexes["name"]
+    assert workflow.find_processes(name="FASTQC") == fastqc
+    assert workflow._indexes["name"] is index
+
+
+def test_normalize_containers():
+    ternary = (
+        "\"${ workflow.containerEngine == 'singularity' ?\n"
+        "    'https://depot.galaxyproject.org/singularity/fastqc:0.11.9--0' :\n"
+        "    'biocontainers/fastqc:0.11.9--0' }\""
+    )
+    images = uri.normalize_containers(
+        [ternary, None, ternary, "'quay.io/biocontainers/multiqc:1.14--pyhdfd78af_0'"]
+    )
+    assert images[0] == uri.ImageURI("", "biocontainers/fastqc", "0.11.9--0", None)
+    assert images[0] is images[2] and images[1] is None
+    assert images[3].registry == "quay.io"
+    assert str(images[3]) == "quay.io/biocontainers/multiqc:1.14--pyhdfd78af_0"
+    assert nf.find_docker_uri(ternary) == "biocontainers/fastqc:0.11.9--0"
+
+    image = uri.parse_image_uri("localhost:5000/ubuntu@sha256:abc")
+    assert image == uri.ImageURI("localhost:5000", "ubuntu", None, "sha256:abc")
+    assert str(image) == "localhost:5000/ubuntu@sha256:abc"
+
+
+def test_container_manifest_registry(tmp_path):
+    _write_module(tmp_path, "FASTQC", FASTQC)
+    _write_module(
+        tmp_path,
+        "MULTIQC",
+        FASTQC.replace("biocontainers/fastqc", "community.wave.seqera.io/multiqc"),
+    )
+    (tmp_path / "nextflow.config").write_text("docker.registry = 'quay.io'\n")
+    workflow = nf.NextflowWorkflow(str(tmp_path))
+
+    assert workflow.get_container_manifest() == [
+        "community.wave.seqera.io/multiqc:0.11.9--0",
+        "quay.io/biocontainers/fastqc:0.11.9--0",
+    ]
+    assert (
+        workflow._get_ecr_image_name(
+            "biocontainers/fastqc:0.11.9--0",
+            namespace_config={"quay.io": {"namespace": "quay"}},
+            docker_registry=workflow.docker_registry,
+        )
+        == "quay/biocontainers/fastqc:0.11.9--0"
+    )
+
+
+def test_workflow_config(tmp_path):
+    (tmp_path / "conf").mkdir()
+    (tmp_path / "nextflow.config").write_text(
+        """\
+params {
+    registry = 'quay.io'
+    custom_config_base = "https://raw.githubusercontent.com/nf-core/configs/master"
+}
+
+includeConfig 'conf/base.config'
+
+try {
+    includeConfig "${params.custom_config_base}/nfcore_custom.config"
+} catch (Exception e) {
+    System.err.println("WARNING: Could not load nf-core/config profiles")
+}
+
+profiles {
+    test { includeConfig 'conf/test.config' }
+}
+
+docker {
+    enabled = true
+    registry = params.registry
+}
+"""
+    )
+    (tmp_path / "conf" / "base.config").write_text(
+        """\
+process {
+    cpus   = { check_max( 1    * task.attempt, 'cpus'   ) }
+    withLabel:process_low {
+        cpus   = 2
+    }
+    withName: '.*:FASTQC' {
+        container = 'biocontainers/fastqc:0.12.1--hdfd78af_0'
+    }
+}
+"""
+    )
+    (tmp_path / "conf" / "test.config").write_text("params.registry = 'docker.io'\n")
+
+    workflow = nf.NextflowWorkflow(str(tmp_path))
+    config = workflow.config
+    assert workflow.docker_registry == "quay.io"
+    assert config.get("docker.enabled") is True
+    assert config.process_settings("FASTQC")["cpus"].startswith("{ check_max")
+    assert config.process_settings("RNASEQ:FASTQC", ["process_low"]) == {
+        "cpus": 2,
+        "container": "biocontainers/fastqc:0.12.1--hdfd78af_0",
+    }
+    assert workflow.config is config
+
+    (tmp_path / "conf" / "base.config").write_text("process.cpus = 4\n")
+    assert workflow.config is not config
+    assert workflow.config.process_settings("FASTQC") == {"cpus": 4}
+
+    workflow = nf.NextflowWorkflow(str(tmp_path), profiles=["test"])
+    assert workflow.docker_registry == "docker.io"
+
+
+def test_config_literals_and_expression_includes(tmp_path, recwarn):
+    (tmp_path / "nextflow.config").write_text(
+        """\
+params.description = '''multi
+line'''
+params.title = \"\"\"RNA-seq\"\"\"
+params.empty = ''
+includeConfig params.custom_config ?: 'conf/none.config'
+includeConfig "${params.custom_config_base}/nfcore_custom.config"
+"""
+    )
+    config = nf.NextflowWorkflow(str(tmp_path)).config
+    assert config.get("params.description") == "multi\nline"
+    assert config.get("params.title") == "RNA-seq"
+    assert config.get("params.empty") == ""
+    # includes of unevaluated expressions are skipped without a warning
+    assert not [warning for warning in recwarn if "includeConfig" in str(warning)]
+
+
+def test_process_resources(tmp_path):
+    (tmp_path / "main.nf").write_text(
+        FASTQC
+        + """
+process STAR_ALIGN {
+    label 'process_high'
+    cpus 4
+    memory '60 GB'
+    time '1d 2h'
+    container 'biocontainers/star:2.7.10a--h9ee0642_0'
+
+    script:
+    "STAR"
+}
+"""
+    )
+    (tmp_path / "nextflow.config").write_text(
+        """\
+params.max_memory = '72.GB'
+process {
+    cpus   = { check_max( 1    * task.attempt, 'cpus'   ) }
+    memory = { check_max( 6.GB * task.attempt, 'memory' ) }
+    withLabel:process_medium {
+        cpus   = { check_max( 6     * task.attempt, 'cpus'    ) }
+        memory = { check_max( 36.GB * task.attempt, 'memory'  ) }
+        time   = { 8.h * task.attempt }
+    }
+    withName: '.*:ALIGN_STAR:STAR_ALIGN' {
+        memory = { check_max( 48.GB * task.attempt, 'memory' ) }
+    }
+    withName: '!.*:(FASTQC|STAR_ALIGN)' {
+        ext.args = '--quiet'
+    }
+}
+"""
+    )
+    pricing = {"omics.r.2xlarge": {"priceDimensions": {"pricePerUnit": {"USD": "0.5"}}}}
+    workflow = nf.NextflowWorkflow(str(tmp_path))
+
+    fastqc, star = workflow.get_process_resources(pricing=pricing)
+    assert (fastqc.cpus, fastqc.memory_gib, fastqc.time_hours) == (6, 36, 8)
+    assert fastqc.instance == "omics.r.2xlarge" and fastqc.max_cost == 4
+    assert (star.cpus, star.memory_gib, star.time_hours) == (4, 48, 26)
+    assert star.instance == "omics.r.2xlarge" and star.max_cost == 13
+    # qualified selectors match simple names on their last segment
+    assert "ext.args" not in workflow.config.process_settings("FASTQC")
+    assert "ext.args" in workflow.config.process_settings("MULTIQC")
+    settings = workflow.config.process_settings("RNASEQ:STAR_ALIGN")
+    assert "48.GB" not in settings["memory"]
+
+    retry = workflow.get_process_resources(attempt=2)
+    assert (retry[0].cpus, retry[0].memory_gib, retry[1].memory_gib) == (12, 72, 72)
+
+    assert sizing.evaluate_resource("'1.5 GB'", "memory") == 1.5
+    assert sizing.evaluate_resource("{ task.ext.mem ?: 2.GB }", "memory") is None
+    assert sizing.find_instance(100, 1) is None
+
+
+def test_process_resources_keep_config_defaults(tmp_path):
+    # the script of FASTQC mentions $task.cpus, which scans as a cpus directive
+    _write_module(tmp_path, "FASTQC", FASTQC)
+    (tmp_path / "nextflow.config").write_text("process {\n    cpus = 4\n}\n")
+    workflow = nf.NextflowWorkflow(str(tmp_path))
+
+    (fastqc,) = workflow.get_process_resources()
+    assert fastqc.cpus == 4
+
+
+def test_diff_workflows(tmp_path):
+    old_path, new_path = tmp_path / "old", tmp_path / "new"
+    for project in (old_path, new_path):
+        _write_module(project, "FASTQC", FASTQC)
+    _write_module(old_path, "MULTIQC", FASTQC.replace("FASTQC", "MULTIQC"))
+    _write_module(old_path, "SAMTOOLS", FASTQC.replace("FASTQC", "SAMTOOLS"))
+    _write_module(
+        new_path,
+        "MULTIQC",
+        FASTQC.replace("FASTQC", "MULTIQC").replace("fastqc:0.11.9", "multiqc:1.14"),
+    )
+    _write_module(
+        new_path,
+        "TRIMGALORE",
+        FASTQC.replace("FASTQC", "TRIMGALORE").replace("fastqc:0.11.9", "trim:0.6.7"),
+    )
+    old = nf.NextflowWorkflow(str(old_path), lazy=True)
+    new = nf.NextflowWorkflow(str(new_path), lazy=True)
+    (old_path / "nextflow.config").write_text("docker.registry = 'quay.io'\n")
+    (new_path / "nextflow.config").write_text("docker.registry = 'quay.io'\n")
+
+    result = diff.diff_workflows(old, new)
+    assert [p.name for p in result.added] == ["TRIMGALORE"]
+    assert [p.name for p in result.removed] == ["SAMTOOLS"]
+    assert [(o.container, n.container) for o, n in result.changed] == [
+        ("biocontainers/fastqc:0.11.9--0", "biocontainers/multiqc:1.14--0")
+    ]
+    assert result.manifest == [
+        "quay.io/biocontainers/multiqc:1.14--0",
+        "quay.io/biocontainers/trim:0.6.7--0",
+    ]
+    assert result.removed_manifest == []
+
+    config = new.get_omics_config(
+        processes=result.added + [n for _, n in result.changed]
+    )
+    assert "withName: 'TRIMGALORE'" in config and "'FASTQC'" not in config
+
+
+def test_export_git_ref(tmp_path):
+    repository = tmp_path / "repository"
+    _write_module(repository, "FASTQC", FASTQC)
+
+    def git(*args):
+        subprocess.run(["git", "-C", str(repository), *args], check=True)
+
+    git("init", "-q")
+    git("add", ".")
+    git("-c", "user.name=t", "-c", "user.email=t@t", "commit", "-qm", "fastqc")
+    git("tag", "1.0.0")
+    (repository / "modules" / "fastqc" / "main.nf").write_text("")
+
+    exported = diff.export_git_ref(str(repository), "1.0.0", str(tmp_path / "old"))
+    assert nf.NextflowWorkflow(exported).processes[0].name == "FASTQC"
+
+
+@pytest.mark.parametrize("snapshot", ["workflow.json", "workflow.json.gz"])
+def test_workflow_snapshot(tmp_path, snapshot):
+    project = tmp_path / "project"
+    _write_module(project, "FASTQC", FASTQC)
+    _write_module(project, "MULTIQC", FASTQC.replace("FASTQC", "MULTIQC"))
+    (project / "nextflow.config").write_text(
+        "docker.registry = 'quay.io'\nprocess.memory = { 6.GB * task.attempt }\n"
+    )
+    workflow = nf.NextflowWorkflow(str(project), lazy=True)
+    workflow.save(str(tmp_path / snapshot))
+
+    # loading never touches the workflow files
+    shutil.rmtree(project)
+    loaded = nf.NextflowWorkflow.load(str(tmp_path / snapshot))
+
+    # loaded workflows carry the same state as constructed ones
+    assert set(vars(loaded)) == set(vars(workflow))
+    assert [p.name for p in loaded.processes] == ["FASTQC", "MULTIQC"]
+    assert loaded.processes[0].label == "'process_medium'"
+    assert loaded.find_processes(label="process_medium") == loaded.processes
+    assert loaded.docker_registry == "quay.io"
+    assert loaded.get_container_manifest() == ["quay.io/biocontainers/fastqc:0.11.9--0"]
+    assert loaded.get_process_resources()[0].memory_gib == 6
+
+    with open(tmp_path / "old.json", "w") as file:
+        json.dump({"version": "0"}, file)
+    with pytest.raises(ValueError):
+        nf.NextflowWorkflow.load(str(tmp_path / "old.json"))
+
+
+def test_workflow_snapshot_without_checkout(tmp_path):
+    project = tmp_path / "project"
+    _write_module(project, "FASTQC", FASTQC)
+    nf.NextflowWorkflow(str(project)).save(str(tmp_path / "workflow.json"))
+
+    shutil.rmtree(project)
+    loaded = nf.NextflowWorkflow.load(str(tmp_path / "workflow.json"))
+
+    process = loaded.processes[0]
+    assert process.body is None
+    assert process.label == "'process_medium'"
+    assert loaded.config is None
+    assert loaded.docker_registry is None
+    assert loaded.get_container_manifest() == ["biocontainers/fastqc:0.11.9--0"]
+
+
+def test_workflow_catalog(tmp_path, monkeypatch):
+    rnaseq, sarek = tmp_path / "rnaseq", tmp_path / "sarek"
+    for project in (rnaseq, sarek):
+        _write_module(project, "FASTQC", FASTQC)
+        (project / "nextflow.config").write_text("docker.registry = 'quay.io'\n")
+    _write_module(
+        sarek,
+        "GATK4",
+        FASTQC.replace("FASTQC", "GATK4").replace("fastqc:0.11.9", "gatk4:4.4.0.0"),
+    )
+
+    parsed = []
+    parse_nf_file = nf._parse_nf_file
+
+    def _parse_nf_file(nf_file, **kwargs):
+        parsed.append(nf_file)
+        return parse_nf_file(nf_file, **kwargs)
+
+    hashed = []
+    sha256 = hashlib.sha256
+
+    def _sha256(*args):
+        hashed.append(args)
+        return sha256(*args)
+
+    monkeypatch.setattr(nf, "_parse_nf_file", _parse_nf_file)
+    monkeypatch.setattr(hashlib, "sha256", _sha256)
+    catalog = WorkflowCatalog([str(rnaseq), str(sarek)])
+
+    assert catalog.get_container_manifest() == [
+        "quay.io/biocontainers/fastqc:0.11.9--0",
+        "quay.io/biocontainers/gatk4:4.4.0.0--0",
+    ]
+    assert catalog.stats == {"files": 3, "distinct": 2, "parsed": 2}
+    assert len(parsed) == 2
+    # the digests of the catalog are reused by its workflows
+    assert len(hashed) == 3
+
+    configs = catalog.get_omics_configs()
+    assert "GATK4" not in configs[str(rnaseq)] and "GATK4" in configs[str(sarek)]
+    assert WorkflowCatalog.config_name(str(sarek) + "/") == "sarek.omics.config"
+    assert len(parsed) == 2
+
+
+def test_workflow_catalog_config_names(tmp_path):
+    projects = [tmp_path / "v1" / "rnaseq", tmp_path / "v2" / "rnaseq"]
+    projects.append(tmp_path / "sarek")
+    for project in projects:
+        _write_module(project, "FASTQC", FASTQC)
+        (project / "nextflow.config").write_text("docker.registry = 'quay.io'\n")
+    catalog = WorkflowCatalog([str(project) for project in projects])
+
+    config_files = catalog.write_omics_configs(str(tmp_path / "configs"))
+    names = [path.name for path in (tmp_path / "configs").iterdir()]
+    # workflows sharing a directory name do not overwrite each other
+    assert len(set(config_files)) == len(names) == 3
+    assert "sarek.omics.config" in names
+    assert catalog.config_names[str(projects[0])].startswith("rnaseq-")
+
+
+def test_write_omics_config(tmp_path, monkeypatch):
+    _write_module(tmp_path, "FASTQC", FASTQC)
+    _write_module(tmp_path, "FASTQC_COPY", FASTQC)
+    (tmp_path / "nextflow.config").write_text("docker.registry = 'quay.io'\n")
+    workflow = nf.NextflowWorkflow(str(tmp_path))
+    assert workflow.docker_registry == "quay.io"
+
+    checks = []
+    is_current = NextflowConfig.is_current
+    monkeypatch.setattr(
+        NextflowConfig, "is_current", lambda self: checks.append(1) or is_current(self)
+    )
+
+    class Session:
+        profile_name = "default"
+        region_name = "us-east-1"
+        calls = 0
+
+        def client(self, name):
+            Session.calls += 1
+            return self
+
+        def describe_registry(self):
+            return {"registryId": "123456789012"}
+
+    session = Session()
+    with open(tmp_path / "omics.config", "w") as file:
+        assert workflow.write_omics_config(file, session=session) == 1
+    # the config files are checked once per rendering, not once per process
+    assert len(checks) == 1
+
+    config = (tmp_path / "omics.config").read_text()
+    assert config.count("withName: 'FASTQC'") == 1
+    assert "ecr_registry = '123456789012.dkr.ecr.us-east-1.amazonaws.com'" in config
+    assert workflow.get_omics_config(session=session) == config
+    assert Session.calls == 1
+
+    # another session of the same profile may use other credentials
+    workflow.get_omics_config(session=Session())
+    assert Session.calls == 2
+    del session
+    gc.collect()
+    assert len(nf._ECR_REGISTRIES) == 0
@@ -0,0 +1,271 @@
+#!/usr/bin/env python
+
+"""Tests for `bioanalyze_omics.resources.registry` module."""
+
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import requests
+from bioanalyze_omics.resources import registry
+from bioanalyze_omics.resources.registry import (
+    EcrDestination,
+    RegistryDestination,
+    copy_image,
+    sha256_digest,
+)
+from tests.fakes import MANIFEST_TYPE, FakeEcr, add_image
+
+INDEX_TYPE = "application/vnd.oci.image.index.v1+json"
+
+
+def test_split_reference():
+    assert registry.split_reference("ubuntu") == (
+        "registry-1.docker.io",
+        "library/ubuntu",
+        "latest",
+    )
+    assert registry.split_reference("biocontainers/fastqc:0.11.9--0") == (
+        "registry-1.docker.io",
+        "biocontainers/fastqc",
+        "0.11.9--0",
+    )
+    assert registry.split_reference(
+        "quay.io/biocontainers/multiqc:1.14--pyhdfd78af_0@sha256:abc"
+    ) == ("quay.io", "biocontainers/multiqc", "sha256:abc")
+
+
+def test_rechunk():
+    chunks = [b"ab", b"cdefg", b"", b"hij"]
+    assert list(registry.rechunk(chunks, 4)) == [b"abcd", b"efgh", b"ij"]
+    assert list(registry.rechunk([], 4)) == []
+
+
+def test_copy_image(registries):
+    source, destination = registries(token=True), registries()
+    digest = add_image(
+        source, "biocontainers/fastqc", "0.11.9--0", [b"base" * 1000, b"fastqc"]
+    )
+    add_image(source, "biocontainers/multiqc", "1.14", [b"base" * 1000, b"multiqc"])
+
+    copy = copy_image(
+        source.client(),
+        "biocontainers/fastqc",
+        "0.11.9--0",
+        RegistryDestination(destination.client()),
+        "fastqc",
+        "0.11.9--0",
+    )
+    assert copy.digest == digest
+    assert (copy.blobs, copy.copied, copy.bytes_skipped) == (3, 3, 0)
+    # manifests are copied unchanged
+    assert destination.manifests[("fastqc", "0.11.9--0")][0] == (
+        source.manifests[("biocontainers/fastqc", "0.11.9--0")][0]
+    )
+
+    # copying again only puts the manifest
+    destination.requests.clear()
+    copy = copy_image(
+        source.client(),
+        "biocontainers/fastqc",
+        "0.11.9--0",
+        RegistryDestination(destination.client()),
+        "fastqc",
+        "0.11.9--0",
+    )
+    assert (copy.copied, copy.bytes_copied) == (0, 0)
+    assert not [request for request in destination.requests if "uploads" in request[1]]
+
+
+def test_copy_image_index(registries):
+    source, destination = registries(), registries()
+    platforms = []
+    for architecture in ("amd64", "arm64"):
+        digest = add_image(
+            source, "library/busybox", architecture, [architecture.encode()]
+        )
+        content = source.manifests[("library/busybox", digest)][0]
+        platforms.append(
+            {
+                "mediaType": MANIFEST_TYPE,
+                "digest": digest,
+                "size": len(content),
+                "platform": {"os": "linux", "architecture": architecture},
+            }
+        )
+    index_digest = source.add_manifest(
+        "library/busybox",
+        "latest",
+        {"schemaVersion": 2, "mediaType": INDEX_TYPE, "manifests": platforms},
+        INDEX_TYPE,
+    )
+
+    copy = copy_image(
+        source.client(),
+        "library/busybox",
+        "latest",
+        RegistryDestination(destination.client()),
+        "busybox",
+        "latest",
+    )
+    assert copy.digest == index_digest
+    assert copy.copied == 4
+    assert ("busybox", index_digest) in destination.manifests
+    for platform in platforms:
+        assert ("busybox", platform["digest"]) in destination.manifests
+    assert destination.client().get_digest("busybox", "latest") == (index_digest)
+
+
+def _uploads(fake) -> int:
+    return len([request for request in fake.requests if request[0] == "PATCH"])
+
+
+def test_copy_images_mounts_shared_layers(registries):
+    source, destination = registries(), registries()
+    base = b"base" * 1000
+    for name in ("fastqc", "multiqc", "samtools"):
+        add_image(source, f"biocontainers/{name}", "1", [base, name.encode()])
+
+    index = registry.LayerIndex()
+    copies = [
+        copy_image(
+            source.client(),
+            f"biocontainers/{name}",
+            "1",
+            RegistryDestination(destination.client()),
+            name,
+            "1",
+            index=index,
+        )
+        for name in ("fastqc", "multiqc", "samtools")
+    ]
+    # the base layer is uploaded once and mounted into the other repositories
+    assert _uploads(destination) == 7
+    assert [copy.bytes_mounted for copy in copies] == [0, len(base), len(base)]
+    for name in ("fastqc", "multiqc", "samtools"):
+        assert (name, sha256_digest(base)) in destination.blobs
+
+
+def test_copy_images_concurrently_uploads_layers_once(registries):
+    source, destination = registries(), registries()
+    base = b"base" * 100000
+    names = [f"tool{number}" for number in range(8)]
+    for name in names:
+        add_image(source, f"biocontainers/{name}", "1", [base, name.encode()])
+
+    index = registry.LayerIndex()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        copies = list(
+            pool.map(
+                lambda name: copy_image(
+                    source.client(),
+                    f"biocontainers/{name}",
+                    "1",
+                    RegistryDestination(destination.client()),
+                    name,
+                    "1",
+                    index=index,
+                ),
+                names,
+            )
+        )
+    # the base layer once, and the config and tool layer of each image
+    assert _uploads(destination) == 1 + 2 * len(names)
+    assert sum(copy.bytes_mounted for copy in copies) == len(base) * (len(names) - 1)
+
+
+def test_layer_index_retries_failed_uploads():
+    index = registry.LayerIndex()
+    assert index.acquire("sha256:a") is None
+    index.release("sha256:a")
+    assert index.acquire("sha256:a") is None
+    index.release("sha256:a", "fastqc")
+    assert index.acquire("sha256:a") == "fastqc"
+
+
+def test_upload_blob_does_not_resend_streams(registries):
+    destination = registries(token=True)
+    upload = RegistryDestination(destination.client())
+    blob = {"digest": sha256_digest(b"layer" * 1000)}
+
+    # the token expires while the blob is streamed
+    destination.expire = "PATCH"
+    with pytest.raises(requests.HTTPError):
+        upload.upload_blob("fastqc", blob, iter([b"layer"] * 1000))
+    assert _uploads(destination) == 1
+
+    upload.upload_blob("fastqc", blob, iter([b"layer"] * 1000))
+    assert destination.blobs[("fastqc", blob["digest"])] == b"layer" * 1000
+
+
+def test_iter_blob_checks_digest(registries):
+    source = registries()
+    blob = source.add_blob("fastqc", b"layer")
+    source.blobs[("fastqc", blob["digest"])] = b"tampered"
+    with pytest.raises(ValueError):
+        list(source.client().iter_blob("fastqc", blob["digest"]))
+
+
+def test_copy_image_to_ecr(registries):
+    source, ecr = registries(), FakeEcr(part_size=1000)
+    base = b"base" * 1000
+    digest = add_image(source, "biocontainers/fastqc", "1", [base, b"fastqc"])
+
+    copy = copy_image(
+        source.client(), "biocontainers/fastqc", "1", EcrDestination(ecr), "fastqc", "1"
+    )
+    assert (copy.digest, copy.copied, copy.bytes_skipped) == (digest, 3, 0)
+    # layers are uploaded in parts of the size ECR asks for
+    sizes = [call[1]["size"] for call in ecr.calls if call[0] == "upload_layer_part"]
+    assert sizes.count(1000) == 4 and len(sizes) == 6
+    assert ecr.count("complete_layer_upload") == 3
+    assert ecr.layers[("fastqc", sha256_digest(base))] == base
+    assert ecr.images[("fastqc", "1")]["imageId"]["imageDigest"] == digest
+
+    # copying again only puts the manifest, which ECR already holds
+    ecr.calls.clear()
+    copy = copy_image(
+        source.client(), "biocontainers/fastqc", "1", EcrDestination(ecr), "fastqc", "1"
+    )
+    assert copy.copied == 0
+    assert copy.bytes_skipped == sum(len(blob) for blob in ecr.layers.values())
+    assert [call[0] for call in ecr.calls] == [
+        "batch_check_layer_availability",
+        "put_image",
+    ]
+
+
+def test_ecr_destination_layer_already_exists(registries):
+    source, ecr = registries(), FakeEcr()
+    add_image(source, "biocontainers/fastqc", "1", [b"fastqc"])
+    copy_image(
+        source.client(), "biocontainers/fastqc", "1", EcrDestination(ecr), "fastqc", "1"
+    )
+
+    class RacingEcr(FakeEcr):
+        # the layers are completed by another upload after they were checked
+        def batch_check_layer_availability(self, repositoryName, layerDigests):
+            return super().batch_check_layer_availability("other", layerDigests)
+
+    racing = RacingEcr()
+    racing.layers, racing.images = ecr.layers, ecr.images
+    copy = copy_image(
+        source.client(),
+        "biocontainers/fastqc",
+        "1",
+        EcrDestination(racing),
+        "fastqc",
+        "2",
+    )
+    assert copy.copied == 2
+    assert racing.count("complete_layer_upload") == 2
+    assert ("fastqc", "2") in racing.images
+
+
+def test_ecr_destination_missing_blobs():
+    ecr = FakeEcr()
+    digests = [sha256_digest(str(number).encode()) for number in range(150)]
+    for digest in digests[:50]:
+        ecr.layers[("fastqc", digest)] = b""
+    assert EcrDestination(ecr).missing_blobs("fastqc", digests) == set(digests[50:])
+    # at most 100 digests are checked at once
+    assert ecr.count("batch_check_layer_availability") == 2